@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_api.settings')
 
 application = get_asgi_application()
+
+# Load the ML models in the background so the first requests don't pay for it
+from power_monitor.services.model_registry import warm_up_on_startup
+warm_up_on_startup()
@@ -198,3 +198,91 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Machine learning settings
+# Maximum number of memoized classifications kept by the anomaly classifier
+ML_CLASSIFICATION_MEMO_SIZE = 50000
+
+# Random forest inference engine: 'sklearn', 'compiled' (pure NumPy) or 'auto'
+ML_INFERENCE_ENGINE = 'auto'
+# Largest batch the 'auto' engine sends to the compiled forest. The compiled
+# forest only wins on small batches (per-call overhead); it is slower than
+# scikit-learn above a few hundred rows, so keep this low
+ML_COMPILED_MAX_BATCH = 128
+
+# Load the classifier and SHAP explainer in a background thread when a server starts
+ML_WARMUP_ON_STARTUP = True
+# Retry-After (seconds) sent with 503 responses while the models are loading
+ML_RETRY_AFTER_SECONDS = 5
+
+# Seconds between checks of the model file for a new version (0 disables the watcher).
+# New versions are loaded in the background and swapped in without a restart.
+ML_MODEL_WATCH_INTERVAL = 30
+
+# Worker processes for large classification and SHAP jobs (0 disables, -1 uses every core)
+ML_PROCESS_POOL_WORKERS = 0
+# Smallest batch (rows) sent to the process pool for classification and for SHAP
+ML_PROCESS_POOL_MIN_ROWS = 50000
+ML_PROCESS_POOL_MIN_SHAP_ROWS = 1000
+
+# Micro-batching of concurrent classification requests: longest wait (ms, 0 disables)
+# for more work to join a batch, and the largest batch (rows) sent to the model at once.
+# The wait only applies while several requests are queued; a lone request runs at once
+ML_MICRO_BATCH_WAIT_MS = 5
+ML_MICRO_BATCH_MAX_ROWS = 2048
+
+# Maximum number of SHAP explanations kept by the explainer (keyed by model version and features)
+ML_EXPLANATION_CACHE_SIZE = 10000
+
+# Maximum number of readings per batch explanation request
+ML_EXPLAIN_BATCH_MAX = 200
+
+# Maximum number of global feature importance results kept by the explainer
+ML_IMPORTANCE_CACHE_SIZE = 64
+
+# Worker threads for background analytics jobs (global importance, bulk explain/classify)
+# and seconds a finished job and its result stay available for polling
+ML_JOB_WORKERS = 2
+ML_JOB_RESULT_TTL = 3600
+
+# SHAP mode of click-to-explain requests: 'exact' (TreeSHAP, always used for reports and
+# global importance) or, opt-in, 'approximate' (Saabas path attribution, ~100x faster but
+# it only agreed with TreeSHAP on the top-3 features for ~30% of rows and on the sign of
+# ~85-88% of attributions on this model, see /api/ml/explain-modes/compare/), and an optional
+# limit on the number of trees explained (None explains the whole forest)
+ML_INTERACTIVE_EXPLAIN_MODE = 'exact'
+ML_INTERACTIVE_EXPLAIN_MAX_TREES = None
+
+# Explain newly detected anomalies in the background (in ML_INTERACTIVE_EXPLAIN_MODE) so
+# explain-anomaly can answer from the explanation cache. The worker uses at most
+# ML_PRECOMPUTE_CPU_BUDGET of one core, explains ML_PRECOMPUTE_BATCH_SIZE readings at a time
+# and keeps at most ML_PRECOMPUTE_MAX_QUEUE pending readings (newest day, most severe first).
+# Off by default, enable it with the ML_PRECOMPUTE_EXPLANATIONS=true environment variable
+ML_PRECOMPUTE_EXPLANATIONS = os.environ.get('ML_PRECOMPUTE_EXPLANATIONS', 'false').lower() == 'true'
+ML_PRECOMPUTE_CPU_BUDGET = 0.25
+ML_PRECOMPUTE_BATCH_SIZE = 16
+ML_PRECOMPUTE_MAX_QUEUE = 10000
+
+# Rows per block when summing |SHAP| values for global feature importance. Blocks are the
+# unit of work for the process pool and are added in row order, so results do not depend
+# on the number of workers
+ML_SHAP_CHUNK_ROWS = 256
+
+# Default point budget of dashboard charts. Larger ranges are downsampled into time
+# buckets (mean/min/max/last per bucket) or with LTTB; anomalies are always kept
+CHART_MAX_POINTS = 4000
+
+# Materialized minute/hour/day rollups per node-day. Closed days are written to ROLLUP_DIR
+# (default: <BASE_DIR>/rollups) from a fresh fetch and rebuilt when later readings show
+# data they lack; dashboard ranges longer than
+# DASHBOARD_ROLLUP_MIN_DAYS days are answered from them unless source=raw is requested.
+# ROLLUP_MEMORY_DAYS node-days are kept in memory
+ROLLUP_DIR = None
+ROLLUP_MEMORY_DAYS = 400
+DASHBOARD_ROLLUP_MIN_DAYS = 7
+
+# Dashboard statistics keep the raw values for exact percentiles up to this many
+# readings; larger ranges use mergeable histogram sketches (within one grid step inside
+# the sketch grid; percentiles beyond it are computed exactly from the raw values)
+STATS_EXACT_MAX_READINGS = 100000
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_api.settings')
 
 application = get_wsgi_application()
+
+# Load the ML models in the background so the first requests don't pay for it
+from power_monitor.services.model_registry import warm_up_on_startup
+warm_up_on_startup()
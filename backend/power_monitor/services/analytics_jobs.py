@@ -0,0 +1,128 @@
+from .classification_store import ClassificationStore
+from .importance_service import FeatureImportanceService
+from .job_service import JobQueue
+from .model_registry import ModelRegistry
+from .reading_resolver import ReadingResolver
+
+# Seconds a job waits for the models to finish loading
+MODEL_WAIT_SEC = 300
+
+# Readings handled between two progress reports
+CHUNK_SIZE = 100
+
+
+def resolve_readings(params, resolver=None):
+    """Get uploaded readings or resolve reading_ids / node + date range references."""
+    if params.get('readings'):
+        return params['readings'], []
+    if not ReadingResolver.has_reference(params):
+        raise ValueError("No readings provided")
+    return (resolver or ReadingResolver()).resolve(params)
+
+
+def explanation_entries(explainer, readings, progress=None, mode='exact', max_trees=None):
+    """Explain the anomalies among readings; one entry per reading in request order.
+
+    Non-anomalous readings and readings without usable features get an error entry.
+    """
+    anomalies = [r for r in readings if r.get('is_anomaly', False)]
+    results = []
+    for start in range(0, len(anomalies), CHUNK_SIZE):
+        results.extend(explainer.explain_batch(anomalies[start:start + CHUNK_SIZE], mode=mode, max_trees=max_trees))
+        if progress:
+            progress(len(results), len(anomalies), f"Explained {len(results)} of {len(anomalies)} anomalies")
+
+    results = iter(results)
+    entries = []
+    for reading in readings:
+        entry = {"id": reading.get('id')}
+        if not reading.get('is_anomaly', False):
+            entry["error"] = "The provided reading is not an anomaly"
+        else:
+            explanation = next(results)
+            if explanation is None:
+                entry["error"] = "Reading is missing required features"
+            else:
+                entry.update(explanation)
+        entries.append(entry)
+    return entries
+
+
+def global_importance_job(job, params):
+    """Global feature importance from node-day aggregates or a sample of readings."""
+    explainer = ModelRegistry().get_explainer(timeout=MODEL_WAIT_SEC)
+
+    if not params.get('readings') and not params.get('reading_ids') and (params.get('node') or params.get('nodes')):
+        nodes = params.get('nodes') or [params.get('node')]
+        resolver = ReadingResolver()
+        result = FeatureImportanceService(resolver).get_importance(
+            nodes, params.get('start_date'), params.get('end_date'), explainer, progress=job.set_progress
+        )
+        if result is None:
+            raise ValueError("No anomalies found for the selected nodes and dates")
+        return result
+
+    job.set_progress(0, 1, "Resolving readings")
+    readings, _ = resolve_readings(params)
+    # GlobalFeatureImportanceView validated sample_size and seed before queueing the job
+    sample_size = int(params.get('sample_size') or 500)
+    job.set_progress(0, 1, f"Computing SHAP values for up to {sample_size} readings")
+    result = explainer.generate_global_feature_importance(
+        readings, sample_size=sample_size, seed=int(params.get('seed') or 0)
+    )
+    if not result:
+        raise ValueError("Could not generate feature importance")
+    return result
+
+
+def explain_job(job, params):
+    """SHAP explanations for many readings, without the interactive batch limit."""
+    explainer = ModelRegistry().get_explainer(timeout=MODEL_WAIT_SEC)
+    job.set_progress(0, 1, "Resolving readings")
+    readings, missing_ids = resolve_readings(params)
+    return {
+        "explanations": explanation_entries(
+            explainer, readings, progress=job.set_progress,
+            mode=params.get('mode', 'exact'), max_trees=params.get('max_trees')
+        ),
+        "model_version": explainer.classifier.model_version,
+        "missing_ids": missing_ids
+    }
+
+
+def classify_job(job, params):
+    """Bulk classification of uploaded or referenced readings.
+
+    Like ClassifyReadingsView, only readings resolved server-side use the
+    shared classification store; uploaded readings may be stale or edited
+    and are classified without reading or recording stored labels.
+    """
+    classifier = ModelRegistry().get_classifier(timeout=MODEL_WAIT_SEC)
+    job.set_progress(0, 1, "Resolving readings")
+    readings, missing_ids = resolve_readings(params)
+
+    anomalies = [r for r in readings if r.get('is_anomaly', False)]
+    uploaded = bool(params.get('readings'))
+    store = ClassificationStore()
+    for start in range(0, len(anomalies), CHUNK_SIZE * 10):
+        chunk = anomalies[start:start + CHUNK_SIZE * 10]
+        if uploaded:
+            classifier.classify_batch(chunk)
+        else:
+            store.apply(chunk, classifier=classifier)
+        job.set_progress(min(start + CHUNK_SIZE * 10, len(anomalies)), len(anomalies), "Classifying anomalies")
+
+    return {
+        "classifications": {r['id']: r['anomaly_type'] for r in anomalies if 'id' in r},
+        "model_version": classifier.model_version,
+        "missing_ids": missing_ids
+    }
+
+
+def register_jobs(queue=None):
+    """Register the analytics job kinds with the job queue."""
+    queue = queue or JobQueue()
+    queue.register('global_importance', global_importance_job)
+    queue.register('explain', explain_job)
+    queue.register('classify', classify_job)
+    return queue
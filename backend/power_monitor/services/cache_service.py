@@ -19,13 +19,20 @@ class CacheService:
         self._cache_ttl = {}
         self._default_ttl = 3600  # Default TTL: 1 hour (in seconds)
     
-    def get_cache_key(self, node, year, month, day):
-        """Generate consistent cache key."""
-        return f"{node}_{year}_{month}_{day}"
+    def get_cache_key(self, node, year, month, day, namespace=None):
+        """Generate consistent cache key.
+        
+        A namespace keeps derived per node-day data (events, statistics, ...)
+        next to the raw readings without colliding with them.
+        """
+        key = f"{node}_{year}_{month}_{day}"
+        if namespace:
+            key = f"{key}_{namespace}"
+        return key
     
-    def get(self, node, year, month, day):
+    def get(self, node, year, month, day, namespace=None):
         """Get data from cache if it exists and hasn't expired."""
-        key = self.get_cache_key(node, year, month, day)
+        key = self.get_cache_key(node, year, month, day, namespace)
         
         # Check if key exists in cache
         if key in self._cache:
@@ -44,9 +51,9 @@ class CacheService:
         print(f"Cache miss for {key}")
         return None
     
-    def set(self, node, year, month, day, data, ttl=None):
+    def set(self, node, year, month, day, data, ttl=None, namespace=None):
         """Store data in cache with expiration time."""
-        key = self.get_cache_key(node, year, month, day)
+        key = self.get_cache_key(node, year, month, day, namespace)
         
         # Store the data
         self._cache[key] = data
@@ -77,6 +84,16 @@ class CacheService:
         
         return True
     
+    def clear_namespace(self, namespace):
+        """Clear one kind of derived data (e.g. 'events') for every node-day."""
+        suffix = f"_{namespace}"
+        keys_to_remove = [k for k in self._cache.keys() if k.endswith(suffix)]
+        for key in keys_to_remove:
+            self._cache.pop(key, None)
+            self._cache_ttl.pop(key, None)
+        print(f"Cleared {len(keys_to_remove)} cached '{namespace}' entries")
+        return True
+    
     def get_cached_nodes(self):
         """Get a list of nodes that have cached data."""
         # Extract unique node IDs from cache keys
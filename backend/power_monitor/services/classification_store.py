@@ -0,0 +1,158 @@
+import threading
+
+from .cache_service import CacheService
+from .document_store import DocumentStore
+
+def reading_day(reading_id):
+    """Split a Firebase reading id 'node-YYYY-MM-DD-time' into (node, year, month, day)."""
+    parts = str(reading_id).rsplit('-', 4)
+    if len(parts) != 5:
+        return None
+    return tuple(parts[:4])
+
+
+class ClassificationStore:
+    """Stores anomaly_type labels per node-day, keyed by reading id and model version.
+
+    Labels live next to the cached readings in CacheService (namespace
+    'classifications@<model version>') and are persisted to MongoDB, so a
+    reading is sent to the classifier once per model version rather than on
+    every page view. MongoDB is optional: while it is unavailable lookups are
+    not cached as misses and new labels are only kept in memory for
+    unavailable_ttl seconds.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls):
+        """Ensures only one instance of ClassificationStore exists."""
+        if cls._instance is None:
+            cls._instance = super(ClassificationStore, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        """Initialize the store."""
+        self._lock = threading.Lock()
+        self._documents = DocumentStore('anomaly_classifications')
+        self._stats = {'known': 0, 'classified': 0}
+        # Seconds labels recorded while MongoDB is unavailable stay cached before MongoDB is asked again
+        self.unavailable_ttl = 60
+
+    def _namespace(self, model_version):
+        return f"classifications@{model_version}"
+
+    def _document_id(self, node, year, month, day, model_version):
+        return f"{node}_{year}_{month}_{day}@{model_version}"
+
+    def get_day(self, node, year, month, day, model_version):
+        """Get the {reading id: anomaly_type} labels stored for one node-day."""
+        cache = CacheService()
+        namespace = self._namespace(model_version)
+        labels = cache.get(node, year, month, day, namespace=namespace)
+        if labels is not None:
+            return labels
+
+        document = self._documents.find(self._document_id(node, year, month, day, model_version))
+        if document is None and not self._documents.available():
+            # Not a real miss: MongoDB may hold labels once it is reachable again
+            return {}
+        labels = document.get('classifications', {}) if document else {}
+
+        cache.set(node, year, month, day, labels, namespace=namespace)
+        return labels
+
+    def record_day(self, node, year, month, day, model_version, labels):
+        """Add new {reading id: anomaly_type} labels for one node-day."""
+        if not labels:
+            return
+
+        cache = CacheService()
+        namespace = self._namespace(model_version)
+        with self._lock:
+            stored = self.get_day(node, year, month, day, model_version)
+            stored.update(labels)
+            if cache.get(node, year, month, day, namespace=namespace) is None:
+                # MongoDB was unavailable, keep the new labels only until it is asked again
+                cache.set(node, year, month, day, stored, ttl=self.unavailable_ttl, namespace=namespace)
+
+        # MongoDB field names cannot contain dots or start with '$'
+        fields = {
+            f"classifications.{reading_id}": label
+            for reading_id, label in labels.items()
+            if '.' not in reading_id and not reading_id.startswith('$')
+        }
+        self._documents.update(
+            self._document_id(node, year, month, day, model_version),
+            fields,
+            {'node': node, 'year': year, 'month': month, 'day': day, 'model_version': model_version}
+        )
+
+    def apply(self, readings, model_version=None, classifier=None):
+        """Set anomaly_type on readings from stored labels, classifying only unseen anomalies.
+
+        Readings are grouped by the node-day in their id. Anomalies without a
+        stored label for the model version are classified with classifier and
+        recorded; without a classifier they stay 'Unclassified'. Readings
+        without a parseable id bypass the store.
+
+        Args:
+            readings: Reading dicts with is_anomaly set
+            model_version: Version to look labels up for (defaults to the classifier's)
+            classifier: Optional MLAnomalyClassifier for unseen anomalies
+
+        Returns:
+            Number of readings that had to be sent to the classifier
+        """
+        if classifier is not None:
+            model_version = classifier.model_version
+
+        unseen = []
+        days = {}
+        for reading in readings:
+            if not reading.get('is_anomaly', False):
+                reading['anomaly_type'] = 'Normal'
+                continue
+            reading['anomaly_type'] = 'Unclassified'
+            key = reading_day(reading.get('id', '')) if model_version is not None else None
+            if key is None:
+                unseen.append(reading)
+            else:
+                days.setdefault(key, []).append(reading)
+
+        known = 0
+        for key, day_readings in days.items():
+            labels = self.get_day(*key, model_version)
+            for reading in day_readings:
+                label = labels.get(reading['id'])
+                if label is None:
+                    unseen.append(reading)
+                else:
+                    reading['anomaly_type'] = label
+                    known += 1
+        self._stats['known'] += known
+
+        if classifier is None or not unseen:
+            return 0
+
+        classifier.classify_batch(unseen)
+        self._stats['classified'] += len(unseen)
+        self.record(unseen, model_version)
+
+        return len(unseen)
+
+    def record(self, readings, model_version):
+        """Store the anomaly_type of classified anomalies, grouped by the node-day in their id."""
+        new_labels = {}
+        for reading in readings:
+            key = reading_day(reading.get('id', ''))
+            if key is not None and reading.get('is_anomaly', False) and reading.get('anomaly_type') not in (None, 'Unknown', 'Unclassified'):
+                new_labels.setdefault(key, {})[reading['id']] = reading['anomaly_type']
+        for key, labels in new_labels.items():
+            self.record_day(*key, model_version, labels)
+
+    def get_stats(self):
+        """Get how many anomalies were answered from the store versus the classifier."""
+        stats = dict(self._stats)
+        total = stats['known'] + stats['classified']
+        stats['hit_rate'] = round(stats['known'] / total, 4) if total else 0.0
+        return stats
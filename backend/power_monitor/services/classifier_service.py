@@ -1,22 +1,38 @@
 from joblib import load
 from django.conf import settings
+import hashlib
 import os
 import numpy as np
-import pandas as pd
 import logging
+from .feature_service import FeaturePipeline, MODEL_FEATURES
+from .forest_engine import CompiledForest, compiled_forest_path
+from .inference_pool import InferencePool
+from .lru_cache import LRUCache
+from .micro_batcher import MicroBatcher
 
-# Configure logging
-logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+def default_model_path():
+    """Path of the deployed random forest model."""
+    return os.path.join(settings.BASE_DIR, 'ml_model', 'random_forest_model.joblib')
+
+def model_file_version(model_path):
+    """Identify a model file by its name and content, e.g. 'random_forest_model@3f2a9c1b4d5e'."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return f"{name}@{digest.hexdigest()[:12]}"
+
 class MLAnomalyClassifier:
     """Service for classifying power anomalies using the trained Random Forest model."""
     
-    def __init__(self):
-        """Load the trained model."""
+    def __init__(self, model_path=None):
+        """Load the trained model (the deployed one unless model_path is given)."""
         try:
             # Path to the trained model
-            model_path = os.path.join(settings.BASE_DIR, 'ml_model', 'random_forest_model.joblib')
+            model_path = model_path or default_model_path()
             
             # Check if model file exists
             if not os.path.exists(model_path):
@@ -24,8 +40,11 @@ class MLAnomalyClassifier:
                 raise FileNotFoundError(f"Model file not found at {model_path}")
             
             logger.info(f"Loading model from {model_path}")
+            self.model_path = model_path
+            # Hash before loading so the version describes exactly the bytes we load
+            self.model_version = model_file_version(model_path)
             self.model = load(model_path)
-            logger.info(f"Model loaded successfully")
+            logger.info(f"Model {self.model_version} loaded successfully")
             
             # Define anomaly class labels mapping
             self.anomaly_labels = {
@@ -47,88 +66,342 @@ class MLAnomalyClassifier:
             }
             
             # Features needed for the model (in the correct order and with correct names)
-            self.features = [
-                'voltage', 'current', 'frequency', 'power', 'powerFactor',  
-                'voltage_deviation', 'frequency_deviation', 'pf_deviation', 
-                'power_voltage_ratio', 'current_voltage_ratio'
-            ]
+            self.features = list(MODEL_FEATURES)
+            
+            # Vectorized feature engineering shared with the SHAP explainer
+            self.pipeline = FeaturePipeline(self.features)
+            
+            # Maximum number of rows sent to a single model.predict call
+            self.batch_size = 10000
+            
+            # Bounded LRU memo of labels keyed on quantized raw feature vectors
+            self.memo_size = getattr(settings, 'ML_CLASSIFICATION_MEMO_SIZE', 50000)
+            self._memo = LRUCache(self.memo_size)
+            self._memo_bypassed = 0  # Rows whose features cannot be quantized
+            
+            # Inference engine: 'sklearn', 'compiled' (pure NumPy forest) or 'auto'
+            self.compiled_forest = None
+            self.compiled_max_batch = getattr(settings, 'ML_COMPILED_MAX_BATCH', 128)
+            self.set_engine(getattr(settings, 'ML_INFERENCE_ENGINE', 'auto'))
+            
+            # Optional worker processes for very large batches (None when disabled)
+            self.process_pool = InferencePool.from_settings()
+            
+            # Coalesce small jobs of concurrent requests into one model call (None when disabled)
+            max_wait_ms = getattr(settings, 'ML_MICRO_BATCH_WAIT_MS', 5)
+            self.batcher = None
+            if max_wait_ms > 0:
+                self.batcher = MicroBatcher(
+                    self.predict_labels,
+                    max_wait_ms=max_wait_ms,
+                    max_batch_rows=getattr(settings, 'ML_MICRO_BATCH_MAX_ROWS', 2048)
+                )
             
         except Exception as e:
             logger.error(f"ERROR initializing ML classifier: {str(e)}")
             raise e
         
+    def validate_model(self):
+        """Check that the loaded model honours the feature contract of this service.
+        
+        A replacement model must take exactly MODEL_FEATURES in order, know
+        its anomaly types and answer a sample prediction.
+        Raises ValueError describing the first violation.
+        """
+        feature_names = getattr(self.model, 'feature_names_in_', None)
+        if feature_names is not None and list(feature_names) != self.features:
+            raise ValueError(f"Model features {list(feature_names)} do not match {self.features}")
+        if getattr(self.model, 'n_features_in_', len(self.features)) != len(self.features):
+            raise ValueError(f"Model expects {self.model.n_features_in_} features, not {len(self.features)}")
+        
+        if len(getattr(self.model, 'classes_', [])) < 2:
+            raise ValueError("Model does not define at least two anomaly types")
+        
+        # Nominal reading: 230 V, 60 Hz, unity power factor
+        sample = self.pipeline.from_columns({
+            'voltage': [230.0], 'current': [1.0], 'power': [230.0], 'frequency': [60.0], 'power_factor': [1.0]
+        })
+        prediction = self.predict(sample)
+        if len(prediction) != 1 or prediction[0] not in self.model.classes_:
+            raise ValueError(f"Model returned an invalid sample prediction: {prediction}")
+        return True
+        
+    def feature_matrix(self, readings):
+        """Build the feature matrix for readings; see FeaturePipeline.from_readings."""
+        return self.pipeline.from_readings(readings)
+        
     def prepare_features(self, reading):
         """Prepare features for the model prediction."""
         try:
             # Ensure we have the basic required features
-            if not all(key in reading for key in ['voltage', 'current', 'power', 'frequency', 'power_factor']):
+            if not self.pipeline.is_valid(reading):
                 logger.warning(f"Reading missing required features")
                 return None
-                    
-            # Create derived features - using the EXACT feature names expected by the model
-            feature_dict = {
-                'voltage': reading['voltage'],
-                'current': reading['current'],
-                'power': reading['power'],
-                'frequency': reading['frequency'],
-                'powerFactor': reading['power_factor'],  # Changed from power_factor to powerFactor
-                'voltage_deviation': (reading['voltage'] - 230.0) / 230.0,
-                'frequency_deviation': (reading['frequency'] - 60.0) / 60.0,
-                'pf_deviation': reading['power_factor'] - 1.0,
-                'power_voltage_ratio': reading['power'] / (reading['voltage'] + 0.1),
-                'current_voltage_ratio': reading['current'] / (reading['voltage'] + 0.1)
-            }
             
             # Return as pandas DataFrame with exactly the feature names expected by the model
-            return pd.DataFrame([feature_dict], columns=self.features)
+            matrix, _ = self.feature_matrix([reading])
+            return self.pipeline.to_frame(matrix)
         except Exception as e:
             logger.error(f"Error preparing features: {str(e)}")
             return None
         
+    def set_engine(self, engine):
+        """Select the inference engine at runtime.
+        
+        'compiled' evaluates the forest with CompiledForest, 'auto' uses it for
+        batches up to compiled_max_batch rows (where scikit-learn's per-call
+        overhead dominates) and scikit-learn above, where the compiled forest
+        is slower. The compiled forest is only
+        used after it matched model.predict bit for bit on a test corpus.
+        """
+        if engine not in ('sklearn', 'compiled', 'auto'):
+            raise ValueError(f"Unknown inference engine: {engine}")
+        
+        if engine != 'sklearn' and self.compiled_forest is None:
+            self.compiled_forest = self.load_compiled_forest()
+            if self.compiled_forest is None:
+                logger.warning(f"Compiled forest unavailable, falling back to scikit-learn inference")
+                engine = 'sklearn'
+        
+        self.engine = engine
+        return engine
+        
+    def load_compiled_forest(self):
+        """Load (or export) the flat node arrays of the model and verify them."""
+        try:
+            npz_path = compiled_forest_path(self.model_path, self.model_version)
+            
+            # Reuse the export of this exact model file if it still verifies
+            if os.path.exists(npz_path):
+                try:
+                    forest = CompiledForest.load(npz_path)
+                    if forest.verify(self.model):
+                        return forest
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable compiled forest {npz_path}: {str(e)}")
+                logger.warning(f"Re-exporting compiled forest {npz_path}")
+            
+            forest = CompiledForest.from_model(self.model)
+            if not forest.verify(self.model):
+                return None
+            try:
+                forest.save(npz_path)
+            except OSError as e:
+                logger.warning(f"Could not export compiled forest to {npz_path}: {str(e)}")
+            return forest
+        except Exception as e:
+            logger.error(f"Error compiling random forest: {str(e)}")
+            return None
+        
+    def predict(self, matrix):
+        """Run the model on a feature matrix in chunks of self.batch_size rows."""
+        if self.engine == 'compiled' or (self.engine == 'auto' and len(matrix) <= self.compiled_max_batch):
+            return self.compiled_forest.predict(matrix)
+        
+        if self.process_pool is not None and len(matrix) >= self.process_pool.min_rows:
+            try:
+                return self.process_pool.predict(self.model_path, self.model_version, self.features, matrix)
+            except Exception as e:
+                logger.error(f"Process-pool inference failed, predicting in-process: {str(e)}")
+        
+        predictions = [
+            self.model.predict(self.pipeline.to_frame(matrix[start:start + self.batch_size]))
+            for start in range(0, len(matrix), self.batch_size)
+        ]
+        if not predictions:
+            return np.empty(0, dtype=self.model.classes_.dtype)
+        return np.concatenate(predictions)
+        
+    def predict_proba(self, matrix):
+        """Class probabilities for a feature matrix, columns in model.classes_ order.
+        
+        Uses the same engine routing as predict(); the argmax of each row is
+        exactly the label predict() returns.
+        """
+        if self.engine == 'compiled' or (self.engine == 'auto' and len(matrix) <= self.compiled_max_batch):
+            return self.compiled_forest.predict_proba(matrix)
+        
+        if self.process_pool is not None and len(matrix) >= self.process_pool.min_rows:
+            try:
+                return self.process_pool.predict_proba(self.model_path, self.model_version, self.features, matrix)
+            except Exception as e:
+                logger.error(f"Process-pool inference failed, predicting in-process: {str(e)}")
+        
+        probabilities = [
+            self.model.predict_proba(self.pipeline.to_frame(matrix[start:start + self.batch_size]))
+            for start in range(0, len(matrix), self.batch_size)
+        ]
+        if not probabilities:
+            return np.empty((0, len(self.model.classes_)), dtype=np.float64)
+        return np.concatenate(probabilities)
+        
+    def predict_with_confidence(self, matrix, top_k=3):
+        """Labels, confidences and the top-k anomaly types from one predict_proba pass.
+        
+        Returns:
+            List of dicts with 'anomaly_type', 'confidence' and 'top_types'
+            (a list of {'type', 'probability'} sorted by probability), one per row
+        """
+        proba = self.predict_proba(matrix)
+        top_k = max(1, min(int(top_k), proba.shape[1]))
+        
+        # Stable sort keeps ties in class order, so the first entry is the argmax label
+        top = np.argsort(-proba, axis=1, kind='stable')[:, :top_k]
+        top_proba = np.take_along_axis(proba, top, axis=1)
+        classes = self.model.classes_
+        
+        results = []
+        for indices, probabilities in zip(top.tolist(), top_proba.tolist()):
+            top_types = [
+                {'type': self.prediction_to_label(classes[i]), 'probability': round(p, 4)}
+                for i, p in zip(indices, probabilities)
+            ]
+            results.append({
+                'anomaly_type': top_types[0]['type'],
+                'confidence': top_types[0]['probability'],
+                'top_types': top_types
+            })
+        return results
+        
+    def predict_labels(self, matrix):
+        """Return the anomaly type label for every row of a feature matrix.
+        
+        Rows whose quantized features are in the memo are answered from it.
+        The remaining distinct rows go to the model in one batched call and
+        their labels are added to the memo.
+        """
+        keys = self.pipeline.quantized_keys(matrix)
+        labels = [None] * len(matrix)
+        
+        # Group memo misses by key so repeated readings are predicted once
+        pending = {}
+        bypassed = []
+        for i, key in enumerate(keys):
+            if key is None:
+                bypassed.append(i)
+                continue
+            label = self._memo.get(key)
+            if label is not None:
+                labels[i] = label
+            else:
+                pending.setdefault(key, []).append(i)
+        self._memo_bypassed += len(bypassed)
+        
+        # One row per distinct missed key plus every row that bypasses the memo
+        rows = [positions[0] for positions in pending.values()] + bypassed
+        if rows:
+            predictions = self.predict(matrix[rows])
+            new_labels = [self.prediction_to_label(p) for p in predictions]
+            
+            for positions, label in zip(pending.values(), new_labels):
+                for i in positions:
+                    labels[i] = label
+            for i, label in zip(bypassed, new_labels[len(pending):]):
+                labels[i] = label
+            
+            for key, label in zip(pending.keys(), new_labels):
+                self._memo.put(key, label)
+        
+        return labels
+        
+    def label_matrix(self, matrix):
+        """Label a feature matrix, through the micro-batcher when it is enabled."""
+        if self.batcher is not None:
+            return self.batcher.submit(matrix)
+        return self.predict_labels(matrix)
+        
+    def get_memo_stats(self):
+        """Get size and hit-rate statistics of the classification memo."""
+        stats = self._memo.get_stats()
+        stats['bypassed'] = self._memo_bypassed
+        return stats
+        
+    def clear_memo(self):
+        """Drop all memoized classifications and reset the statistics."""
+        self._memo.clear()
+        self._memo_bypassed = 0
+        
+    def prediction_to_label(self, prediction):
+        """Convert a raw model prediction to an anomaly type label."""
+        # Handle the prediction based on its type
+        if isinstance(prediction, (int, np.integer)):
+            # If it's an integer index, look up the label
+            if hasattr(prediction, 'item'):
+                prediction_idx = prediction.item()  # Convert numpy type
+            else:
+                prediction_idx = int(prediction)
+            
+            return self.anomaly_labels.get(prediction_idx, 'Unknown')
+        
+        # If it's already a string label, use it directly
+        return str(prediction)
+        
     def classify_anomaly(self, reading):
         """Classify an anomaly reading using the trained model."""
         if not reading['is_anomaly']:
             return 'Normal'
             
         # Prepare features
-        features = self.prepare_features(reading)
-        if features is None:
+        matrix, positions = self.feature_matrix([reading])
+        if not positions:
             return 'Unknown'
             
         # Make prediction
         try:
-            # Get raw prediction without logging
-            prediction = self.model.predict(features)[0]
-            
-            # Handle the prediction based on its type
-            if isinstance(prediction, (int, np.integer)):
-                # If it's an integer index, look up the label
-                if hasattr(prediction, 'item'):
-                    prediction_idx = prediction.item()  # Convert numpy type
-                else:
-                    prediction_idx = int(prediction)
-                
-                anomaly_type = self.anomaly_labels.get(prediction_idx, 'Unknown')
-            else:
-                # If it's already a string label, use it directly
-                anomaly_type = str(prediction)
-            
-            return anomaly_type
+            return self.label_matrix(matrix)[0]
         except Exception as e:
             logger.error(f"Error classifying reading {reading.get('id', 'unknown')}: {str(e)}")
             return 'Unknown'
         
-    def classify_batch(self, readings):
-        """Classify a batch of readings."""
+    def classify_batch(self, readings, top_k=0):
+        """Classify a batch of readings.
+        
+        Features of all anomalous readings are built as one matrix and labelled
+        in chunks of self.batch_size rows (memo misses go to the model), then the
+        labels are scattered back onto the readings. A chunk that fails is
+        retried row by row, so only the rows that really fail stay 'Unknown'.
+        
+        With top_k > 0 every anomaly also gets 'confidence' and its 'top_types',
+        computed in the same predict_proba pass as the label (bypassing the memo).
+        """
         logger.info(f"Classifying batch of {len(readings)} readings")
-        anomaly_count = 0
         
-        for i, reading in enumerate(readings):
+        anomalies = []
+        for reading in readings:
             if reading['is_anomaly']:
-                reading['anomaly_type'] = self.classify_anomaly(reading)
-                anomaly_count += 1
+                # Readings without usable features stay 'Unknown'
+                reading['anomaly_type'] = 'Unknown'
+                anomalies.append(reading)
             else:
                 reading['anomaly_type'] = 'Normal'
         
-        logger.info(f"Classification complete. Found {anomaly_count} anomalies in {len(readings)} readings.")
-        return readings
\ No newline at end of file
+        matrix, positions = self.feature_matrix(anomalies)
+        
+        failed = 0
+        for start in range(0, len(positions), self.batch_size):
+            chunk = slice(start, start + self.batch_size)
+            try:
+                self._classify_rows(anomalies, positions[chunk], matrix[chunk], top_k)
+            except Exception as e:
+                # Isolate the failing rows: classify the chunk row by row, leaving only those 'Unknown'
+                logger.error(f"Error classifying chunk of {len(positions[chunk])} rows, retrying per row: {str(e)}")
+                for position, row in zip(positions[chunk], matrix[chunk]):
+                    try:
+                        self._classify_rows(anomalies, [position], row[np.newaxis], top_k)
+                    except Exception as row_error:
+                        failed += 1
+                        logger.error(f"Error classifying reading {anomalies[position].get('id', 'unknown')}: {str(row_error)}")
+        if failed:
+            logger.warning(f"{failed} of {len(positions)} anomalies could not be classified and stay 'Unknown'")
+        
+        logger.info(f"Classification complete. Found {len(anomalies)} anomalies in {len(readings)} readings.")
+        return readings
+        
+    def _classify_rows(self, anomalies, positions, matrix, top_k=0):
+        """Label the anomalies at positions from their feature rows (see classify_batch)."""
+        if top_k:
+            for position, result in zip(positions, self.predict_with_confidence(matrix, top_k)):
+                anomalies[position].update(result)
+        else:
+            for position, label in zip(positions, self.label_matrix(matrix)):
+                anomalies[position]['anomaly_type'] = label
\ No newline at end of file
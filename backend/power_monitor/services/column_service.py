@@ -0,0 +1,52 @@
+import calendar
+from datetime import datetime
+
+import numpy as np
+
+# Electrical parameters carried by every processed reading
+PARAMETERS = ['voltage', 'current', 'power', 'frequency', 'power_factor']
+
+
+def parse_epoch(timestamp):
+    """Convert a single ISO timestamp string to epoch seconds (naive times are UTC)."""
+    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return calendar.timegm(dt.utctimetuple())
+
+
+def epoch_seconds(timestamps):
+    """Convert a sequence of ISO timestamp strings to an int64 array of epoch seconds."""
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    try:
+        # Fast path: numpy parses well-formed ISO strings in C
+        return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+    except ValueError:
+        # Firebase time keys are not always zero padded - fall back to Python parsing
+        return np.fromiter((parse_epoch(ts) for ts in timestamps), dtype=np.int64, count=len(timestamps))
+
+
+def readings_to_columns(readings, parameters=None):
+    """Convert a list of reading dicts into a time-ordered block of numpy columns.
+
+    Returns a dict with an int64 'epoch' column, one float64 column per parameter,
+    an 'is_anomaly' bool column and an 'index' column mapping each row back to its
+    position in the original readings list.
+    """
+    parameters = parameters or PARAMETERS
+    n = len(readings)
+
+    epoch = epoch_seconds([r['timestamp'] for r in readings])
+    # Stable sort keeps the original order for readings with equal timestamps
+    order = np.argsort(epoch, kind='stable')
+
+    columns = {
+        'epoch': epoch[order],
+        'index': order,
+        'is_anomaly': np.fromiter((bool(r.get('is_anomaly', False)) for r in readings), dtype=bool, count=n)[order],
+    }
+    for param in parameters:
+        values = np.fromiter((r.get(param, np.nan) for r in readings), dtype=np.float64, count=n)
+        columns[param] = values[order]
+
+    return columns
@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from ..mongodb_helpers import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+class DocumentStore:
+    """Optional MongoDB persistence for derived per node-day data.
+
+    Every call degrades gracefully: while MongoDB is unreachable reads return
+    None and writes are skipped, and the connection is not retried for
+    `backoff` seconds so requests never wait on it repeatedly. Requests never
+    wait for a connection either: reads before MongoDB is connected return
+    None and start connecting in the background, and writes are queued for a
+    background writer thread.
+    """
+
+    def __init__(self, collection_name, backoff=300, max_pending_writes=10000):
+        """Initialize for one MongoDB collection."""
+        self.collection_name = collection_name
+        self.backoff = backoff
+        self._retry_at = 0  # Skip MongoDB until this time after a failure
+        self._lock = threading.Lock()
+        self._connecting = False
+        self._writes = queue.Queue(maxsize=max_pending_writes)
+        self._writer = None
+
+    def _collection(self, connect=False):
+        """Get the MongoDB collection, or None while MongoDB is unavailable.
+
+        Without connect, a missing connection is started in the background
+        instead of being waited for.
+        """
+        if time.time() < self._retry_at:
+            return None
+        mongo_db = getattr(settings, 'MONGO_DB', None)
+        if mongo_db is None:
+            if not connect:
+                self._connect_in_background()
+                return None
+            mongo_db = get_mongo_db()
+            if mongo_db is None:
+                self._retry_at = time.time() + self.backoff
+                return None
+        return mongo_db[self.collection_name]
+
+    def _connect_in_background(self):
+        """Try to connect on a daemon thread unless an attempt is already running."""
+        with self._lock:
+            if self._connecting:
+                return
+            self._connecting = True
+
+        def connect():
+            try:
+                self._collection(connect=True)
+            finally:
+                self._connecting = False
+
+        threading.Thread(target=connect, name=f"mongo-connect-{self.collection_name}", daemon=True).start()
+
+    def _failed(self, error):
+        logger.warning(f"MongoDB collection {self.collection_name} unavailable, using memory only: {str(error)}")
+        self._retry_at = time.time() + self.backoff
+
+    def available(self):
+        """Check whether MongoDB is connected and not backing off after a failure."""
+        return self._collection() is not None
+
+    def find(self, document_id):
+        """Get a document by id, or None if it is missing or MongoDB is unavailable."""
+        collection = self._collection()
+        if collection is None:
+            return None
+        try:
+            return collection.find_one({'_id': document_id})
+        except Exception as e:
+            self._failed(e)
+            return None
+
+    def update(self, document_id, fields, fields_on_insert=None):
+        """Queue setting fields on a document, creating it (with fields_on_insert) if needed.
+
+        Returns:
+            False if the write was dropped because MongoDB is unavailable or too many writes are pending
+        """
+        if time.time() < self._retry_at:
+            return False
+        try:
+            self._writes.put_nowait((document_id, fields, fields_on_insert, datetime.utcnow()))
+        except queue.Full:
+            logger.warning(f"Dropping write to {self.collection_name}: too many pending writes")
+            return False
+
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name=f"mongo-writer-{self.collection_name}", daemon=True)
+                self._writer.start()
+        return True
+
+    def _write_loop(self):
+        """Writer thread: apply queued updates in order."""
+        while True:
+            document_id, fields, fields_on_insert, updated_at = self._writes.get()
+            try:
+                self._write(document_id, fields, fields_on_insert, updated_at)
+            finally:
+                self._writes.task_done()
+
+    def _write(self, document_id, fields, fields_on_insert, updated_at):
+        collection = self._collection(connect=True)
+        if collection is None:
+            return False
+        update = {'$set': {**fields, 'updated_at': updated_at}}
+        if fields_on_insert:
+            update['$setOnInsert'] = fields_on_insert
+        try:
+            collection.update_one({'_id': document_id}, update, upsert=True)
+            return True
+        except Exception as e:
+            self._failed(e)
+            return False
+
+    def flush(self):
+        """Wait until every queued write was applied or skipped."""
+        self._writes.join()
@@ -0,0 +1,161 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .column_service import PARAMETERS, readings_to_columns
+
+# Bucket widths (seconds) to choose from, so bucket edges fall on round times
+BUCKET_SECONDS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+
+def choose_bucket_seconds(span_seconds, max_buckets):
+    """Smallest round bucket width that covers span_seconds in at most max_buckets buckets."""
+    needed = span_seconds / max(1, max_buckets)
+    for seconds in BUCKET_SECONDS:
+        if seconds >= needed:
+            return seconds
+    return int(np.ceil(needed / 86400)) * 86400
+
+
+def resolution_label(bucket_seconds):
+    """Short label of a bucket width, e.g. '30s', '5m', '1h', '1d'."""
+    if not bucket_seconds:
+        return 'raw'
+    for unit, seconds in (('d', 86400), ('h', 3600), ('m', 60)):
+        if bucket_seconds % seconds == 0:
+            return f"{bucket_seconds // seconds}{unit}"
+    return f"{bucket_seconds}s"
+
+
+def _isoformat(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def bucket_aggregates(columns, bucket_seconds, parameters=PARAMETERS):
+    """Aggregate time-ordered columns (see readings_to_columns) into one row per time bucket.
+
+    Each row carries the bucket start as timestamp, the mean of every
+    parameter under its own name (so charts can plot it as is) and the
+    bucket's minimum, maximum and last value as <parameter>_min/_max/_last.
+    """
+    epochs = columns['epoch']
+    if not len(epochs):
+        return []
+    buckets = epochs // bucket_seconds
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(buckets)]))
+
+    aggregates = {}
+    for parameter in parameters:
+        values = columns[parameter]
+        present = ~np.isnan(values)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        minimums = np.minimum.reduceat(np.where(present, values, np.inf), starts)
+        maximums = np.maximum.reduceat(np.where(present, values, -np.inf), starts)
+        # Last present value per bucket: forward fill, then read each bucket's last row
+        filled_index = np.maximum.accumulate(np.where(present, np.arange(len(values)), -1))
+        last_index = filled_index[ends - 1]
+        last = np.where(last_index >= starts, values[np.maximum(last_index, 0)], np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        aggregates[parameter] = (counts, means, minimums, maximums, last)
+
+    rows = []
+    for b, (start, end) in enumerate(zip(starts, ends)):
+        bucket_start = int(buckets[start]) * bucket_seconds
+        row = {
+            'timestamp': _isoformat(bucket_start),
+            'bucket_end': _isoformat(bucket_start + bucket_seconds),
+            'count': int(end - start),
+            'aggregated': True,
+            'is_anomaly': False,
+            'anomaly_parameters': [],
+            'anomaly_type': 'Normal'
+        }
+        for parameter, (counts, means, minimums, maximums, last) in aggregates.items():
+            if counts[b]:
+                row[parameter] = round(float(means[b]), 4)
+                row[f"{parameter}_min"] = float(minimums[b])
+                row[f"{parameter}_max"] = float(maximums[b])
+                row[f"{parameter}_last"] = float(last[b])
+        rows.append(row)
+    return rows
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of threshold points that best keep the shape of y(x).
+
+    x must be sorted. The first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picks = np.empty(threshold, dtype=np.int64)
+    picks[0] = 0
+    picks[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Point of this bucket forming the largest triangle with the previous pick and the average
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        picks[i + 1] = previous
+    return picks
+
+
+def downsample(readings, max_points, method='buckets', parameter='power', columns=None):
+    """Reduce readings to about max_points for charting, keeping every anomaly.
+
+    'buckets' aggregates the normal readings per time bucket (see
+    bucket_aggregates), with the bucket width chosen from the point budget;
+    'lttb' keeps the max_points normal readings that best preserve the shape of
+    one parameter. Anomalous readings are always returned unchanged. Output is
+    sorted by time. Pass the readings' columns (see readings_to_columns) when
+    they were built already.
+
+    Returns:
+        Tuple of (readings, info) where info has method, bucket_seconds and resolution
+    """
+    info = {'method': 'raw', 'bucket_seconds': None, 'resolution': 'raw'}
+    if method not in ('buckets', 'lttb'):
+        raise ValueError("downsample must be 'buckets' or 'lttb'")
+    if method == 'lttb' and parameter not in PARAMETERS:
+        raise ValueError(f"parameter must be one of {', '.join(PARAMETERS)}")
+    if not readings or len(readings) <= max_points:
+        return readings, info
+
+    columns = columns if columns is not None else readings_to_columns(readings)
+    epochs = columns['epoch']
+    anomalous = columns['is_anomaly']
+    anomaly_order = columns['index'][anomalous]
+
+    if method == 'lttb':
+        values = columns[parameter]
+        normal = ~anomalous & ~np.isnan(values)
+        keep = lttb_indices(epochs[normal].astype(np.float64), values[normal], max_points)
+        selected = np.concatenate((columns['index'][normal][keep], anomaly_order))
+        selected_epochs = np.concatenate((epochs[normal][keep], epochs[anomalous]))
+        info.update({'method': 'lttb', 'resolution': 'lttb'})
+        return [readings[i] for i in selected[np.argsort(selected_epochs, kind='stable')]], info
+
+    span = int(epochs[-1] - epochs[0])
+    bucket_seconds = choose_bucket_seconds(span, max_points)
+    normal_columns = {key: column[~anomalous] for key, column in columns.items()}
+    rows = bucket_aggregates(normal_columns, bucket_seconds)
+
+    # Merge the bucket rows and the anomalies by time
+    row_epochs = np.unique(normal_columns['epoch'] // bucket_seconds) * bucket_seconds
+    merged_epochs = np.concatenate((row_epochs, epochs[anomalous]))
+    merged = rows + [readings[i] for i in anomaly_order]
+    info.update({'method': 'buckets', 'bucket_seconds': bucket_seconds, 'resolution': resolution_label(bucket_seconds)})
+    return [merged[i] for i in np.argsort(merged_epochs, kind='stable')], info
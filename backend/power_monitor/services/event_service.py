@@ -0,0 +1,189 @@
+import numpy as np
+from .anomaly_service import AnomalyDetectionService
+from .cache_service import CacheService
+from .column_service import PARAMETERS, epoch_seconds, readings_to_columns
+
+class AnomalyEventService:
+    """Service for aggregating consecutive anomalous readings into anomaly events."""
+
+    def __init__(self, thresholds=None, max_gap_sec=300):
+        """Initialize with the detection thresholds and the maximum gap inside an event.
+
+        Two anomalous readings further apart than max_gap_sec (missing data) belong
+        to separate events even if no normal reading lies between them.
+        """
+        self.thresholds = thresholds or AnomalyDetectionService().thresholds
+        self.max_gap_sec = max_gap_sec
+
+    def build_events(self, readings):
+        """Run-length encode anomalous readings into events, per parameter.
+
+        Args:
+            readings: List of reading dicts (any order), optionally with anomaly_type
+
+        Returns:
+            List of event dicts sorted by start time
+        """
+        if not readings:
+            return []
+
+        columns = readings_to_columns(readings)
+        epoch = columns['epoch']
+        index = columns['index']
+
+        # Factorize anomaly types once so the dominant type per event is a bincount
+        types = np.array([str(readings[i].get('anomaly_type') or 'Unclassified') for i in index], dtype=object)
+        type_names, type_codes = np.unique(types, return_inverse=True)
+
+        # A gap in the data breaks an event even if both sides are anomalous
+        gap_before = np.zeros(len(epoch), dtype=bool)
+        gap_before[1:] = np.diff(epoch) > self.max_gap_sec
+
+        events = []
+        for param in PARAMETERS:
+            if param not in self.thresholds:
+                continue
+
+            values = columns[param]
+            low = self.thresholds[param]['min']
+            high = self.thresholds[param]['max']
+
+            # Same rule as AnomalyDetectionService: strictly outside [min, max]
+            below = values < low
+            above = values > high
+            mask = below | above
+            if not mask.any():
+                continue
+
+            # A row continues the previous event if both are anomalous and no gap separates them
+            continues = np.zeros(len(mask), dtype=bool)
+            continues[1:] = mask[1:] & mask[:-1] & ~gap_before[1:]
+            starts = np.flatnonzero(mask & ~continues)
+            ends_flag = mask.copy()
+            ends_flag[:-1] &= ~continues[1:]
+            ends = np.flatnonzero(ends_flag)
+
+            # Deviation beyond the violated threshold, zero for normal rows. Segments
+            # [start_i, start_i+1) only add zeros/infs after each event, so reduceat
+            # yields the per-event extremes.
+            deviation = np.where(below, low - values, np.where(above, values - high, 0.0))
+            peak_deviation = np.maximum.reduceat(deviation, starts)
+            min_value = np.minimum.reduceat(np.where(mask, values, np.inf), starts)
+            max_value = np.maximum.reduceat(np.where(mask, values, -np.inf), starts)
+            below_count = np.add.reduceat(below.astype(np.int64), starts)
+            reading_count = ends - starts + 1
+
+            # Dominant anomaly type: count (event, type) pairs over anomalous rows
+            event_ids = np.cumsum(mask & ~continues) - 1
+            pairs = event_ids[mask] * len(type_names) + type_codes[mask]
+            type_counts = np.bincount(pairs, minlength=len(starts) * len(type_names)).reshape(len(starts), len(type_names))
+            dominant = type_counts.argmax(axis=1)
+
+            for k in range(len(starts)):
+                start_row = index[starts[k]]
+                end_row = index[ends[k]]
+                if below_count[k] == reading_count[k]:
+                    direction = 'low'
+                elif below_count[k] == 0:
+                    direction = 'high'
+                else:
+                    direction = 'mixed'
+
+                events.append({
+                    'parameter': param,
+                    'start': readings[start_row]['timestamp'],
+                    'end': readings[end_row]['timestamp'],
+                    'start_epoch': int(epoch[starts[k]]),
+                    'end_epoch': int(epoch[ends[k]]),
+                    'duration_sec': int(epoch[ends[k]] - epoch[starts[k]]),
+                    'reading_count': int(reading_count[k]),
+                    'direction': direction,
+                    'peak_deviation': round(float(peak_deviation[k]), 3),
+                    'min_value': round(float(min_value[k]), 3),
+                    'max_value': round(float(max_value[k]), 3),
+                    # Events touching the edges of the block may continue in the neighbouring node-day
+                    'at_data_start': bool(starts[k] == 0),
+                    'at_data_end': bool(ends[k] == len(epoch) - 1),
+                    'anomaly_type': str(type_names[dominant[k]]),
+                    'anomaly_type_counts': {
+                        str(type_names[t]): int(type_counts[k, t])
+                        for t in np.flatnonzero(type_counts[k])
+                    }
+                })
+
+        events.sort(key=lambda e: (e['start_epoch'], e['parameter']))
+        return events
+
+    def fingerprint(self, readings):
+        """Number of readings and last reading epoch (None without readings) of a node-day."""
+        if not readings:
+            return len(readings), None
+        return len(readings), int(epoch_seconds([r['timestamp'] for r in readings]).max())
+
+    def get_cached_day_events(self, node, year, month, day, readings=None):
+        """Get the cached events for one node-day, or None if they were never computed.
+
+        With readings, cached events only count if they were built from the
+        same number of readings with the same last reading, so a growing
+        current day is rebuilt.
+        """
+        cached = CacheService().get(node, year, month, day, namespace='events')
+        if cached is None:
+            return None
+        if readings is not None and (cached['count'], cached['last_epoch']) != self.fingerprint(readings):
+            return None
+        return cached['events']
+
+    def get_day_events(self, node, year, month, day, readings, use_cache=True):
+        """Get the events for one node-day, computing and caching them on a miss or when readings changed."""
+        cache = CacheService() if use_cache else None
+        if use_cache:
+            cached_events = self.get_cached_day_events(node, year, month, day, readings)
+            if cached_events is not None:
+                return cached_events
+
+        events = self.build_events(readings)
+
+        if use_cache:
+            count, last_epoch = self.fingerprint(readings)
+            cache.set(node, year, month, day, {'events': events, 'count': count, 'last_epoch': last_epoch}, namespace='events')
+        return events
+
+    def invalidate_cache(self, old_version=None, new_version=None):
+        """Drop all cached events, e.g. after a new model relabelled the anomalies.
+
+        Registered as a model swap listener, called with the old and new model version.
+        """
+        CacheService().clear_namespace('events')
+    
+    def merge_adjacent(self, events):
+        """Merge events of the same parameter split across node-day boundaries."""
+        merged = []
+        open_events = {}
+
+        for event in sorted(events, key=lambda e: (e['start_epoch'], e['parameter'])):
+            previous = open_events.get(event['parameter'])
+            if (previous is not None and previous['at_data_end'] and event['at_data_start']
+                    and 0 <= event['start_epoch'] - previous['end_epoch'] <= self.max_gap_sec):
+                # Continue the previous event rather than starting a new one
+                previous['end'] = event['end']
+                previous['end_epoch'] = event['end_epoch']
+                previous['at_data_end'] = event['at_data_end']
+                previous['duration_sec'] = previous['end_epoch'] - previous['start_epoch']
+                previous['reading_count'] += event['reading_count']
+                previous['peak_deviation'] = max(previous['peak_deviation'], event['peak_deviation'])
+                previous['min_value'] = min(previous['min_value'], event['min_value'])
+                previous['max_value'] = max(previous['max_value'], event['max_value'])
+                if previous['direction'] != event['direction']:
+                    previous['direction'] = 'mixed'
+                for anomaly_type, count in event['anomaly_type_counts'].items():
+                    previous['anomaly_type_counts'][anomaly_type] = previous['anomaly_type_counts'].get(anomaly_type, 0) + count
+                previous['anomaly_type'] = max(previous['anomaly_type_counts'], key=previous['anomaly_type_counts'].get)
+                continue
+
+            # Copy so merging never mutates cached per-day events
+            event = dict(event, anomaly_type_counts=dict(event['anomaly_type_counts']))
+            open_events[event['parameter']] = event
+            merged.append(event)
+
+        return merged
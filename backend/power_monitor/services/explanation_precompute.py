@@ -0,0 +1,180 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from django.conf import settings
+
+from .lru_cache import LRUCache
+from .model_registry import ModelRegistry, ModelNotReady
+
+logger = logging.getLogger(__name__)
+
+def anomaly_severity(reading, thresholds):
+    """How far a reading is outside its thresholds, summed over the flagged parameters.
+
+    Each parameter contributes its distance to the nearest threshold relative
+    to the width of the normal range.
+    """
+    severity = 0.0
+    for parameter in reading.get('anomaly_parameters') or []:
+        limits = thresholds.get(parameter)
+        value = reading.get(parameter)
+        if not limits or not isinstance(value, (int, float)):
+            continue
+        width = (limits['max'] - limits['min']) or 1.0
+        severity += max(limits['min'] - value, value - limits['max'], 0.0) / width
+    return severity
+
+
+def reading_time(reading):
+    """Reading timestamp as epoch seconds (0 if it has none or it cannot be parsed)."""
+    try:
+        return datetime.fromisoformat(str(reading.get('timestamp'))).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ExplanationPrecomputer:
+    """Background worker explaining newly detected anomalies before anyone asks.
+
+    Views hand over the anomalies they detect; a single low-priority thread
+    explains them in small batches, in the interactive explanation mode
+    (ML_INTERACTIVE_EXPLAIN_MODE), into the explainer's explanation cache,
+    where ExplainAnomalyView finds them. The newest day goes first, then the
+    most severe and most recent anomalies. While max_queue readings are
+    pending, further anomalies are dropped and may be offered again later.
+    After every batch the worker sleeps long enough to stay within cpu_budget
+    (the fraction of one core it may use), so interactive requests keep priority.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls):
+        """Ensures only one instance of ExplanationPrecomputer exists."""
+        if cls._instance is None:
+            cls._instance = super(ExplanationPrecomputer, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        """Initialize the queue (the worker thread starts on first enqueue)."""
+        self.enabled = getattr(settings, 'ML_PRECOMPUTE_EXPLANATIONS', False)
+        self.cpu_budget = min(max(getattr(settings, 'ML_PRECOMPUTE_CPU_BUDGET', 0.25), 0.01), 1.0)
+        self.batch_size = getattr(settings, 'ML_PRECOMPUTE_BATCH_SIZE', 16)
+        self.max_queue = getattr(settings, 'ML_PRECOMPUTE_MAX_QUEUE', 10000)
+        # Explain exactly what click-to-explain will look up
+        self.mode = getattr(settings, 'ML_INTERACTIVE_EXPLAIN_MODE', 'exact')
+        self.max_trees = getattr(settings, 'ML_INTERACTIVE_EXPLAIN_MAX_TREES', None)
+        self._condition = threading.Condition()
+        self._queue = []  # Heap of (priority, sequence, reading)
+        self._sequence = itertools.count()
+        self._seen = LRUCache(self.max_queue * 5)  # (model version, reading id) queued recently
+        self._thread = None
+        self._stats = {'queued': 0, 'explained': 0, 'dropped': 0, 'batches': 0, 'busy_sec': 0.0, 'idle_sec': 0.0}
+
+    def priority(self, reading, thresholds):
+        """Heap priority: newest day first, then most severe, then most recent."""
+        timestamp = reading_time(reading)
+        return (-int(timestamp // 86400), -round(anomaly_severity(reading, thresholds), 3), -timestamp)
+
+    def enqueue(self, readings, thresholds=None):
+        """Queue the anomalies among readings that were not queued before.
+
+        Returns:
+            Number of readings added to the queue
+        """
+        if not self.enabled:
+            return 0
+        thresholds = thresholds or {}
+        # A new model version explains every reading again
+        model_version = ModelRegistry().get_version()
+
+        added = dropped = 0
+        with self._condition:
+            for reading in readings:
+                reading_id = reading.get('id')
+                if not reading.get('is_anomaly', False) or reading_id is None:
+                    continue
+                key = (model_version, reading_id)
+                if self._seen.get(key) is not None:
+                    continue
+                if len(self._queue) >= self.max_queue:
+                    # Full: drop without remembering it, so it can be queued once there is room
+                    dropped += 1
+                    continue
+                self._seen.put(key, True)
+                heapq.heappush(self._queue, (self.priority(reading, thresholds), next(self._sequence), reading))
+                added += 1
+
+            self._stats['queued'] += added
+            self._stats['dropped'] += dropped
+            if added:
+                self._start()
+                self._condition.notify()
+        return added
+
+    def _start(self):
+        """Start the worker thread unless it is running (caller holds the condition)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='explanation-precompute', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        """Wait for queued readings and pop the highest priority batch of heap entries."""
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            count = min(self.batch_size, len(self._queue))
+            return [heapq.heappop(self._queue) for _ in range(count)]
+
+    def _run(self):
+        """Worker thread: explain batches, then sleep to stay within the CPU budget."""
+        try:
+            # Linux applies nice values per thread, so only this worker is deprioritized
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+        registry = ModelRegistry()
+        while True:
+            entries = self._next_batch()
+            try:
+                explainer = registry.get_explainer(timeout=60)
+            except ModelNotReady:
+                # Put the batch back and wait for the models to load
+                with self._condition:
+                    for entry in entries:
+                        heapq.heappush(self._queue, entry)
+                time.sleep(registry.retry_after)
+                continue
+
+            # CPU time of this thread only, so interactive requests do not count against the budget
+            started = time.thread_time()
+            try:
+                explainer.explain_batch([entry[2] for entry in entries], mode=self.mode, max_trees=self.max_trees)
+                self._stats['explained'] += len(entries)
+                self._stats['batches'] += 1
+            except Exception as e:
+                logger.error(f"Error precomputing explanations: {str(e)}")
+                logger.error(traceback.format_exc())
+            busy = time.thread_time() - started
+            idle = busy * (1 - self.cpu_budget) / self.cpu_budget
+            self._stats['busy_sec'] += busy
+            self._stats['idle_sec'] += idle
+            time.sleep(idle)
+
+    def get_stats(self):
+        """Get queue length and worker statistics."""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._queue)
+        stats['busy_sec'] = round(stats['busy_sec'], 3)
+        stats['idle_sec'] = round(stats['idle_sec'], 3)
+        stats['enabled'] = self.enabled
+        stats['mode'] = self.mode
+        stats['cpu_budget'] = self.cpu_budget
+        return stats
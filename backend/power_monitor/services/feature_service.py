@@ -0,0 +1,116 @@
+import numbers
+
+import numpy as np
+import pandas as pd
+
+# Raw reading keys every feature is derived from
+RAW_KEYS = ['voltage', 'current', 'power', 'frequency', 'power_factor']
+
+# Decimal places the sensors report each raw value with
+SENSOR_DECIMALS = {
+    'voltage': 1,
+    'current': 3,
+    'power': 1,
+    'frequency': 1,
+    'power_factor': 2
+}
+
+# Feature names (and order) the random forest was trained with
+MODEL_FEATURES = [
+    'voltage', 'current', 'frequency', 'power', 'powerFactor',
+    'voltage_deviation', 'frequency_deviation', 'pf_deviation',
+    'power_voltage_ratio', 'current_voltage_ratio'
+]
+
+class FeaturePipeline:
+    """Vectorized feature engineering shared by classification and explanation."""
+
+    def __init__(self, features=None):
+        """Initialize with the feature order expected by the model."""
+        self.features = list(features or MODEL_FEATURES)
+
+    def is_valid(self, reading):
+        """Check that a reading carries every raw value as a number."""
+        return all(isinstance(reading.get(key), numbers.Real) for key in RAW_KEYS)
+
+    def from_columns(self, columns):
+        """Map a block of raw columns to a contiguous float64 matrix in model feature order.
+
+        Args:
+            columns: Dict of equally long arrays keyed by RAW_KEYS
+
+        Returns:
+            C-contiguous array of shape (rows, len(self.features))
+        """
+        voltage = np.asarray(columns['voltage'], dtype=np.float64)
+        current = np.asarray(columns['current'], dtype=np.float64)
+        power = np.asarray(columns['power'], dtype=np.float64)
+        frequency = np.asarray(columns['frequency'], dtype=np.float64)
+        power_factor = np.asarray(columns['power_factor'], dtype=np.float64)
+
+        # Same float64 arithmetic as the original scalar implementation, one column at a time
+        derived = {
+            'voltage': voltage,
+            'current': current,
+            'frequency': frequency,
+            'power': power,
+            'powerFactor': power_factor,
+            'voltage_deviation': (voltage - 230.0) / 230.0,
+            'frequency_deviation': (frequency - 60.0) / 60.0,
+            'pf_deviation': power_factor - 1.0,
+            'power_voltage_ratio': power / (voltage + 0.1),
+            'current_voltage_ratio': current / (voltage + 0.1)
+        }
+
+        matrix = np.empty((len(voltage), len(self.features)), dtype=np.float64)
+        for i, name in enumerate(self.features):
+            matrix[:, i] = derived[name]
+        return matrix
+
+    def from_readings(self, readings):
+        """Build the feature matrix for a list of reading dicts.
+
+        Returns:
+            Tuple of (matrix, positions) where positions lists the index in readings
+            of each matrix row. Readings with missing or non-numeric values are skipped.
+        """
+        positions = [i for i, reading in enumerate(readings) if self.is_valid(reading)]
+
+        raw = np.array(
+            [[readings[i][key] for key in RAW_KEYS] for i in positions],
+            dtype=np.float64
+        ).reshape(len(positions), len(RAW_KEYS))
+
+        columns = {key: raw[:, j] for j, key in enumerate(RAW_KEYS)}
+        return self.from_columns(columns), positions
+
+    def quantized_keys(self, matrix):
+        """Build hashable memo keys from the raw feature columns at sensor resolution.
+
+        The derived features are pure functions of the raw values, so two rows
+        with equal raw values always get the same prediction. A row only gets a
+        key when its raw values already sit exactly on the sensor grid; rows
+        with extra precision get None and must bypass any memo, which keeps the
+        quantization from ever changing a prediction.
+        """
+        raw_names = {'power_factor': 'powerFactor'}
+        raw_idx = [self.features.index(raw_names.get(key, key)) for key in RAW_KEYS]
+        raw = matrix[:, raw_idx]
+
+        quantized = np.empty_like(raw)
+        for j, key in enumerate(RAW_KEYS):
+            quantized[:, j] = np.round(raw[:, j], SENSOR_DECIMALS[key])
+
+        on_grid = (quantized == raw).all(axis=1)
+        keys = [None] * len(matrix)
+        for i, row in zip(np.flatnonzero(on_grid).tolist(), quantized[on_grid].tolist()):
+            keys[i] = tuple(row)
+        return keys
+
+    def to_frame(self, matrix):
+        """Wrap a feature matrix with the model's feature names (no copy)."""
+        return pd.DataFrame(matrix, columns=self.features, copy=False)
+
+    def to_dict(self, row):
+        """Convert one matrix row to a {feature: value} dict of Python floats."""
+        return dict(zip(self.features, np.asarray(row).tolist()))
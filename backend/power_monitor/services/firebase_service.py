@@ -385,8 +385,12 @@ class FirebaseService:
             print(f"Error fetching days for node {node}, year {year}, month {month}: {e}")
             return []
 
-    def get_day_data(self, node, year, month, day, use_cache=True, since_timestamp=None):
-        """Get all data for a specific day, optionally only data newer than since_timestamp"""
+    def get_day_data(self, node, year, month, day, use_cache=True, since_timestamp=None, raise_errors=False):
+        """Get all data for a specific day, optionally only data newer than since_timestamp
+        
+        Errors are logged and give an empty day, unless raise_errors is set so
+        callers persisting derived data can tell a failed fetch from a day without data.
+        """
         try:
             # If we're fetching fresh data based on timestamp, don't use cache
             if since_timestamp:
@@ -452,6 +456,8 @@ class FirebaseService:
             return []
         except Exception as e:
             print(f"Error fetching day data for {node}/{year}/{month}/{day}: {e}")
+            if raise_errors:
+                raise
             return []
 
     def get_month_data(self, node, year, month, use_cache=True, since_timestamp=None):
@@ -0,0 +1,217 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class CompiledForest:
+    """Pure NumPy inference engine for a fitted scikit-learn random forest classifier.
+
+    All trees are flattened into shared node arrays. Nodes are renumbered so the
+    right child always follows the left child, which makes one traversal step a
+    single gather: next = left[node] + (x[feature[node]] > threshold[node]).
+    Leaves point to themselves with an infinite threshold, so a batch walks
+    every tree in lock-step for max_depth vectorized steps.
+
+    The engine is a latency optimization for small batches only: it skips
+    scikit-learn's per-call validation and thread dispatch (about 0.4 ms versus
+    8 ms for a single row), but every step touches rows x trees nodes, so it
+    falls behind scikit-learn above a few hundred rows (0.17 s versus 0.05 s
+    for 5000 rows). The 'auto' engine therefore only routes batches up to
+    ML_COMPILED_MAX_BATCH rows here.
+    """
+
+    # Batches up to this size sum the per-tree leaf values in one vectorized call
+    VECTOR_SUM_MAX_ROWS = 256
+
+    def __init__(self, feature, threshold, left, value, roots, classes, max_depth):
+        """Initialize from already flattened node arrays."""
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten the trees of a fitted RandomForestClassifier."""
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            children_left = tree.children_left
+            children_right = tree.children_right
+
+            # Breadth-first renumbering that places every pair of siblings side by side
+            order = [0]
+            left = []
+            for node in order:
+                if children_left[node] == -1:
+                    left.append(len(left))
+                else:
+                    left.append(len(order))
+                    order.extend((children_left[node], children_right[node]))
+            order = np.array(order, dtype=np.int64)
+            is_leaf = children_left[order] == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature[order]))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+            lefts.append(np.array(left, dtype=np.int64) + offset)
+            # Same per-node values DecisionTreeClassifier.predict_proba returns
+            values.append(tree.value[order, 0, :model.n_classes_])
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        # scikit-learn compares float32 inputs against float64 thresholds. For a
+        # float32 x, x <= t holds exactly when x <= t rounded down to float32,
+        # so the whole walk can stay in float32.
+        threshold = np.concatenate(thresholds)
+        threshold32 = threshold.astype(np.float32)
+        rounded_up = threshold32.astype(np.float64) > threshold
+        threshold32[rounded_up] = np.nextafter(threshold32[rounded_up], np.float32(-np.inf))
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=threshold32,
+            left=np.concatenate(lefts).astype(np.int32),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load node arrays exported with save()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature=data['feature'],
+                threshold=data['threshold'],
+                left=data['left'],
+                value=data['value'],
+                roots=data['roots'],
+                # Labels are stored as fixed-width strings, the model uses object arrays
+                classes=data['classes'].astype(object),
+                max_depth=int(data['max_depth'])
+            )
+
+    def save(self, path):
+        """Export the node arrays to an uncompressed .npz file."""
+        np.savez(
+            path,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            value=self.value,
+            roots=self.roots,
+            classes=self.classes_.astype(str),
+            max_depth=np.int64(self.max_depth)
+        )
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_trees, n_samples)."""
+        X = np.asarray(X, dtype=np.float32)
+        if not np.isfinite(X).all():
+            # scikit-learn rejects these too; an infinite value would also escape a leaf
+            raise ValueError("Input contains NaN or infinity or a value too large for float32")
+
+        n_samples, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = (np.arange(n_samples, dtype=np.int32) * n_features)[np.newaxis, :]
+
+        nodes = np.repeat(self.roots[:, np.newaxis], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            go_right = flat[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.left[nodes] + go_right
+        return nodes
+
+    def predict_proba(self, X):
+        """Mean class probabilities over all trees, like RandomForestClassifier.predict_proba."""
+        leaves = self.apply(X)
+
+        # Both branches add the trees one after another in estimator order, which
+        # reproduces scikit-learn's accumulation bit for bit
+        if leaves.shape[1] <= self.VECTOR_SUM_MAX_ROWS:
+            proba = self.value[leaves].sum(axis=0)
+        else:
+            proba = np.zeros((leaves.shape[1], self.value.shape[1]), dtype=np.float64)
+            for tree_leaves in leaves:
+                proba += self.value[tree_leaves]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        """Predict class labels, like RandomForestClassifier.predict."""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def verification_corpus(self, n_samples=2000, seed=0):
+        """Build a deterministic test corpus that exercises every split threshold.
+
+        Half of the values sit exactly on split thresholds (the <= boundary), the
+        rest are drawn uniformly across each feature's threshold range.
+        """
+        rng = np.random.default_rng(seed)
+        n_features = int(self.feature.max()) + 1
+        is_split = np.isfinite(self.threshold)
+
+        X = np.empty((n_samples, n_features), dtype=np.float64)
+        for j in range(n_features):
+            cuts = self.threshold[is_split & (self.feature == j)].astype(np.float64)
+            if len(cuts) == 0:
+                cuts = np.zeros(1)
+            low, high = cuts.min(), cuts.max()
+            margin = (high - low) * 0.1 + 1.0
+            X[:, j] = rng.uniform(low - margin, high + margin, n_samples)
+            on_threshold = rng.random(n_samples) < 0.5
+            X[on_threshold, j] = rng.choice(cuts, on_threshold.sum())
+        return X
+
+    def verify(self, model, X=None):
+        """Check bit-for-bit agreement with the scikit-learn model on a corpus.
+
+        Both the single-call summation (small batches) and the per-tree
+        accumulation (large batches) are checked. Returns True when
+        probabilities and labels are identical.
+        """
+        if X is None:
+            X = self.verification_corpus()
+
+        # Wrap with feature names when the model was fitted on a DataFrame
+        frame = X
+        if hasattr(model, 'feature_names_in_'):
+            import pandas as pd
+            frame = pd.DataFrame(X, columns=model.feature_names_in_)
+
+        expected_proba = model.predict_proba(frame)
+        expected_labels = model.predict(frame)
+
+        small = self.VECTOR_SUM_MAX_ROWS
+        proba = np.concatenate([self.predict_proba(X[:small]), self.predict_proba(X)[small:]])
+        labels = self.classes_.take(np.argmax(proba, axis=1), axis=0)
+
+        proba_equal = np.array_equal(proba, expected_proba)
+        labels_equal = np.array_equal(labels, expected_labels)
+        if not (proba_equal and labels_equal):
+            mismatches = int(np.sum(labels != expected_labels))
+            logger.error(f"Compiled forest disagrees with the model on {mismatches} of {len(X)} rows "
+                         f"(probabilities identical: {proba_equal})")
+        return proba_equal and labels_equal
+
+
+def compiled_forest_path(model_path, model_version):
+    """Path of the exported node arrays for a model file.
+
+    The name carries the model version (file name and content hash), so an
+    export always belongs to exactly the model bytes it was built from.
+    """
+    return os.path.join(os.path.dirname(model_path), f"{model_version}.npz")
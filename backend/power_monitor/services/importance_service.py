@@ -0,0 +1,186 @@
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from .cache_service import CacheService
+from .classification_store import ClassificationStore
+from .document_store import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+class FeatureImportanceService:
+    """Mergeable SHAP feature importance aggregates per node-day.
+
+    Each node-day is explained once: the aggregate holds the sum of |SHAP|
+    per model class and feature over the day's anomalies ('rows' of them),
+    the number of explained rows and the predicted anomaly type counts. Sums
+    and counts add up, so the importance of any set of nodes and days is an
+    O(days) merge instead of a fresh SHAP run. Days with more than
+    max_rows_per_day anomalies are explained on an evenly spaced
+    (deterministic) sample whose sums are scaled up to all of the day's
+    anomalies, so busy days keep their weight in the merge.
+
+    Aggregates of past days are persisted per model version, computed from a
+    fresh fetch (the request cache may hold a partial copy of the day); the
+    current day is still receiving data and is only cached briefly. Days that
+    failed to load or have no anomalies are never persisted, so late uploads
+    are picked up.
+    """
+
+    # Explain at most this many anomalies per node-day (evenly spaced, deterministic)
+    MAX_ROWS_PER_DAY = 2000
+    # Cache lifetime of aggregates for the current, still growing day
+    OPEN_DAY_TTL = 300
+
+    def __init__(self, resolver, max_rows_per_day=None):
+        """Initialize with a ReadingResolver supplying detected node-day readings."""
+        self.resolver = resolver
+        self.max_rows_per_day = max_rows_per_day or self.MAX_ROWS_PER_DAY
+        self._documents = DocumentStore('feature_importance')
+
+    def _document_id(self, node, year, month, day, model_version):
+        return f"{node}_{year}_{month}_{day}@{model_version}"
+
+    def compute_day(self, node, year, month, day, explainer, fresh=False):
+        """Explain the anomalies of one node-day and sum their |SHAP| values.
+
+        With fresh the day is fetched past the request cache, and a failed
+        fetch raises instead of looking like an empty day.
+        """
+        classifier = explainer.classifier
+        if fresh:
+            readings = self.resolver.get_day(node, year, month, day, use_cache=False, raise_errors=True)
+        else:
+            readings = self.resolver.get_day(node, year, month, day)
+        anomalies = [r for r in readings if r['is_anomaly']]
+        ClassificationStore().apply(anomalies, classifier=classifier)
+
+        features, positions = classifier.feature_matrix(anomalies)
+        class_counts = {}
+        for i in positions:
+            anomaly_type = anomalies[i]['anomaly_type']
+            class_counts[anomaly_type] = class_counts.get(anomaly_type, 0) + 1
+
+        if len(positions) > self.max_rows_per_day:
+            picks = np.unique(np.linspace(0, len(positions) - 1, self.max_rows_per_day).round().astype(int))
+            features = features[picks]
+
+        n_classes = len(classifier.model.classes_)
+        abs_shap_sum = np.zeros((n_classes, len(classifier.features)))
+        if positions:
+            # Scale the sample's sums up to every anomaly of the day
+            abs_shap_sum = explainer.abs_shap_sum(features) * (len(positions) / len(features))
+
+        return {
+            'rows': len(positions),
+            'explained': len(features),
+            'abs_shap_sum': abs_shap_sum.tolist(),
+            'class_counts': class_counts
+        }
+
+    def get_day(self, node, year, month, day, explainer):
+        """Get the aggregate of one node-day from cache or MongoDB, computing it on a miss."""
+        model_version = explainer.classifier.model_version
+        namespace = f"importance@{model_version}"
+        cache = CacheService()
+
+        aggregate = cache.get(node, year, month, day, namespace=namespace)
+        if aggregate is not None:
+            return aggregate
+
+        document_id = self._document_id(node, year, month, day, model_version)
+        document = self._documents.find(document_id)
+        # Documents without 'explained' stored a subsample as if it were the whole day
+        if document and 'explained' in document:
+            aggregate = {key: document[key] for key in ('rows', 'explained', 'abs_shap_sum', 'class_counts')}
+            cache.set(node, year, month, day, aggregate, namespace=namespace)
+            return aggregate
+
+        closed = date(int(year), int(month), int(day)) < date.today()
+        try:
+            aggregate = self.compute_day(node, year, month, day, explainer, fresh=closed)
+        except Exception as e:
+            logger.warning(f"Skipping importance of {node} {year}-{month}-{day}, fetch failed: {str(e)}")
+            return self.empty_aggregate(explainer)
+
+        # Only complete, non-empty closed days are final
+        final = closed and aggregate['rows'] > 0
+        if final:
+            self._documents.update(document_id, aggregate, {
+                'node': node, 'year': year, 'month': month, 'day': day, 'model_version': model_version
+            })
+        cache.set(node, year, month, day, aggregate, ttl=None if final else self.OPEN_DAY_TTL, namespace=namespace)
+        return aggregate
+
+    def empty_aggregate(self, explainer):
+        """Aggregate of a node-day without explained rows."""
+        classifier = explainer.classifier
+        return {
+            'rows': 0,
+            'explained': 0,
+            'abs_shap_sum': np.zeros((len(classifier.model.classes_), len(classifier.features))).tolist(),
+            'class_counts': {}
+        }
+
+    def merge(self, aggregates):
+        """Add up node-day aggregates."""
+        merged = {'rows': 0, 'explained': 0, 'abs_shap_sum': None, 'class_counts': {}}
+        for aggregate in aggregates:
+            merged['rows'] += aggregate['rows']
+            merged['explained'] += aggregate['explained']
+            abs_shap_sum = np.asarray(aggregate['abs_shap_sum'], dtype=np.float64)
+            merged['abs_shap_sum'] = abs_shap_sum if merged['abs_shap_sum'] is None else merged['abs_shap_sum'] + abs_shap_sum
+            for anomaly_type, count in aggregate['class_counts'].items():
+                merged['class_counts'][anomaly_type] = merged['class_counts'].get(anomaly_type, 0) + count
+        return merged
+
+    def get_importance(self, nodes, start_date, end_date, explainer, progress=None):
+        """Global and per anomaly type importance for nodes over [start_date, end_date] (YYYY-MM-DD).
+
+        Returns the same payload as ShapExplainerService.generate_global_feature_importance
+        (mean |SHAP| per feature, overall and per class), or None without any anomalies.
+        progress(done, total, message), if given, is called after every node-day.
+        """
+        if not isinstance(nodes, list) or not nodes or not all(isinstance(node, str) and node for node in nodes):
+            raise ValueError("nodes must be a non-empty list of node names")
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        if end < start:
+            raise ValueError("end_date must not be before start_date")
+        if (end - start).days + 1 > self.resolver.MAX_DAYS:
+            raise ValueError(f"Date range is limited to {self.resolver.MAX_DAYS} days")
+
+        total = len(nodes) * ((end - start).days + 1)
+        aggregates = []
+        for node in nodes:
+            current = start
+            while current <= end:
+                aggregates.append(self.get_day(
+                    node, str(current.year), str(current.month).zfill(2), str(current.day).zfill(2), explainer
+                ))
+                current += timedelta(days=1)
+                if progress:
+                    progress(len(aggregates), total, f"Merged {node} {current.date() - timedelta(days=1)}")
+
+        merged = self.merge(aggregates)
+        if not merged['rows']:
+            return None
+
+        classifier = explainer.classifier
+        class_importance = merged['abs_shap_sum'] / merged['rows']
+        return {
+            'feature_names': classifier.features,
+            'importance_values': class_importance.mean(axis=0).tolist(),
+            'sample_size': merged['explained'],
+            'anomalies': merged['rows'],
+            'min_features': 8,  # We know from compacity analysis that 8 features give 90% explanation
+            'anomaly_types': {
+                str(anomaly_class): dict(zip(classifier.features, class_importance[i].tolist()))
+                for i, anomaly_class in enumerate(classifier.model.classes_)
+            },
+            'class_counts': merged['class_counts'],
+            'nodes': list(nodes),
+            'days': len(aggregates) // max(1, len(nodes)),
+            'model_version': classifier.model_version
+        }
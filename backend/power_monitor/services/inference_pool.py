@@ -0,0 +1,156 @@
+import logging
+import math
+import os
+
+import numpy as np
+from joblib import Parallel, delayed, load
+
+logger = logging.getLogger(__name__)
+
+# Per worker process: the model and SHAP explainer of the version last used
+_worker_state = {}
+
+
+def _worker_model(model_path, model_version):
+    """Load the model once per worker process and model version.
+
+    The model is loaded with mmap_mode='r', so its arrays are mapped from the
+    page cache rather than read into every worker.
+    """
+    if _worker_state.get('key') != (model_path, model_version):
+        from .classifier_service import model_file_version
+        if model_file_version(model_path) != model_version:
+            # The file was replaced after the caller loaded its copy
+            raise RuntimeError(f"{model_path} no longer holds model {model_version}")
+        _worker_state.clear()
+        _worker_state['key'] = (model_path, model_version)
+        _worker_state['model'] = load(model_path, mmap_mode='r')
+    return _worker_state['model']
+
+
+def _predict_rows(model_path, model_version, features, matrix, start, stop, method='predict'):
+    """Worker task: predict (or predict_proba) one chunk of a (memory-mapped) feature matrix."""
+    import pandas as pd
+    model = _worker_model(model_path, model_version)
+    return getattr(model, method)(pd.DataFrame(matrix[start:stop], columns=features))
+
+
+def stack_shap_values(shap_values):
+    """SHAP values in any TreeExplainer output format as one (classes, rows, features) array."""
+    if isinstance(shap_values, list):
+        return np.stack(shap_values)
+    return np.moveaxis(shap_values, -1, 0) if shap_values.ndim == 3 else shap_values[np.newaxis]
+
+
+def abs_shap_chunk_sums(explainer, matrix, start, stop, chunk_rows):
+    """Sum of |SHAP| per class and feature for each chunk_rows block of matrix[start:stop].
+
+    Blocks start at multiples of chunk_rows, so the same rows always form the
+    same blocks no matter how a job is split over processes.
+
+    Returns:
+        Array of shape (blocks, classes, features)
+    """
+    sums = []
+    for block_start in range(start, stop, chunk_rows):
+        values = stack_shap_values(explainer.shap_values(matrix[block_start:min(block_start + chunk_rows, stop)]))
+        sums.append(np.abs(values).sum(axis=1))
+    return np.stack(sums)
+
+
+def reduce_chunk_sums(chunk_sums):
+    """Add up per-block sums one block after another, in row order (deterministic)."""
+    total = np.zeros(chunk_sums.shape[1:])
+    for block in chunk_sums:
+        total += block
+    return total
+
+
+def _worker_explainer(model_path, model_version):
+    """SHAP TreeExplainer of the worker's model, built once per model version."""
+    model = _worker_model(model_path, model_version)
+    if 'explainer' not in _worker_state:
+        import shap
+        _worker_state['explainer'] = shap.TreeExplainer(model)
+    return _worker_state['explainer']
+
+
+def _shap_rows(model_path, model_version, matrix, start, stop):
+    """Worker task: SHAP values of one chunk, shape (classes, rows, features)."""
+    return stack_shap_values(_worker_explainer(model_path, model_version).shap_values(matrix[start:stop]))
+
+
+def _abs_shap_sum_rows(model_path, model_version, matrix, start, stop, chunk_rows):
+    """Worker task: per-block |SHAP| sums of one chunk (see abs_shap_chunk_sums)."""
+    return abs_shap_chunk_sums(_worker_explainer(model_path, model_version), matrix, start, stop, chunk_rows)
+
+
+class InferencePool:
+    """Runs large classification and SHAP jobs on a pool of worker processes.
+
+    Workers are joblib's reusable loky processes. A job is split into
+    contiguous row chunks; feature matrices above max_nbytes are handed to the
+    workers as read-only memory maps instead of being pickled, and results come
+    back in chunk order, so the reassembled output matches a single-process run.
+    """
+
+    def __init__(self, n_jobs, min_rows=50000, min_shap_rows=1000, chunks_per_worker=4, max_nbytes='1M'):
+        """Initialize the pool settings (workers start on first use)."""
+        self.n_jobs = os.cpu_count() if n_jobs < 0 else n_jobs
+        self.min_rows = min_rows
+        self.min_shap_rows = min_shap_rows
+        self.chunks_per_worker = chunks_per_worker
+        self.max_nbytes = max_nbytes
+
+    @classmethod
+    def from_settings(cls):
+        """Build the pool configured in settings, or None if process-pool inference is disabled."""
+        from django.conf import settings
+        n_jobs = getattr(settings, 'ML_PROCESS_POOL_WORKERS', 0)
+        if not n_jobs or n_jobs == 1:
+            return None
+        return cls(
+            n_jobs,
+            min_rows=getattr(settings, 'ML_PROCESS_POOL_MIN_ROWS', 50000),
+            min_shap_rows=getattr(settings, 'ML_PROCESS_POOL_MIN_SHAP_ROWS', 1000)
+        )
+
+    def chunk_bounds(self, n_rows, align=1):
+        """Split n_rows into contiguous (start, stop) chunks, a few per worker for load balancing.
+
+        Chunk starts are multiples of align.
+        """
+        n_chunks = max(1, min(n_rows, self.n_jobs * self.chunks_per_worker))
+        size = math.ceil(math.ceil(n_rows / n_chunks) / align) * align
+        return [(start, min(start + size, n_rows)) for start in range(0, n_rows, size)]
+
+    def _run(self, task, *args, matrix, align=1, **kwargs):
+        parallel = Parallel(n_jobs=self.n_jobs, backend='loky', max_nbytes=self.max_nbytes, mmap_mode='r')
+        return parallel(
+            delayed(task)(*args, matrix, start, stop, **kwargs)
+            for start, stop in self.chunk_bounds(len(matrix), align)
+        )
+
+    def predict(self, model_path, model_version, features, matrix):
+        """Predict every row of matrix with the workers, in row order."""
+        return np.concatenate(self._run(_predict_rows, model_path, model_version, list(features), matrix=matrix))
+
+    def predict_proba(self, model_path, model_version, features, matrix):
+        """Class probabilities of every row of matrix with the workers, in row order."""
+        return np.concatenate(self._run(
+            _predict_rows, model_path, model_version, list(features), matrix=matrix, method='predict_proba'
+        ))
+
+    def shap_values(self, model_path, model_version, matrix):
+        """SHAP values of every row of matrix as a per-class list, like TreeExplainer.shap_values."""
+        stacked = np.concatenate(self._run(_shap_rows, model_path, model_version, matrix=matrix), axis=1)
+        return list(stacked)
+
+    def abs_shap_chunk_sums(self, model_path, model_version, matrix, chunk_rows):
+        """Per-block |SHAP| sums of matrix computed by the workers, identical to abs_shap_chunk_sums in-process.
+
+        Only the small (classes, features) sums travel back from the workers.
+        """
+        return np.concatenate(self._run(
+            _abs_shap_sum_rows, model_path, model_version, matrix=matrix, align=chunk_rows, chunk_rows=chunk_rows
+        ))
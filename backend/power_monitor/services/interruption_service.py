@@ -0,0 +1,160 @@
+import calendar
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .cache_service import CacheService
+
+# Voltage below which the supply counts as interrupted, and the shortest interruption reported
+VOLTAGE_THRESHOLD = 180
+MIN_DURATION_SEC = 30
+
+
+def find_runs(epoch, voltage, threshold=VOLTAGE_THRESHOLD):
+    """Find the runs of readings below threshold in time-ordered epoch/voltage columns.
+
+    A run starts at its first low reading and ends at the first reading back
+    above threshold; a run still low at the last reading ends there and is
+    ongoing. Short runs are kept so runs split across days can be merged first.
+
+    Returns:
+        Float array of shape (runs, 4): start epoch, end epoch, minimum voltage, ongoing (0/1)
+    """
+    low = voltage < threshold
+    if not low.any():
+        return np.empty((0, 4))
+
+    edges = np.diff(np.concatenate(([False], low, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)  # Index of the first reading after each run
+    ongoing = stops == len(voltage)
+    ends = epoch[np.where(ongoing, len(voltage) - 1, stops)]
+    # Minimum inside each run: reduce over [start, stop) segments, skipping the gaps between runs
+    padded = np.append(voltage, np.inf)
+    minimums = np.minimum.reduceat(padded, np.ravel(np.column_stack((starts, stops))))[::2]
+    return np.column_stack((epoch[starts], ends, minimums, ongoing)).astype(np.float64)
+
+
+def day_runs(epoch, voltage, threshold=VOLTAGE_THRESHOLD):
+    """Runs of one day's time-ordered columns, with what merge_day_runs needs to join days.
+
+    Returns:
+        Dict with runs (see find_runs), first_epoch (None without readings),
+        first_low, and the count and last_epoch of the readings they came from
+    """
+    return {
+        'runs': find_runs(epoch, voltage, threshold),
+        'first_epoch': int(epoch[0]) if len(epoch) else None,
+        'first_low': bool(len(epoch) and voltage[0] < threshold),
+        'count': len(epoch),
+        'last_epoch': int(epoch[-1]) if len(epoch) else None
+    }
+
+
+def merge_day_runs(days):
+    """Join the runs of consecutive days into one time-ordered run array.
+
+    Args:
+        days: Time-ordered list of (runs, first_epoch, first_low) per day with data,
+            where first_low tells whether the day's first reading is below threshold
+
+    A run ongoing at the end of a day continues into the next day's first run
+    if that day starts low, and otherwise ends at the next day's first reading.
+    """
+    merged = []
+    for runs, first_epoch, first_low in days:
+        runs = [list(run) for run in runs]
+        if merged and merged[-1][3]:
+            previous = merged[-1]
+            if first_low and runs:
+                run = runs.pop(0)
+                previous[1], previous[2], previous[3] = run[1], min(previous[2], run[2]), run[3]
+            else:
+                previous[1], previous[3] = first_epoch, 0.0
+        merged.extend(runs)
+    return np.array(merged, dtype=np.float64).reshape(-1, 4)
+
+
+def _isoformat(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def summarize_runs(runs, min_duration_sec=MIN_DURATION_SEC):
+    """Turn runs into the interruption summary served by the dashboard.
+
+    Runs shorter than min_duration_sec are dropped. Details carry start, end
+    (ISO), duration_sec, min_voltage, severity and ongoing.
+    """
+    details = []
+    for start, end, min_voltage, ongoing in runs:
+        duration_sec = float(end - start)
+        if duration_sec < min_duration_sec:
+            continue
+        details.append({
+            'start': _isoformat(start),
+            'end': _isoformat(end),
+            'duration_sec': duration_sec,
+            'min_voltage': round(float(min_voltage), 1),
+            'severity': 'critical' if min_voltage < 100 else 'major' if min_voltage < 150 else 'minor',
+            'ongoing': bool(ongoing)
+        })
+
+    count = len(details)
+    total_duration_sec = sum(d['duration_sec'] for d in details)
+    return {
+        'count': count,
+        'total_duration_sec': total_duration_sec,
+        'avg_duration_min': round(total_duration_sec / count / 60, 1) if count > 0 else 0,
+        'details': details
+    }
+
+
+class InterruptionService:
+    """Service for detecting power interruptions on unsampled epoch/voltage columns."""
+
+    def __init__(self, voltage_threshold=VOLTAGE_THRESHOLD, min_duration_sec=MIN_DURATION_SEC):
+        """Initialize with the interruption voltage threshold and the shortest interruption reported."""
+        self.voltage_threshold = voltage_threshold
+        self.min_duration_sec = min_duration_sec
+
+    def get_day_runs(self, node, year, month, day, epoch, voltage, use_cache=True):
+        """Get the runs of one node-day, computing and caching them on a miss.
+
+        A cached entry is only reused while the day still has the same number
+        of readings and the same last reading, so a growing current day is
+        recomputed.
+        """
+        cache = CacheService() if use_cache else None
+        if use_cache:
+            cached = cache.get(node, year, month, day, namespace='interruptions')
+            if (cached is not None and cached['count'] == len(epoch)
+                    and cached['last_epoch'] == (int(epoch[-1]) if len(epoch) else None)):
+                return cached
+
+        runs = day_runs(epoch, voltage, self.voltage_threshold)
+
+        if use_cache:
+            cache.set(node, year, month, day, runs, namespace='interruptions')
+        return runs
+
+    def detect(self, node, days, columns, use_cache=True):
+        """Detect the interruptions of consecutive node-days.
+
+        Args:
+            node: Node the readings belong to
+            days: Time-ordered list of (year, month, day) strings
+            columns: Time-ordered columns of all the days' readings (see readings_to_columns)
+
+        Returns:
+            Interruption summary (see summarize_runs), with runs joined across midnight
+        """
+        epoch = columns['epoch']
+        day_starts = [calendar.timegm((int(y), int(m), int(d), 0, 0, 0)) for y, m, d in days]
+        bounds = np.searchsorted(epoch, day_starts + [day_starts[-1] + 86400]) if days else []
+
+        per_day = []
+        for (year, month, day), start, stop in zip(days, bounds[:-1], bounds[1:]):
+            runs = self.get_day_runs(node, year, month, day, epoch[start:stop], columns['voltage'][start:stop], use_cache)
+            if runs['first_epoch'] is not None:
+                per_day.append((runs['runs'], runs['first_epoch'], runs['first_low']))
+        return summarize_runs(merge_day_runs(per_day), self.min_duration_sec)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation was requested."""
+
+
+class Job:
+    """One background computation with progress, cancellation and a result."""
+
+    def __init__(self, kind, params, key, model_version=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.key = key
+        self.model_version = model_version
+        self.state = 'queued'  # queued, running, succeeded, failed, cancelled
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    def set_progress(self, done, total, message=''):
+        """Report progress from inside the job; raises JobCancelled if the job was cancelled."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.progress = round(done / total, 4) if total else 1.0
+        if message:
+            self.message = message
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def finished(self):
+        return self.state in ('succeeded', 'failed', 'cancelled')
+
+    def to_dict(self):
+        """Describe the job without its result."""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'model_version': self.model_version,
+            'state': self.state,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobQueue:
+    """In-process queue for long-running analytics, run on a small thread pool.
+
+    Handlers are registered per job kind and called as handler(job, params).
+    Submitting the same kind and parameters for the same model version again
+    returns the queued, running or finished job instead of starting a new one.
+    Finished jobs and their results are kept in memory for result_ttl seconds,
+    or until another model version is swapped in (see drop_finished).
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls):
+        """Ensures only one instance of JobQueue exists."""
+        if cls._instance is None:
+            cls._instance = super(JobQueue, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        """Initialize the queue (worker threads start on first submit)."""
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._jobs = {}
+        self._jobs_by_key = {}
+        self.max_workers = getattr(settings, 'ML_JOB_WORKERS', 2)
+        self.result_ttl = getattr(settings, 'ML_JOB_RESULT_TTL', 3600)
+        self._executor = None
+
+    def register(self, kind, handler):
+        """Register the handler(job, params) for a job kind."""
+        self._handlers[kind] = handler
+
+    def job_key(self, kind, params, model_version=None):
+        """Deduplication key: the job kind, model version and a digest of its canonical JSON parameters."""
+        canonical = json.dumps(params, sort_keys=True, default=str)
+        return f"{kind}@{model_version}:{hashlib.sha1(canonical.encode()).hexdigest()}"
+
+    def submit(self, kind, params, model_version=None):
+        """Queue a job, or return the existing job for identical parameters and model version.
+
+        Returns:
+            Tuple of (job, deduplicated)
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        key = self.job_key(kind, params, model_version)
+        with self._lock:
+            self._purge_expired()
+            existing = self._jobs_by_key.get(key)
+            if existing is not None and existing.state not in ('failed', 'cancelled'):
+                return existing, True
+
+            job = Job(kind, params, key, model_version)
+            self._jobs[job.id] = job
+            self._jobs_by_key[key] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analytics-job')
+            self._executor.submit(self._run, job)
+        return job, False
+
+    def _run(self, job):
+        """Worker thread: run one job and record its outcome."""
+        if job._cancel.is_set():
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            return
+
+        job.state = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = self._handlers[job.kind](job, job.params)
+            job.progress = 1.0
+            job.state = 'succeeded'
+        except JobCancelled:
+            job.state = 'cancelled'
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            job.error = str(e)
+            job.state = 'failed'
+        job.finished_at = time.time()
+        logger.info(f"Job {job.id} ({job.kind}) {job.state} after {round(job.finished_at - job.started_at, 3)}s")
+
+    def get(self, job_id):
+        """Get a job by id, or None if it is unknown or expired."""
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs never start, running jobs stop at their next progress report."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if not job.finished:
+            job._cancel.set()
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+        return job
+
+    def drop_finished(self, old_version=None, new_version=None):
+        """Drop finished jobs computed for another model version.
+
+        Registered as a model swap listener: their results describe the old
+        model and must not be served any more.
+        """
+        with self._lock:
+            stale = [job for job in self._jobs.values() if job.finished and job.model_version != new_version]
+            for job in stale:
+                del self._jobs[job.id]
+                if self._jobs_by_key.get(job.key) is job:
+                    del self._jobs_by_key[job.key]
+        if stale:
+            logger.info(f"Dropped {len(stale)} finished jobs after the swap to model {new_version}")
+
+    def _purge_expired(self):
+        """Drop finished jobs older than result_ttl (caller holds the lock)."""
+        now = time.time()
+        expired = [job for job in self._jobs.values() if job.finished and now - job.finished_at > self.result_ttl]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._jobs_by_key.get(job.key) is job:
+                del self._jobs_by_key[job.key]
+
+    def get_stats(self):
+        """Count jobs by state."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+        return {'jobs': counts, 'workers': self.max_workers}
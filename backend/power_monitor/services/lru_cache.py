@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, capacity):
+        """Initialize an empty cache holding at most capacity entries."""
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        """Get the value for key (marking it recently used), or None on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._entries[key]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        """Store value for key, evicting the oldest entries beyond capacity."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._stats = {'hits': 0, 'misses': 0}
+
+    def get_stats(self):
+        """Get size and hit-rate statistics."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['capacity'] = self.capacity
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
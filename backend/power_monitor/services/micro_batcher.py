@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Coalesces small classification jobs from concurrent requests into one model call.
+
+    Callers submit a feature matrix and block until their labels are ready.
+    A background thread runs the handler once on the stacked matrix of the
+    waiting jobs and hands every caller its own slice of the result. A lone
+    job is run at once; jobs that queued up while the handler was busy show
+    concurrent load, so the thread keeps collecting for at most max_wait_ms or
+    until max_batch_rows rows are queued. Jobs of max_batch_rows rows or more
+    skip the queue.
+    """
+
+    # Seconds an idle batching thread lingers before exiting (it restarts on demand)
+    IDLE_TIMEOUT = 60
+
+    def __init__(self, handler, max_wait_ms=5, max_batch_rows=2048):
+        """Initialize with handler(matrix) -> list of one result per row."""
+        self.handler = handler
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_rows = 0
+        self._thread = None
+        self._stats = {'requests': 0, 'batches': 0, 'rows': 0, 'bypassed': 0}
+
+    def submit(self, matrix):
+        """Get the handler's results for matrix, batched with concurrent submissions."""
+        if len(matrix) == 0 or len(matrix) >= self.max_batch_rows:
+            with self._cond:
+                self._stats['bypassed'] += 1
+            return self.handler(matrix)
+
+        future = Future()
+        with self._cond:
+            self._pending.append((matrix, future))
+            self._pending_rows += len(matrix)
+            self._stats['requests'] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self):
+        """Wait for jobs and collect one batch, or return None after being idle."""
+        with self._cond:
+            if not self._pending and not self._cond.wait_for(lambda: self._pending, self.IDLE_TIMEOUT):
+                # Exit while still holding the lock so submit() sees a dead thread
+                self._thread = None
+                return None
+
+            # Only wait for more work under concurrent load, a lone request is not delayed
+            deadline = time.monotonic() + (self.max_wait if len(self._pending) > 1 else 0)
+            while self._pending_rows < self.max_batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Take whole jobs up to the row cap (always at least one)
+            batch, rows = [], 0
+            while self._pending and (not batch or rows + len(self._pending[0][0]) <= self.max_batch_rows):
+                matrix, future = self._pending.pop(0)
+                batch.append((matrix, future))
+                rows += len(matrix)
+            self._pending_rows -= rows
+            self._stats['batches'] += 1
+            self._stats['rows'] += rows
+            return batch
+
+    def _run(self):
+        """Batching thread: one handler call per collected batch."""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                results = self.handler(np.concatenate([matrix for matrix, _ in batch]))
+            except Exception as e:
+                logger.error(f"Error in micro-batched classification: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for matrix, future in batch:
+                future.set_result(results[offset:offset + len(matrix)])
+                offset += len(matrix)
+
+    def get_stats(self):
+        """Get request, batch and row counts of the batcher."""
+        with self._cond:
+            stats = dict(self._stats)
+        stats['avg_requests_per_batch'] = round(stats['requests'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['max_wait_ms'] = self.max_wait * 1000.0
+        stats['max_batch_rows'] = self.max_batch_rows
+        return stats
@@ -0,0 +1,317 @@
+import logging
+import os
+import threading
+import time
+import traceback
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class ModelNotReady(Exception):
+    """Raised when a model-backed service is requested before it finished loading."""
+
+    def __init__(self, component, state, retry_after, error=None):
+        self.component = component
+        self.state = state
+        self.retry_after = retry_after
+        self.error = error
+        super().__init__(f"{component} is {state}")
+
+
+class ModelRegistry:
+    """Lazily loads the anomaly classifier and SHAP explainer off the request path.
+
+    Nothing heavy (pandas, scikit-learn, shap, the pickled forest) is imported
+    until the first warm_up() call. Loading runs in a background thread: the
+    classifier becomes available first, the explainer once its TreeExplainer
+    is built. Callers that need a component before it is ready get a
+    ModelNotReady exception and can answer 503 with Retry-After.
+
+    Once loaded, a new model file can be rolled out without a restart: reload()
+    (called by the file watcher or an admin) builds and validates a new
+    classifier and explainer in the background while the current pair keeps
+    serving, then swaps both in at once and notifies the swap listeners.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls):
+        """Ensures only one instance of ModelRegistry exists."""
+        if cls._instance is None:
+            cls._instance = super(ModelRegistry, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        """Initialize the registry state."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._classifier = None
+        self._explainer = None
+        self._state = {'classifier': 'idle', 'explainer': 'idle'}
+        self._error = None
+        self._failed_at = None
+        self._timings = {}
+        self._classifier_ready = threading.Event()
+        self._explainer_ready = threading.Event()
+        self.retry_after = getattr(settings, 'ML_RETRY_AFTER_SECONDS', 5)
+        self.retry_backoff = 60  # Seconds before a failed load is retried
+
+        # Versioning and hot reload
+        self.model_path = None
+        self._version = None
+        self._loaded_at = None
+        self._reload_state = 'idle'
+        self._reload_error = None
+        self._history = []
+        self._swap_listeners = []
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def get_model_path(self):
+        """Path of the model file the registry serves and watches."""
+        if self.model_path is None:
+            self.model_path = getattr(settings, 'ML_MODEL_PATH', None) or os.path.join(
+                settings.BASE_DIR, 'ml_model', 'random_forest_model.joblib'
+            )
+        return self.model_path
+
+    def warm_up(self, background=True):
+        """Start loading the models unless they are loaded or already loading."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if self._state['explainer'] == 'ready':
+                return False
+            # Back off after a failed load instead of retrying on every request
+            if self._failed_at is not None and time.time() - self._failed_at < self.retry_backoff:
+                return False
+
+            self._error = None
+            self._failed_at = None
+            self._state = {
+                'classifier': 'ready' if self._classifier is not None else 'loading',
+                'explainer': 'loading'
+            }
+            self._thread = threading.Thread(target=self._load, name='model-warm-up', daemon=True)
+
+        if background:
+            self._thread.start()
+        else:
+            self._thread.run()
+        return True
+
+    def _load(self):
+        """Load the classifier, then the explainer that shares its model."""
+        try:
+            if self._classifier is None:
+                started = time.time()
+                from .classifier_service import MLAnomalyClassifier
+                classifier = MLAnomalyClassifier(self.get_model_path())
+                classifier.validate_model()
+                with self._lock:
+                    self._classifier = classifier
+                    self._version = classifier.model_version
+                    self._loaded_at = time.time()
+                    self._history.append({'version': self._version, 'loaded_at': self._loaded_at})
+                    self._state['classifier'] = 'ready'
+                    self._timings['classifier_load_sec'] = round(time.time() - started, 3)
+                self._classifier_ready.set()
+                logger.info(f"Classifier {self._version} ready after {self._timings['classifier_load_sec']}s")
+
+            started = time.time()
+            from .shap_service import ShapExplainerService
+            explainer = ShapExplainerService(classifier=self._classifier)
+            with self._lock:
+                self._explainer = explainer
+                self._state['explainer'] = 'ready'
+                self._timings['explainer_load_sec'] = round(time.time() - started, 3)
+            self._explainer_ready.set()
+            logger.info(f"SHAP explainer ready after {self._timings['explainer_load_sec']}s")
+        except Exception as e:
+            logger.error(f"Error loading ML models: {str(e)}")
+            logger.error(traceback.format_exc())
+            with self._lock:
+                self._error = str(e)
+                self._failed_at = time.time()
+                for component, state in self._state.items():
+                    if state == 'loading':
+                        self._state[component] = 'failed'
+
+    def reload(self, background=True, force=False):
+        """Load the current model file as a new version and swap it in when it is valid.
+
+        Falls back to warm_up() if nothing was loaded yet. Returns False when a
+        load is already running or (unless force) the file content is the
+        version already being served.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            loaded = self._classifier is not None and self._explainer is not None
+
+        if not loaded:
+            return self.warm_up(background=background)
+
+        if not force:
+            from .classifier_service import model_file_version
+            try:
+                if model_file_version(self.get_model_path()) == self._version:
+                    return False
+            except OSError as e:
+                # Mid-deploy the file may be briefly missing; keep serving the current version
+                logger.warning(f"Cannot read model file for reload: {str(e)}")
+                return False
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._reload_state = 'loading'
+            self._reload_error = None
+            self._thread = threading.Thread(target=self._reload, name='model-reload', daemon=True)
+
+        if background:
+            self._thread.start()
+        else:
+            self._thread.run()
+        return True
+
+    def _reload(self):
+        """Build and validate a new classifier and explainer, then swap both in atomically."""
+        try:
+            started = time.time()
+            from .classifier_service import MLAnomalyClassifier
+            from .shap_service import ShapExplainerService
+            classifier = MLAnomalyClassifier(self.get_model_path())
+            classifier.validate_model()
+            explainer = ShapExplainerService(classifier=classifier)
+
+            with self._lock:
+                old_version = self._version
+                self._classifier = classifier
+                self._explainer = explainer
+                self._version = classifier.model_version
+                self._loaded_at = time.time()
+                self._history.append({'version': self._version, 'loaded_at': self._loaded_at})
+                self._reload_state = 'idle'
+                self._timings['reload_sec'] = round(time.time() - started, 3)
+                listeners = list(self._swap_listeners)
+            logger.info(f"Swapped model {old_version} for {self._version} after {self._timings['reload_sec']}s")
+        except Exception as e:
+            # The current version keeps serving
+            logger.error(f"Error reloading ML model: {str(e)}")
+            logger.error(traceback.format_exc())
+            with self._lock:
+                self._reload_state = 'failed'
+                self._reload_error = str(e)
+            return
+
+        for listener in listeners:
+            try:
+                listener(old_version, self._version)
+            except Exception as e:
+                logger.error(f"Error in model swap listener: {str(e)}")
+
+    def add_swap_listener(self, listener):
+        """Register listener(old_version, new_version), called after every model swap.
+
+        Used to invalidate caches whose content depends on the model version.
+        """
+        with self._lock:
+            if listener not in self._swap_listeners:
+                self._swap_listeners.append(listener)
+
+    def _file_signature(self):
+        """Cheap change marker for the model file: modification time and size."""
+        try:
+            stat = os.stat(self.get_model_path())
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def start_watcher(self, interval):
+        """Poll the model file every interval seconds and reload it when it changes."""
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return False
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, args=(interval,), name='model-watcher', daemon=True
+            )
+        self._watcher.start()
+        return True
+
+    def stop_watcher(self):
+        """Stop polling the model file."""
+        self._stop_watching.set()
+
+    def _watch(self, interval):
+        """Watcher loop; a changed file is retried until a reload could be started."""
+        seen = self._file_signature()
+        while not self._stop_watching.wait(interval):
+            signature = self._file_signature()
+            if signature is None or signature == seen:
+                continue
+            with self._lock:
+                busy = self._thread is not None and self._thread.is_alive()
+            if busy:
+                continue
+            seen = signature
+            if self.reload():
+                logger.info(f"Model file changed, reloading {self.get_model_path()}")
+
+    def _get(self, component, value, ready_event, timeout):
+        """Return a loaded component, optionally waiting for it."""
+        if value is not None:
+            return value
+
+        # First use triggers loading (or a retry after a failure)
+        self.warm_up()
+        if timeout and ready_event.wait(timeout):
+            return self._classifier if component == 'classifier' else self._explainer
+
+        with self._lock:
+            raise ModelNotReady(component, self._state[component], self.retry_after, self._error)
+
+    def get_classifier(self, timeout=None):
+        """Get the anomaly classifier or raise ModelNotReady."""
+        return self._get('classifier', self._classifier, self._classifier_ready, timeout)
+
+    def get_explainer(self, timeout=None):
+        """Get the SHAP explainer service or raise ModelNotReady."""
+        return self._get('explainer', self._explainer, self._explainer_ready, timeout)
+
+    def get_version(self):
+        """Version of the model currently served, or None before the first load."""
+        return self._version
+
+    def is_ready(self, component='explainer'):
+        """Check whether a component finished loading."""
+        return self._state[component] == 'ready'
+
+    def status(self):
+        """Get the loading state of every component."""
+        with self._lock:
+            return {
+                'classifier': self._state['classifier'],
+                'explainer': self._state['explainer'],
+                'error': self._error,
+                'model_version': self._version,
+                'loaded_at': self._loaded_at,
+                'reload': self._reload_state,
+                'reload_error': self._reload_error,
+                'watching': self._watcher is not None and self._watcher.is_alive(),
+                'history': list(self._history),
+                **self._timings
+            }
+
+
+def warm_up_on_startup():
+    """Start the background model warm-up and file watcher for serving processes if enabled in settings."""
+    registry = ModelRegistry()
+    if getattr(settings, 'ML_WARMUP_ON_STARTUP', True):
+        registry.warm_up(background=True)
+
+    interval = getattr(settings, 'ML_MODEL_WATCH_INTERVAL', 0)
+    if interval:
+        registry.start_watcher(interval)
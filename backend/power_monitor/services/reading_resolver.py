@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+from .anomaly_service import AnomalyDetectionService
+from .classification_store import reading_day
+from .firebase_service import FirebaseService
+
+class ReadingResolver:
+    """Resolves compact reading references to the server's own reading dicts.
+
+    Clients can name readings by id or by node, date range and filters instead
+    of uploading complete reading dicts. Readings come from FirebaseService's
+    per node-day cache and get the server-side anomaly detection, so clients
+    can never send stale or modified copies.
+    """
+
+    # Longest date range a single reference may span
+    MAX_DAYS = 366
+
+    def __init__(self, firebase_service=None, anomaly_detector=None):
+        """Initialize with the data source and the threshold detector."""
+        self.firebase_service = firebase_service or FirebaseService()
+        self.anomaly_detector = anomaly_detector or AnomalyDetectionService()
+
+    @staticmethod
+    def has_reference(data):
+        """Check whether request data names readings by reference."""
+        return bool(data.get('reading_ids') or data.get('reading_id') or data.get('node'))
+
+    def get_day(self, node, year, month, day, use_cache=True, raise_errors=False):
+        """Get one node-day of readings with anomaly flags, oldest first.
+
+        Pass use_cache=False and raise_errors=True to get the complete stored
+        day or an exception (see FirebaseService.get_day_data).
+        """
+        readings = self.firebase_service.get_day_data(
+            node, year, month, day, use_cache=use_cache, raise_errors=raise_errors
+        )
+        detected = self.anomaly_detector.detect_anomalies(readings)
+        detected.reverse()  # get_day_data returns newest first
+        return detected
+
+    def resolve_ids(self, reading_ids):
+        """Resolve reading ids, fetching each node-day once.
+
+        Malformed ids are reported as not found, like ids of readings that do not exist.
+
+        Returns:
+            Tuple of (readings in request order, ids that could not be found)
+        """
+        days = {}
+        for reading_id in reading_ids:
+            key = reading_day(reading_id)
+            if key is not None and all(part.isdigit() for part in key[1:]):
+                days.setdefault(key, None)
+
+        by_id = {}
+        for key in days:
+            for reading in self.get_day(*key):
+                by_id[reading['id']] = reading
+
+        readings, missing = [], []
+        for reading_id in reading_ids:
+            if reading_id in by_id:
+                readings.append(by_id[reading_id])
+            else:
+                missing.append(reading_id)
+        return readings, missing
+
+    def resolve_range(self, node, start_date, end_date, anomaly_only=False, parameter=None, limit=None):
+        """Resolve every reading of a node in [start_date, end_date] (YYYY-MM-DD) that passes the filters.
+
+        Args:
+            anomaly_only: Keep only readings flagged by the threshold detector
+            parameter: Keep only readings anomalous in this parameter
+            limit: Maximum number of readings returned (oldest first)
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        if end < start:
+            raise ValueError("end_date must not be before start_date")
+        if (end - start).days + 1 > self.MAX_DAYS:
+            raise ValueError(f"Date range is limited to {self.MAX_DAYS} days")
+
+        readings = []
+        current = start
+        while current <= end:
+            day_readings = self.get_day(node, str(current.year), str(current.month).zfill(2), str(current.day).zfill(2))
+            current += timedelta(days=1)
+
+            for reading in day_readings:
+                if anomaly_only and not reading['is_anomaly']:
+                    continue
+                if parameter and parameter not in reading['anomaly_parameters']:
+                    continue
+                readings.append(reading)
+                if limit and len(readings) >= limit:
+                    return readings
+        return readings
+
+    def resolve(self, data):
+        """Resolve the references in request data.
+
+        Accepts 'reading_ids' (list), 'reading_id' (single id) or 'node' with
+        'start_date', 'end_date' and the optional filters 'anomaly_only',
+        'parameter' and 'limit'. Raises ValueError for malformed references.
+
+        Returns:
+            Tuple of (readings, ids that could not be found)
+        """
+        reading_ids = data.get('reading_ids')
+        if data.get('reading_id'):
+            reading_ids = [data.get('reading_id')]
+        if reading_ids:
+            if not isinstance(reading_ids, list):
+                raise ValueError("reading_ids must be a list")
+            return self.resolve_ids([str(reading_id) for reading_id in reading_ids])
+
+        node = data.get('node')
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        if not node or not start_date or not end_date:
+            raise ValueError("Node, start_date, and end_date are required to reference a date range")
+
+        anomaly_only = str(data.get('anomaly_only', 'false')).lower() == 'true'
+        limit = data.get('limit')
+        readings = self.resolve_range(
+            node, start_date, end_date,
+            anomaly_only=anomaly_only,
+            parameter=data.get('parameter'),
+            limit=int(limit) if limit else None
+        )
+        return readings, []
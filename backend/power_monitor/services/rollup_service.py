@@ -0,0 +1,388 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+from .anomaly_service import AnomalyDetectionService
+from .column_service import PARAMETERS, epoch_seconds, readings_to_columns
+from .event_service import AnomalyEventService
+from .interruption_service import day_runs
+from .statistics_service import finalize_statistics, merge_statistics, partial_statistics, value_block
+from .lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Rollup tiers and their bucket widths in seconds
+TIERS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Per bucket and parameter: readings with a value, min, max, sum, sum of squares, anomalies
+FIELDS = ('n', 'min', 'max', 'sum', 'sumsq', 'anomalies')
+
+
+def rollup_columns(epoch, values, flags, anomalous, bucket_seconds):
+    """Aggregate time-ordered columns into buckets of bucket_seconds.
+
+    Args:
+        epoch: int64 epoch seconds per reading, sorted
+        values: float array (readings, parameters), NaN where missing
+        flags: bool array (readings, parameters), parameter outside its thresholds
+        anomalous: bool array per reading
+        bucket_seconds: Bucket width
+
+    Returns:
+        Dict of arrays: 'start' and 'count' and 'anomalies' per bucket, and
+        (buckets, parameters) arrays for every field in FIELDS
+    """
+    if not len(epoch):
+        return empty_rollup(values.shape[1])
+    buckets = epoch // bucket_seconds
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    return {
+        'start': buckets[starts] * bucket_seconds,
+        'count': np.diff(np.append(starts, len(epoch))),
+        'anomalies': np.add.reduceat(anomalous.astype(np.int64), starts),
+        'n': np.add.reduceat(present.astype(np.int64), starts, axis=0),
+        'min': np.fmin.reduceat(values, starts, axis=0),
+        'max': np.fmax.reduceat(values, starts, axis=0),
+        'sum': np.add.reduceat(filled, starts, axis=0),
+        'sumsq': np.add.reduceat(filled * filled, starts, axis=0),
+        'anomalies_by_parameter': np.add.reduceat(flags.astype(np.int64), starts, axis=0),
+    }
+
+
+def empty_rollup(n_parameters=len(PARAMETERS)):
+    """Rollup arrays without any bucket."""
+    rollup = {key: np.empty(0, dtype=np.int64) for key in ('start', 'count', 'anomalies')}
+    for field in ('n', 'anomalies_by_parameter'):
+        rollup[field] = np.empty((0, n_parameters), dtype=np.int64)
+    for field in ('min', 'max', 'sum', 'sumsq'):
+        rollup[field] = np.empty((0, n_parameters))
+    return rollup
+
+
+def coarsen(rollup, bucket_seconds):
+    """Merge the buckets of a (time-ordered) rollup into wider buckets of bucket_seconds."""
+    if not len(rollup['start']):
+        return {key: value.copy() for key, value in rollup.items()}
+    buckets = rollup['start'] // bucket_seconds
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    merged = {'start': buckets[starts] * bucket_seconds}
+    for key in ('count', 'anomalies', 'n', 'sum', 'sumsq', 'anomalies_by_parameter'):
+        merged[key] = np.add.reduceat(rollup[key], starts, axis=0)
+    merged['min'] = np.fmin.reduceat(rollup['min'], starts, axis=0)
+    merged['max'] = np.fmax.reduceat(rollup['max'], starts, axis=0)
+    return merged
+
+
+def concatenate(rollups):
+    """Join time-ordered rollups of consecutive days."""
+    rollups = [rollup for rollup in rollups if len(rollup['start'])]
+    if not rollups:
+        return empty_rollup()
+    return {key: np.concatenate([rollup[key] for rollup in rollups]) for key in rollups[0]}
+
+
+class RollupService:
+    """Materialized minute, hour and day rollups of every node-day.
+
+    A node-day is reduced once from its raw readings to count, min, max, sum,
+    sum of squares and anomaly counts per bucket and parameter for each tier,
+    plus a histogram sketch per parameter, the day's anomalous readings,
+    anomaly event counts, low-voltage runs and latest reading.
+    Rollups of closed days are built from a fresh fetch (the request cache may
+    hold a partial copy of the day) and written to ROLLUP_DIR as .npz files
+    (under a key of the schema version and detection thresholds) together with
+    the count and last epoch of their readings; they are rebuilt when readings
+    seen later show data they lack (see materialize) or on invalidate. The
+    current day is rebuilt at most every OPEN_DAY_TTL seconds. Long ranges are
+    then answered from a few hundred rollup rows instead of the raw readings.
+    """
+    _instance = None  # Singleton instance
+
+    SCHEMA_VERSION = 3
+    # Seconds a rollup of the current, still growing day is reused
+    OPEN_DAY_TTL = 300
+
+    def __new__(cls):
+        """Ensures only one instance of RollupService exists."""
+        if cls._instance is None:
+            cls._instance = super(RollupService, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        """Initialize the service and its storage directory."""
+        self.detector = AnomalyDetectionService()
+        self.event_service = AnomalyEventService(self.detector.thresholds)
+        thresholds = json.dumps(self.detector.thresholds, sort_keys=True)
+        self.key = f"v{self.SCHEMA_VERSION}_{hashlib.sha1(thresholds.encode()).hexdigest()[:8]}"
+        self.directory = os.path.join(
+            getattr(settings, 'ROLLUP_DIR', None) or os.path.join(settings.BASE_DIR, 'rollups'), self.key
+        )
+        # (node, year, month, day) -> (expires_at, rollup day)
+        self._memory = LRUCache(getattr(settings, 'ROLLUP_MEMORY_DAYS', 400))
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'built': 0}
+
+    def _path(self, node, year, month, day):
+        return os.path.join(self.directory, node, f"{year}-{month}-{day}.npz")
+
+    def build_day(self, node, year, month, day, readings=None, fresh=False):
+        """Build the rollups of one node-day from its raw readings (fetched if not given).
+
+        Readings that went through AnomalyDetectionService are used as they
+        are, others are run through it first. With fresh, readings are fetched
+        past the request cache and a failed fetch raises.
+        """
+        if readings is None:
+            from .firebase_service import FirebaseService
+            readings = FirebaseService().get_day_data(
+                node, year, month, day, use_cache=not fresh, raise_errors=fresh
+            )
+        if readings and 'anomaly_parameters' not in readings[0]:
+            readings = self.detector.detect_anomalies(readings)
+
+        rollup_day = {'tiers': {}, 'sketch': {}, 'event_counts': {p: 0 for p in PARAMETERS},
+                      'edge_events': {p: [None, None] for p in PARAMETERS}, 'runs': np.empty((0, 4)),
+                      'first_epoch': None, 'first_low': False, 'latest_reading': None,
+                      'anomalies': [], 'count': 0, 'last_epoch': None}
+        if not readings:
+            rollup_day['tiers'] = {tier: empty_rollup() for tier in TIERS}
+            return rollup_day
+
+        columns = readings_to_columns(readings)
+        index = columns['index']
+        values = np.column_stack([columns[p] for p in PARAMETERS])
+        flags = np.zeros(values.shape, dtype=bool)
+        for j, parameter in enumerate(PARAMETERS):
+            flags[:, j] = np.fromiter(
+                (parameter in (readings[i].get('anomaly_parameters') or ()) for i in index), dtype=bool, count=len(index)
+            )
+        anomalous = flags.any(axis=1) | columns['is_anomaly']
+
+        minute = rollup_columns(columns['epoch'], values, flags, anomalous, TIERS['minute'])
+        rollup_day['tiers'] = {
+            'minute': minute,
+            'hour': coarsen(minute, TIERS['hour']),
+            'day': coarsen(minute, TIERS['day'])
+        }
+        # Histogram sketches for percentiles over any number of days
+        rollup_day['sketch'] = partial_statistics(value_block(columns), exact_max=0)['histogram']
+        # Events touching the day's edges, so events split at midnight are counted once
+        edge_events = {p: [None, None] for p in PARAMETERS}
+        for event in self.event_service.build_events(readings):
+            parameter = event['parameter']
+            if parameter in rollup_day['event_counts']:
+                rollup_day['event_counts'][parameter] += 1
+                if event['at_data_start']:
+                    edge_events[parameter][0] = event['start_epoch']
+                if event['at_data_end']:
+                    edge_events[parameter][1] = event['end_epoch']
+        rollup_day['edge_events'] = edge_events
+
+        runs = day_runs(columns['epoch'], columns['voltage'])
+        rollup_day.update({key: runs[key] for key in ('runs', 'first_epoch', 'first_low', 'count', 'last_epoch')})
+        rollup_day['latest_reading'] = readings[int(index[-1])]
+        # Anomalous readings in time order, without the model label (it depends on the model version)
+        rollup_day['anomalies'] = [
+            {key: value for key, value in readings[int(i)].items() if key != 'anomaly_type'}
+            for i in index[anomalous]
+        ]
+        return rollup_day
+
+    def _save(self, path, rollup_day):
+        """Write a rollup day atomically (temporary file, then rename)."""
+        arrays = {f"{tier}__{key}": value for tier, rollup in rollup_day['tiers'].items() for key, value in rollup.items()}
+        arrays.update({f"sketch__{parameter}": value for parameter, value in rollup_day['sketch'].items()})
+        meta = {key: rollup_day[key] for key in ('event_counts', 'edge_events', 'first_epoch', 'first_low',
+                                                 'latest_reading', 'anomalies', 'count', 'last_epoch')}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(temporary, runs=rollup_day['runs'], meta=np.array(json.dumps(meta, default=str)), **arrays)
+        os.replace(temporary, path)
+
+    def _load(self, path):
+        """Read a rollup day written by _save, or None if it is missing or unreadable."""
+        try:
+            with np.load(path) as data:
+                rollup_day = json.loads(str(data['meta']))
+                rollup_day['runs'] = data['runs']
+                rollup_day['tiers'] = {tier: {} for tier in TIERS}
+                rollup_day['sketch'] = {}
+                for name in data.files:
+                    if name.startswith('sketch__'):
+                        rollup_day['sketch'][name[len('sketch__'):]] = data[name]
+                    elif '__' in name:
+                        tier, key = name.split('__', 1)
+                        rollup_day['tiers'][tier][key] = data[name]
+                return rollup_day
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable rollup {path}: {str(e)}")
+            return None
+
+    def get_day(self, node, year, month, day, readings=None):
+        """Get the rollups of one node-day from memory or disk, building them on a miss.
+
+        Pass the current day's readings when they are at hand to avoid fetching
+        them again. Closed days are always built from a fresh fetch; if that
+        fails, the given readings (or none) are used and kept in memory only.
+        """
+        key = (node, year, month, day)
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > time.time():
+            self._stats['memory_hits'] += 1
+            return entry[1]
+
+        closed = date(int(year), int(month), int(day)) < date.today()
+        path = self._path(node, year, month, day)
+        rollup_day = self._load(path) if closed else None
+        ttl = 3600 if closed else self.OPEN_DAY_TTL
+        if rollup_day is not None:
+            self._stats['disk_hits'] += 1
+        elif closed:
+            try:
+                rollup_day = self.build_day(node, year, month, day, fresh=True)
+                final = rollup_day['first_epoch'] is not None
+            except Exception as e:
+                logger.warning(f"Could not fetch {node} {year}-{month}-{day} for its rollup: {str(e)}")
+                rollup_day = self.build_day(node, year, month, day, readings or [])
+                final = False
+            self._stats['built'] += 1
+            # Empty days may be missing uploads - keep them (and failed fetches) in memory only, briefly
+            if final:
+                try:
+                    self._save(path, rollup_day)
+                except OSError as e:
+                    logger.warning(f"Could not persist rollup {path}: {str(e)}")
+            else:
+                ttl = self.OPEN_DAY_TTL
+        else:
+            rollup_day = self.build_day(node, year, month, day, readings)
+            self._stats['built'] += 1
+
+        self._memory.put(key, (time.time() + ttl, rollup_day))
+        return rollup_day
+
+    def invalidate(self, node, year, month, day):
+        """Drop the rollups of one node-day from memory and disk, so the next get_day rebuilds them."""
+        self._memory.put((node, year, month, day), (0, None))
+        try:
+            os.remove(self._path(node, year, month, day))
+        except FileNotFoundError:
+            pass
+
+    def materialize(self, node, year, month, day, readings):
+        """Make sure a closed node-day has rollups covering readings already fetched.
+
+        The rollups are built (from a fresh fetch) if the day has none yet, and
+        rebuilt if readings has more readings or a later one than they were
+        built from, e.g. after a late upload.
+
+        Returns:
+            True if the rollups were (re)built
+        """
+        if date(int(year), int(month), int(day)) >= date.today() or not readings:
+            return False
+        key = (node, year, month, day)
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > time.time():
+            rollup_day = entry[1]
+        else:
+            rollup_day = self._load(self._path(node, year, month, day))
+        if rollup_day is not None:
+            last_epoch = int(epoch_seconds([r['timestamp'] for r in readings]).max())
+            if len(readings) <= rollup_day['count'] and last_epoch <= (rollup_day['last_epoch'] or 0):
+                return False
+            self.invalidate(node, year, month, day)
+        self.get_day(node, year, month, day, readings)
+        return True
+
+    def choose_tier(self, days, max_points):
+        """Finest tier whose rows for the given number of days fit in max_points."""
+        for tier, seconds in TIERS.items():
+            if days * 86400 // seconds <= max_points:
+                return tier
+        return 'day'
+
+    def tier_rows(self, rollup_days, tier):
+        """Rollup arrays of one tier over consecutive days."""
+        return concatenate([rollup_day['tiers'][tier] for rollup_day in rollup_days])
+
+    def chart_rows(self, rollup, tier):
+        """Rollup buckets as reading-like rows: the mean under each parameter name plus
+        <parameter>_min/_max/_std, count and anomaly_count (same shape as downsampled bucket rows)."""
+        rows = []
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = rollup['sum'] / rollup['n']
+            stds = np.sqrt(np.maximum(rollup['sumsq'] / rollup['n'] - means * means, 0.0))
+        for b, start in enumerate(rollup['start']):
+            row = {
+                'timestamp': datetime.fromtimestamp(int(start), tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'),
+                'count': int(rollup['count'][b]),
+                'anomaly_count': int(rollup['anomalies'][b]),
+                'aggregated': True,
+                'resolution': tier,
+                'is_anomaly': False,
+                'anomaly_parameters': [],
+                'anomaly_type': 'Normal'
+            }
+            for j, parameter in enumerate(PARAMETERS):
+                if rollup['n'][b, j]:
+                    row[parameter] = round(float(means[b, j]), 4)
+                    row[f"{parameter}_min"] = float(rollup['min'][b, j])
+                    row[f"{parameter}_max"] = float(rollup['max'][b, j])
+                    row[f"{parameter}_std"] = round(float(stds[b, j]), 4)
+            rows.append(row)
+        return rows
+
+    def event_counts(self, rollup_days):
+        """Anomaly events per parameter over consecutive days.
+
+        An event running into midnight and one starting the next day within the
+        event service's max_gap_sec are one event, as in AnomalyEventService.merge_adjacent.
+        """
+        counts = {p: sum(d['event_counts'].get(p, 0) for d in rollup_days) for p in PARAMETERS}
+        for previous, current in zip(rollup_days, rollup_days[1:]):
+            for parameter in PARAMETERS:
+                end = previous['edge_events'][parameter][1]
+                start = current['edge_events'][parameter][0]
+                if end is not None and start is not None and 0 <= start - end <= self.event_service.max_gap_sec:
+                    counts[parameter] -= 1
+        return counts
+
+    def statistics(self, rollup_days):
+        """Dashboard statistics (see finalize_statistics) merged from the day tier and
+        sketch of every day, so percentiles come from the sketch (and percentiles
+        beyond its grid are listed as clipped)."""
+        partials = []
+        for rollup_day in rollup_days:
+            day = rollup_day['tiers']['day']
+            if not len(day['start']):
+                continue
+            partials.append({
+                'parameters': PARAMETERS,
+                'n': day['n'].sum(axis=0),
+                'min': np.fmin.reduce(day['min'], axis=0),
+                'max': np.fmax.reduce(day['max'], axis=0),
+                'sum': day['sum'].sum(axis=0),
+                'sumsq': day['sumsq'].sum(axis=0),
+                'histogram': rollup_day['sketch'],
+                'values': None
+            })
+        return finalize_statistics(merge_statistics(partials, exact_max=0))
+
+    def get_stats(self):
+        """Get cache and build counters."""
+        stats = dict(self._stats)
+        stats['memory'] = self._memory.get_stats()
+        stats['directory'] = self.directory
+        return stats
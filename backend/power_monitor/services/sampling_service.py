@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+def sampling_stratum(reading):
+    """Group label of a reading for stratified sampling.
+
+    Classified readings are grouped by anomaly_type. Readings without a label
+    (e.g. resolved server-side and not classified yet) fall back to the
+    parameters the threshold detector flagged, so the strata stay meaningful.
+    """
+    anomaly_type = reading.get('anomaly_type')
+    if anomaly_type not in (None, 'Unknown', 'Unclassified'):
+        return str(anomaly_type)
+    if not reading.get('is_anomaly', False):
+        return 'Normal'
+    return 'Anomalous:' + '+'.join(sorted(reading.get('anomaly_parameters') or []))
+
+
+def stratified_sample_indices(labels, sample_size, seed=0, min_per_group=5):
+    """Pick a reproducible stratified sample of row indices in O(n).
+
+    Every group (distinct label) gets a share of sample_size proportional to
+    its size, but at least min_per_group rows (or the whole group if smaller).
+    The result is then trimmed or topped up at random to exactly sample_size
+    rows. Works on any label column, e.g. the anomaly_type column of a block,
+    and returns the same indices for the same labels, size and seed.
+    Labels are grouped by hashing (pd.factorize) and a radix sort of the
+    group codes, so no step sorts the rows by comparison.
+
+    Args:
+        labels: Sequence or array with one group label per row
+        sample_size: Number of rows to pick
+        seed: Seed of the random generator
+
+    Returns:
+        Sorted int64 array of row indices
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if n <= sample_size:
+        return np.arange(n, dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    codes, _ = pd.factorize(labels, use_na_sentinel=False)
+    counts = np.bincount(codes)
+    quotas = np.minimum(np.maximum(min_per_group, np.round(counts / n * sample_size)), counts).astype(np.int64)
+
+    # Shuffle, then group rows by label with a stable radix sort: the first
+    # quota rows of each group are a uniform random subset of that group
+    shuffled = rng.permutation(n)
+    group_codes = codes[shuffled].astype(np.uint16 if len(counts) < 2 ** 16 else np.int64)
+    grouped = shuffled[np.argsort(group_codes, kind='stable')]
+    group_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(n) - np.repeat(group_starts, counts)
+    chosen = np.zeros(n, dtype=bool)
+    chosen[grouped[rank < np.repeat(quotas, counts)]] = True
+
+    selected = np.flatnonzero(chosen)
+    if len(selected) > sample_size:
+        # Minimum group sizes overshot the budget - trim at random
+        selected = rng.choice(selected, sample_size, replace=False)
+    elif len(selected) < sample_size:
+        # Rounding left room - top up from the rows not picked yet
+        remaining = np.flatnonzero(~chosen)
+        selected = np.concatenate((selected, rng.choice(remaining, sample_size - len(selected), replace=False)))
+
+    return np.sort(selected)
@@ -1,23 +1,40 @@
 import numpy as np
-import pandas as pd
 import shap
 import logging
 import traceback
 import os
+import copy
+import time
+from django.conf import settings
 from .classifier_service import MLAnomalyClassifier
+from .lru_cache import LRUCache
+from .sampling_service import sampling_stratum, stratified_sample_indices
+from .inference_pool import abs_shap_chunk_sums, reduce_chunk_sums, stack_shap_values
+import hashlib
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ShapExplainerService:
-    """Service for generating SHAP explanations for anomaly classifications."""
+    """Service for generating SHAP explanations for anomaly classifications.
     
-    def __init__(self):
-        """Initialize the explainer with the ML classifier."""
+    Explanations come in two modes: 'exact' TreeSHAP values, and
+    'approximate' Saabas path attributions (shap's approximate=True), which
+    walk each tree once along the decision path and are an order of magnitude
+    faster. Either mode can also be limited to a subset of the forest's trees.
+    """
+    
+    EXPLANATION_MODES = ('exact', 'approximate')
+    # Rows whose two most likely classes are closer than this take the class from model.predict
+    TIE_TOLERANCE = 1e-9
+    
+    def __init__(self, classifier=None):
+        """Initialize the explainer with the ML classifier.
+        
+        Pass an already loaded classifier to share its model instead of loading it again.
+        """
         try:
             # Get the trained model from classifier service
-            self.classifier = MLAnomalyClassifier()
+            self.classifier = classifier or MLAnomalyClassifier()
             logger.info(f"ML Classifier loaded successfully with features: {self.classifier.features}")
             
             # Create a SHAP explainer using the trained model - match the notebook approach exactly
@@ -34,6 +51,18 @@ class ShapExplainerService:
             # Define anomaly class mapping (should match classifier)
             self.anomaly_labels = self.classifier.anomaly_labels
             
+            # Explanations keyed by model version and exact feature vector
+            self.explanation_cache = LRUCache(getattr(settings, 'ML_EXPLANATION_CACHE_SIZE', 10000))
+            
+            # Global importance results keyed by model version and sampled feature matrix
+            self.importance_cache = LRUCache(getattr(settings, 'ML_IMPORTANCE_CACHE_SIZE', 64))
+            
+            # TreeExplainers of tree-subsampled forests, keyed by number of trees
+            self._subset_explainers = {}
+            
+            # Rows per block when summing |SHAP| values for global importance
+            self.shap_chunk_rows = getattr(settings, 'ML_SHAP_CHUNK_ROWS', 256)
+            
         except Exception as e:
             logger.error(f"Error initializing SHAP explainer: {str(e)}")
             logger.error(traceback.format_exc())
@@ -63,267 +92,311 @@ class ShapExplainerService:
             # Fallback
             return 0.0
     
-    def explain_reading(self, reading):
+    def tree_count(self, max_trees=None):
+        """Number of trees used for a tree budget (None or a budget above the forest size uses all)."""
+        n_trees = len(self.classifier.model.estimators_)
+        if not max_trees or int(max_trees) >= n_trees:
+            return n_trees
+        if int(max_trees) < 1:
+            raise ValueError("max_trees must be at least 1")
+        return int(max_trees)
+    
+    def tree_explainer(self, max_trees=None):
+        """TreeExplainer for the whole forest, or for max_trees evenly spaced trees of it.
+        
+        A subset forest averages fewer trees, so its explanation (and base value)
+        describe that subset's probabilities, an estimate of the full forest's.
+        """
+        n_trees = self.tree_count(max_trees)
+        model = self.classifier.model
+        if n_trees == len(model.estimators_):
+            return self.explainer
+        
+        explainer = self._subset_explainers.get(n_trees)
+        if explainer is None:
+            picks = np.linspace(0, len(model.estimators_) - 1, n_trees).round().astype(int)
+            subset = copy.copy(model)
+            subset.estimators_ = [model.estimators_[i] for i in picks]
+            subset.n_estimators = n_trees
+            explainer = shap.TreeExplainer(subset)
+            self._subset_explainers[n_trees] = explainer
+        return explainer
+    
+    def shap_values(self, matrix, mode='exact', max_trees=None):
+        """SHAP values of a feature matrix, spread over the classifier's process pool when it is large.
+        
+        mode 'approximate' returns Saabas attributions instead of exact TreeSHAP
+        values; max_trees limits the explanation to a subset of the forest.
+        """
+        if mode not in self.EXPLANATION_MODES:
+            raise ValueError(f"Unknown explanation mode: {mode}")
+        
+        pool = self.classifier.process_pool
+        full_forest = self.tree_count(max_trees) == len(self.classifier.model.estimators_)
+        if mode == 'exact' and full_forest and pool is not None and len(matrix) >= pool.min_shap_rows:
+            try:
+                return pool.shap_values(self.classifier.model_path, self.classifier.model_version, matrix)
+            except Exception as e:
+                logger.error(f"Process-pool SHAP failed, explaining in-process: {str(e)}")
+        return self.tree_explainer(max_trees).shap_values(matrix, approximate=(mode == 'approximate'))
+    
+    def abs_shap_sum(self, matrix):
+        """Sum of |SHAP| per model class and feature over the rows of matrix, shape (classes, features).
+        
+        Rows are explained in fixed blocks of shap_chunk_rows whose sums are
+        added in row order. Large matrices spread the blocks over the process
+        pool; the blocks and their order are the same either way, so the result
+        is identical with and without the pool.
+        """
+        pool = self.classifier.process_pool
+        if pool is not None and len(matrix) >= pool.min_shap_rows:
+            try:
+                return reduce_chunk_sums(pool.abs_shap_chunk_sums(
+                    self.classifier.model_path, self.classifier.model_version, matrix, self.shap_chunk_rows
+                ))
+            except Exception as e:
+                logger.error(f"Process-pool SHAP failed, explaining in-process: {str(e)}")
+        return reduce_chunk_sums(abs_shap_chunk_sums(self.explainer, matrix, 0, len(matrix), self.shap_chunk_rows))
+    
+    def base_values(self, explainer=None):
+        """Base (expected) value per model class as a float array."""
+        return np.atleast_1d(np.asarray((explainer or self.explainer).expected_value, dtype=np.float64))
+    
+    def classes_from_shap(self, values, base_values, matrix, full_forest=True):
+        """Predicted class index per row from stacked SHAP values, shape (classes, rows, features).
+        
+        For the forest's probability output, base value plus the sum of a
+        class's SHAP values is that class's probability (TreeSHAP and Saabas
+        attributions are both additive), so the prediction is their argmax.
+        Near ties, and explanations of a tree subset (whose probabilities are
+        not the full forest's), take the class from the full model instead.
+        
+        Returns:
+            Tuple of (class indices, probabilities of shape (rows, classes))
+        """
+        probabilities = values.sum(axis=2).T + base_values
+        class_indices = probabilities.argmax(axis=1)
+        
+        if full_forest and probabilities.shape[1] > 1:
+            ordered = np.sort(probabilities, axis=1)
+            ambiguous = ordered[:, -1] - ordered[:, -2] < self.TIE_TOLERANCE
+        else:
+            ambiguous = np.ones(len(class_indices), dtype=bool)
+        if ambiguous.any():
+            predictions = self.classifier.predict(matrix[ambiguous])
+            class_indices[ambiguous] = np.searchsorted(self.classifier.model.classes_, predictions)
+        return class_indices, probabilities
+    
+    def predict_and_explain(self, matrix, mode='exact', max_trees=None):
+        """Predict and explain the rows of a feature matrix with one pass over the trees.
+        
+        The predicted class is derived from the SHAP output (see
+        classes_from_shap) instead of a second model.predict call.
+        
+        Returns:
+            Dictionary with 'class_indices' (rows,), 'labels' (anomaly type per row),
+            'probabilities' (rows, classes), 'shap_values' (classes, rows, features),
+            'base_values' (classes,) and 'trees'
+        """
+        n_trees = self.tree_count(max_trees)
+        values = stack_shap_values(self.shap_values(matrix, mode=mode, max_trees=n_trees))
+        base_values = self.base_values(self.tree_explainer(n_trees))
+        class_indices, probabilities = self.classes_from_shap(
+            values, base_values, matrix, full_forest=n_trees == len(self.classifier.model.estimators_)
+        )
+        classes = self.classifier.model.classes_
+        return {
+            'class_indices': class_indices,
+            'labels': [self.classifier.prediction_to_label(classes[i]) for i in class_indices],
+            'probabilities': probabilities,
+            'shap_values': values,
+            'base_values': base_values,
+            'trees': n_trees
+        }
+    
+    def explain_batch(self, readings, mode='exact', max_trees=None):
+        """Generate SHAP explanations for many readings at once.
+        
+        Builds one feature matrix, answers repeated feature vectors from the
+        explanation cache and runs one fused predict_and_explain call for the
+        rest. mode and max_trees select the explanation method (see
+        shap_values); the predicted class always is the full model's.
+        
+        Returns:
+            List with one waterfall payload per reading (None for readings
+            without usable features), in the order of readings
+        """
+        n_trees = self.tree_count(max_trees)
+        features, positions = self.classifier.feature_matrix(readings)
+        results = [None] * len(readings)
+        
+        # Look up every row; identical feature vectors are explained once
+        pending = {}
+        for row, position in enumerate(positions):
+            cache_key = (self.classifier.model_version, mode, n_trees, features[row].tobytes())
+            cached = self.explanation_cache.get(cache_key)
+            if cached is not None:
+                results[position] = dict(cached)
+            else:
+                pending.setdefault(cache_key, []).append((row, position))
+        
+        if pending:
+            rows = [entries[0][0] for entries in pending.values()]
+            matrix = features[rows]
+            fused = self.predict_and_explain(matrix, mode=mode, max_trees=n_trees)
+            
+            for i, (cache_key, entries) in enumerate(pending.items()):
+                class_idx = fused['class_indices'][i]
+                
+                # Format the result for the frontend waterfall chart
+                result = {
+                    'feature_names': self.classifier.features,
+                    'shap_values': fused['shap_values'][class_idx, i].tolist(),
+                    'base_value': float(fused['base_values'][class_idx]),
+                    'predicted_class': fused['labels'][i],
+                    'confidence': float(fused['probabilities'][i, class_idx]),
+                    'feature_values': self.classifier.pipeline.to_dict(matrix[i]),
+                    'model_version': self.classifier.model_version,
+                    'explanation_mode': mode,
+                    'trees': n_trees
+                }
+                self.explanation_cache.put(cache_key, result)
+                for _, position in entries:
+                    results[position] = dict(result)
+        
+        return results
+    
+    def cached_explanation(self, reading, mode='exact', max_trees=None):
+        """Get a reading's explanation from the explanation cache without computing it (None on a miss)."""
+        features, positions = self.classifier.feature_matrix([reading])
+        if not positions:
+            return None
+        cached = self.explanation_cache.get(
+            (self.classifier.model_version, mode, self.tree_count(max_trees), features[0].tobytes())
+        )
+        return dict(cached) if cached is not None else None
+    
+    def explain_reading(self, reading, mode='exact', max_trees=None):
         """Generate SHAP values for a specific reading."""
         try:
-            # Prepare features using the classifier's method
-            features = self.classifier.prepare_features(reading)
-            if features is None:
+            result = self.explain_batch([reading], mode=mode, max_trees=max_trees)[0]
+            if result is None:
                 logger.error(f"Failed to prepare features for reading: {reading.get('id', 'unknown')}")
-                return None
-                    
-            print(f"Features prepared successfully: {features.columns.tolist()}")
-            logger.info(f"Features prepared successfully: {features.columns.tolist()}")
-            
-            # Calculate SHAP values - mirroring the notebook approach
-            logger.info(f"Calculating SHAP values...")
-            shap_values = self.explainer.shap_values(features)
-            logger.info(f"SHAP values calculated successfully with shape: {np.array(shap_values).shape if isinstance(shap_values, list) else shap_values.shape}")
-            print(f"SHAP values calculated successfully with shape: {np.array(shap_values).shape if isinstance(shap_values, list) else shap_values.shape}")
-            
-            # Get the prediction class index
-            prediction = self.classifier.model.predict(features)[0]
-            logger.info(f"Prediction class: {prediction}")
-            
-            # Handle different prediction types
-            if hasattr(prediction, 'item'):
-                prediction_idx = prediction.item()  # Convert numpy integer to Python int
-            elif isinstance(prediction, (int, np.integer)):
-                prediction_idx = int(prediction)
-            elif isinstance(prediction, str):
-                # If prediction is a string label, find its index in anomaly_labels
-                for idx, label in self.classifier.anomaly_labels.items():
-                    if label == prediction:
-                        prediction_idx = idx
-                        break
-                else:
-                    # If string not found in labels, default to index 0
-                    logger.warning(f"Prediction '{prediction}' not found in anomaly_labels, defaulting to 0")
-                    prediction_idx = 0
-            else:
-                # Unexpected type - log and default to 0
-                logger.error(f"Unexpected prediction type: {type(prediction)}")
-                prediction_idx = 0
-                    
-            logger.info(f"Predicted class index: {prediction_idx}")
-            
-            # In the notebook, different handling occurs based on SHAP values format
-            if isinstance(shap_values, list):
-                # For TreeExplainer with multi-class output (as in the notebook)
-                class_shap_values = shap_values[prediction_idx][0]  # First sample, specific class
-                base_value = self.explainer.expected_value[prediction_idx]
-                logger.info(f"Using class-specific SHAP values for class {prediction_idx}")
-            elif len(shap_values.shape) == 3:
-                # For 3D array from other explainers (samples, features, classes) - ADDED THIS CASE
-                class_shap_values = shap_values[0, :, prediction_idx]
-                if isinstance(self.explainer.expected_value, np.ndarray) or isinstance(self.explainer.expected_value, list):
-                    base_value = self.explainer.expected_value[prediction_idx]
-                else:
-                    base_value = self.explainer.expected_value
-                logger.info(f"Using 3D array SHAP values for class {prediction_idx}")
-            else:
-                # For single output or other explainers
-                class_shap_values = shap_values[0]  # Just take the first sample
-                base_value = float(self.explainer.expected_value)
-                logger.info("Using general SHAP values")
-            
-            logger.info(f"Base value: {base_value}")
-            
-            # Format the result for the frontend waterfall chart
-            result = {
-                'feature_names': self.classifier.features,
-                'shap_values': class_shap_values.tolist(),  # Convert numpy array to list
-                'base_value': float(base_value),  # Ensure this is a native Python float
-                'predicted_class': self.anomaly_labels.get(prediction_idx, 'Unknown'),
-                'feature_values': features.iloc[0].to_dict()
-            }
-            print(f"SHAP explanation generated successfully for reading {reading.get('id', 'unknown')}")
-            logger.info(f"SHAP explanation generated successfully for reading {reading.get('id', 'unknown')}")
             return result
             
         except Exception as e:
-            print(f"Error generating SHAP explanation: {str(e)}")
-            print(traceback.format_exc())
             logger.error(f"Error generating SHAP explanation: {str(e)}")
             logger.error(traceback.format_exc())
             return None
         
-    def smart_sample_readings(self, readings, sample_size=500):
-        """Perform stratified sampling of readings to maintain anomaly type distribution."""
-        import random
+    def compare_modes(self, readings, mode='approximate', max_trees=None, top_k=3):
+        """Measure the speed and accuracy of an explanation mode against exact TreeSHAP.
         
-        if len(readings) <= sample_size:
-            return readings
+        Explains the readings (uncached) both ways and compares the predicted
+        class attributions row by row.
         
-        # Group readings by anomaly type
-        type_groups = {}
-        for reading in readings:
-            anomaly_type = reading.get('anomaly_type', 'Unknown')
-            if anomaly_type not in type_groups:
-                type_groups[anomaly_type] = []
-            type_groups[anomaly_type].append(reading)
+        Returns:
+            Dictionary with per-row latencies, speedup, mean absolute and relative
+            error, top_k feature agreement and sign agreement
+        """
+        features, positions = self.classifier.feature_matrix(readings)
+        if not positions:
+            return None
+        n_trees = self.tree_count(max_trees)
         
-        total = len(readings)
-        sampled = []
+        start = time.perf_counter()
+        exact = stack_shap_values(self.explainer.shap_values(features))
+        exact_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        candidate = stack_shap_values(
+            self.tree_explainer(n_trees).shap_values(features, approximate=(mode == 'approximate'))
+        )
+        candidate_ms = (time.perf_counter() - start) * 1000
         
-        # Calculate how many to sample from each group
-        for anomaly_type, group in type_groups.items():
-            group_size = len(group)
-            # Calculate proportional sample size with minimum threshold
-            group_sample = max(5, int(round(group_size / total * sample_size)))
-            # Ensure we don't try to sample more than available
-            group_sample = min(group_sample, group_size)
-            
-            # Sample from this group
-            sampled.extend(random.sample(group, group_sample))
+        # Compare the attributions of the class the full model predicts
+        class_indices, _ = self.classes_from_shap(exact, self.base_values(), features)
+        rows = np.arange(len(features))
+        exact_rows = exact[class_indices, rows]
+        candidate_rows = candidate[class_indices, rows]
         
-        # If we sampled too many, trim randomly
-        if len(sampled) > sample_size:
-            sampled = random.sample(sampled, sample_size)
+        top_k = min(top_k, exact_rows.shape[1])
+        exact_top = np.sort(np.argsort(-np.abs(exact_rows), axis=1)[:, :top_k], axis=1)
+        candidate_top = np.sort(np.argsort(-np.abs(candidate_rows), axis=1)[:, :top_k], axis=1)
+        abs_error = np.abs(candidate_rows - exact_rows)
         
-        # If we didn't sample enough, add more randomly
-        elif len(sampled) < sample_size:
-            remaining = [r for r in readings if r not in sampled]
-            additional_needed = sample_size - len(sampled)
-            if remaining and additional_needed > 0:
-                additional = random.sample(remaining, min(additional_needed, len(remaining)))
-                sampled.extend(additional)
+        return {
+            'mode': mode,
+            'trees': n_trees,
+            'rows': len(positions),
+            'exact_ms_per_row': round(exact_ms / len(positions), 4),
+            'mode_ms_per_row': round(candidate_ms / len(positions), 4),
+            'speedup': round(exact_ms / candidate_ms, 2) if candidate_ms else None,
+            'mean_abs_error': float(abs_error.mean()),
+            'relative_error': float(abs_error.sum() / max(np.abs(exact_rows).sum(), 1e-12)),
+            'top_k': top_k,
+            'top_k_agreement': float(np.all(exact_top == candidate_top, axis=1).mean()),
+            'sign_agreement': float((np.sign(exact_rows) == np.sign(candidate_rows)).mean()),
+            'model_version': self.classifier.model_version
+        }
+    
+    def smart_sample_readings(self, readings, sample_size=500, seed=0):
+        """Perform stratified sampling of readings to maintain anomaly type distribution.
         
-        return sampled
+        Index based and seeded (see stratified_sample_indices), so the same
+        readings, sample size and seed always give the same sample.
+        """
+        if len(readings) <= sample_size:
+            return readings
         
-    def generate_global_feature_importance(self, readings, sample_size=500):
-        """Generate global feature importance across all anomaly types."""
-        import traceback
-        import logging
+        labels = [sampling_stratum(reading) for reading in readings]
+        return [readings[i] for i in stratified_sample_indices(labels, sample_size, seed=seed)]
         
-        logger = logging.getLogger(__name__)
+    def generate_global_feature_importance(self, readings, sample_size=500, seed=0):
+        """Generate global feature importance across all anomaly types.
         
+        The sample is reproducible for a given seed, and results are cached by
+        the sampled feature matrix, so identical requests skip SHAP.
+        """
         try:
-            logger.info(f"Generating global feature importance from {len(readings)} readings")
+            logger.debug(f"Generating global feature importance from {len(readings)} readings")
             
             # If we have too many readings, use smart sampling
             if len(readings) > sample_size:
-                sampled_readings = self.smart_sample_readings(readings, sample_size)
-                logger.info(f"Sampled {len(sampled_readings)} readings from {len(readings)} total")
+                sampled_readings = self.smart_sample_readings(readings, sample_size, seed=seed)
+                logger.debug(f"Sampled {len(sampled_readings)} readings from {len(readings)} total")
             else:
                 sampled_readings = readings
             
-            # Extract features for the model
-            feature_data = []
-            for reading in sampled_readings:
-                features = self.classifier.prepare_features(reading)
-                if features is not None:
-                    feature_data.append(features.iloc[0].to_dict())
+            # Extract features for the model as one contiguous matrix
+            features_matrix, positions = self.classifier.feature_matrix(sampled_readings)
             
-            if not feature_data:
+            if not positions:
                 logger.warning("No valid feature data extracted from readings")
                 return None
             
-            # Convert to DataFrame for SHAP analysis
-            features_df = pd.DataFrame(feature_data)
-            
-            # Run SHAP analysis
-            logger.info("Calculating SHAP values for global feature importance")
-            shap_values = self.explainer.shap_values(features_df)
+            cache_key = (self.classifier.model_version, hashlib.sha1(features_matrix.tobytes()).hexdigest())
+            cached = self.importance_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
             
-            # Handle multi-class output (TreeExplainer returns a list)
-            if isinstance(shap_values, list):
-                # Calculate mean absolute SHAP values for each class
-                class_importances = []
-                for i in range(len(shap_values)):
-                    class_importance = np.abs(shap_values[i]).mean(axis=0)
-                    class_importances.append(class_importance)
-                
-                # Average across all classes
-                feature_importances = np.mean(class_importances, axis=0)
-            else:
-                feature_importances = np.abs(shap_values).mean(axis=0)
+            # Mean |SHAP| per class and feature, from block sums (parallel for large samples)
+            class_importance = self.abs_shap_sum(features_matrix) / len(features_matrix)
             
-            # Ensure we convert NumPy types to Python native types for JSON serialization
-            feature_importances = [self.safely_convert_to_float(x) for x in feature_importances]
-            
-            # Create result dictionary
             result = {
                 'feature_names': self.classifier.features,
-                'importance_values': feature_importances,
-                'sample_size': len(features_df),
-                'min_features': 8  # We know from compacity analysis that 8 features give 90% explanation
+                # Average across all classes
+                'importance_values': class_importance.mean(axis=0).tolist(),
+                'sample_size': len(features_matrix),
+                'min_features': 8,  # We know from compacity analysis that 8 features give 90% explanation
+                'anomaly_types': {
+                    str(anomaly_class): dict(zip(self.classifier.features, class_importance[i].tolist()))
+                    for i, anomaly_class in enumerate(self.classifier.model.classes_)
+                },
+                'model_version': self.classifier.model_version
             }
             
-            # Calculate per-anomaly type importance
-            try:
-                anomaly_types = {}
-                classes = self.classifier.model.classes_
-                
-                # Add direct print statements since logger output isn't visible
-                print(f"Calculating per-anomaly type importance for {len(classes)} classes")
-                print(f"SHAP values type: {type(shap_values)}")
-                
-                # Transform shap_values if needed to ensure proper format
-                shap_values_for_classes = shap_values
-                
-                # Handle different possible formats of SHAP values
-                if not isinstance(shap_values, list):
-                    print(f"Converting SHAP values from {type(shap_values)} to list format")
-                    if hasattr(shap_values, 'shape') and len(shap_values.shape) == 3:
-                        # Handle 3D array case (samples, features, classes)
-                        print(f"Detected 3D SHAP values with shape: {shap_values.shape}")
-                        # Convert to list with one element per class
-                        shap_values_for_classes = [shap_values[:, :, i] for i in range(shap_values.shape[2])]
-                    else:
-                        # Can't automatically convert - use a fallback
-                        print("Cannot automatically convert SHAP values to per-class format")
-                        # Create a simplified version with just the overall importance
-                        feature_imp = np.abs(shap_values).mean(axis=0) if hasattr(shap_values, 'mean') else []
-                        # Use the same importance for all classes as fallback
-                        shap_values_for_classes = [shap_values] * len(classes)
-                
-                print(f"Processing SHAP values list with length {len(shap_values_for_classes)}")
-                
-                for i, anomaly_class in enumerate(classes):
-                    try:
-                        # Skip if out of bounds
-                        if i >= len(shap_values_for_classes):
-                            print(f"Skipping class {anomaly_class} - index {i} out of bounds")
-                            continue
-                            
-                        # Get SHAP values for this class
-                        class_values = shap_values_for_classes[i]
-                        
-                        # Calculate mean absolute SHAP values for this class
-                        class_importance = np.abs(class_values).mean(axis=0)
-                        
-                        # Make sure we have the right number of values
-                        if len(class_importance) != len(self.classifier.features):
-                            print(f"Warning: Feature count mismatch - {len(class_importance)} values vs {len(self.classifier.features)} features")
-                            # Use min length to avoid index errors
-                            min_len = min(len(class_importance), len(self.classifier.features))
-                            class_importance = class_importance[:min_len]
-                            features = self.classifier.features[:min_len]
-                        else:
-                            features = self.classifier.features
-                        
-                        # Convert to a dictionary with feature names as keys
-                        class_importance_dict = {
-                            feat: self.safely_convert_to_float(imp) 
-                            for feat, imp in zip(features, class_importance)
-                        }
-                        
-                        # Store in anomaly_types dictionary with class name as key
-                        anomaly_types[str(anomaly_class)] = class_importance_dict
-                        print(f"Added importance data for class {anomaly_class} with {len(class_importance_dict)} features")
-                    except Exception as class_error:
-                        print(f"Error processing class {anomaly_class}: {str(class_error)}")
-                
-                print(f"Completed per-anomaly calculations. Keys: {list(anomaly_types.keys())}")
-                result['anomaly_types'] = anomaly_types
-                
-            except Exception as e:
-                print(f"Could not calculate per-anomaly type importance: {str(e)}")
-                import traceback
-                print(f"Exception traceback: {traceback.format_exc()}")
-            
-            return result
+            self.importance_cache.put(cache_key, result)
+            return dict(result)
         except Exception as e:
             logger.error(f"Error generating global feature importance: {str(e)}")
             logger.error(traceback.format_exc())
@@ -0,0 +1,187 @@
+import numpy as np
+
+from .column_service import PARAMETERS
+
+# Percentiles reported per parameter
+PERCENTILES = (5, 50, 95, 99)
+
+# Histogram sketch grid per parameter: lowest value, highest value and step. Values
+# are counted at the nearest grid point, so readings at the sensor resolution land
+# exactly on a grid point and sketch percentiles inside the grid are within one step
+# of the exact ones. Values beyond the grid are clipped into the end points: a
+# percentile falling there is only known to lie between the end point and min/max
+# (see clipped_percentiles)
+SKETCH_GRID = {
+    'voltage': (0.0, 300.0, 0.1),
+    'current': (0.0, 100.0, 0.05),
+    'power': (0.0, 25000.0, 5.0),
+    'frequency': (55.0, 65.0, 0.01),
+    'power_factor': (0.0, 1.0, 0.001),
+}
+
+# Up to this many readings the raw values are kept and percentiles are exact
+EXACT_MAX_READINGS = 100000
+
+
+def value_block(columns, parameters=PARAMETERS):
+    """(parameters, readings) float block of the parameter columns (see readings_to_columns).
+
+    One contiguous row per parameter, so every reduction below runs over all
+    parameters in a single call.
+    """
+    return np.vstack([columns[p] for p in parameters]) if len(columns['epoch']) else np.empty((len(parameters), 0))
+
+
+def grid_size(parameter):
+    low, high, step = SKETCH_GRID[parameter]
+    return int(round((high - low) / step)) + 1
+
+
+def empty_partial(parameters=PARAMETERS):
+    """Partial statistics of no readings."""
+    count = len(parameters)
+    return {
+        'parameters': list(parameters),
+        'n': np.zeros(count, dtype=np.int64),
+        'min': np.full(count, np.nan),
+        'max': np.full(count, np.nan),
+        'sum': np.zeros(count),
+        'sumsq': np.zeros(count),
+        'histogram': {p: np.zeros(grid_size(p), dtype=np.int64) for p in parameters},
+        'values': np.empty((count, 0))
+    }
+
+
+def partial_statistics(block, parameters=PARAMETERS, exact_max=EXACT_MAX_READINGS):
+    """Mergeable statistics of a value block (see value_block), NaN where a value is missing.
+
+    Count, min, max, sum and sum of squares are reduced for all parameters at
+    once; each parameter also gets a histogram sketch on its SKETCH_GRID. The
+    values themselves are kept while there are at most exact_max readings, so
+    small ranges get exact percentiles.
+    """
+    if not block.shape[1]:
+        return empty_partial(parameters)
+    present = ~np.isnan(block)
+    complete = present.all()
+    filled = block if complete else np.where(present, block, 0.0)
+    histogram = {}
+    for j, parameter in enumerate(parameters):
+        low, _, step = SKETCH_GRID[parameter]
+        values = block[j] if complete else block[j][present[j]]
+        grid = np.clip(np.rint((values - low) / step), 0, grid_size(parameter) - 1)
+        histogram[parameter] = np.bincount(grid.astype(np.int64), minlength=grid_size(parameter))
+    return {
+        'parameters': list(parameters),
+        'n': present.sum(axis=1),
+        'min': np.fmin.reduce(block, axis=1),
+        'max': np.fmax.reduce(block, axis=1),
+        'sum': filled.sum(axis=1),
+        'sumsq': np.einsum('ij,ij->i', filled, filled),
+        'histogram': histogram,
+        'values': block if block.shape[1] <= exact_max else None
+    }
+
+
+def merge_statistics(partials, exact_max=EXACT_MAX_READINGS):
+    """Merge partial statistics of disjoint readings, e.g. of consecutive days.
+
+    Values are kept (for exact percentiles) only if every partial kept them
+    and there are at most exact_max of them together.
+    """
+    if not partials:
+        return empty_partial()
+    parameters = partials[0]['parameters']
+    values = [p['values'] for p in partials]
+    keep_values = all(v is not None for v in values) and sum(v.shape[1] for v in values) <= exact_max
+    return {
+        'parameters': parameters,
+        'n': np.sum([p['n'] for p in partials], axis=0),
+        'min': np.fmin.reduce([p['min'] for p in partials], axis=0),
+        'max': np.fmax.reduce([p['max'] for p in partials], axis=0),
+        'sum': np.sum([p['sum'] for p in partials], axis=0),
+        'sumsq': np.sum([p['sumsq'] for p in partials], axis=0),
+        'histogram': {param: np.sum([p['histogram'][param] for p in partials], axis=0) for param in parameters},
+        'values': np.concatenate(values, axis=1) if keep_values else None
+    }
+
+
+def sketch_percentiles(histogram, parameter, count):
+    """Percentiles from a histogram sketch (nearest rank on the grid)."""
+    low, _, step = SKETCH_GRID[parameter]
+    ranks = np.array(PERCENTILES) / 100 * (count - 1)
+    return low + np.searchsorted(np.cumsum(histogram), ranks, side='right') * step
+
+
+def clipped_percentiles(histogram, parameter, count, minimum, maximum):
+    """Which sketch percentiles fall into an end point holding values clipped from beyond the grid.
+
+    Returns:
+        Bool array, one entry per PERCENTILES
+    """
+    low, high, step = SKETCH_GRID[parameter]
+    ranks = np.array(PERCENTILES) / 100 * (count - 1)
+    bins = np.searchsorted(np.cumsum(histogram), ranks, side='right')
+    # Values within half a step of an end point belong to it anyway
+    return ((bins == 0) & (minimum < low - step / 2)) | ((bins == len(histogram) - 1) & (maximum > high + step / 2))
+
+
+def finalize_statistics(partial, block=None):
+    """Dashboard statistics per parameter from partial statistics.
+
+    Every parameter with readings gets min, max, avg, count, std (population),
+    p5, p50, p95 and p99, plus 'percentiles' telling whether those are 'exact'
+    or from the 'sketch'. Sketch statistics also list the 'clipped_percentiles'
+    beyond the sketch grid, which are only bounded by min and max; pass the
+    value block of the readings (see value_block) to compute exact percentiles
+    for those parameters instead. Values are rounded to 2 decimals.
+    """
+    n = partial['n']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = partial['sum'] / n
+        stds = np.sqrt(np.maximum(partial['sumsq'] / n - means * means, 0.0))
+    exact = partial['values'] is not None
+    if exact and partial['values'].shape[1]:
+        kept = partial['values']
+        if not np.isnan(kept).any():
+            percentiles = np.percentile(kept, PERCENTILES, axis=1).T
+        else:
+            percentiles = [np.percentile(row[~np.isnan(row)], PERCENTILES) if n[j] else None
+                           for j, row in enumerate(kept)]
+
+    stats = {}
+    for j, parameter in enumerate(partial['parameters']):
+        if not n[j]:
+            continue
+        method, clipped = 'exact', []
+        if exact:
+            values = percentiles[j]
+        else:
+            histogram = partial['histogram'][parameter]
+            flags = clipped_percentiles(histogram, parameter, n[j], partial['min'][j], partial['max'][j])
+            if flags.any() and block is not None:
+                # Percentiles beyond the grid are unknown to the sketch - use the values
+                row = block[j]
+                values = np.percentile(row[~np.isnan(row)], PERCENTILES)
+            else:
+                method = 'sketch'
+                values = sketch_percentiles(histogram, parameter, n[j])
+                # Clipped grid ends stand for anything beyond them - the exact extremes are known
+                values = np.clip(values, partial['min'][j], partial['max'][j])
+                clipped = [f"p{q}" for q, flag in zip(PERCENTILES, flags) if flag]
+        param_stats = {
+            'min': partial['min'][j],
+            'max': partial['max'][j],
+            'avg': means[j],
+            'count': int(n[j]),
+            'std': stds[j],
+        }
+        param_stats.update({f"p{q}": value for q, value in zip(PERCENTILES, values)})
+        for key in param_stats:
+            if key != 'count':
+                param_stats[key] = round(float(param_stats[key]), 2)
+        param_stats['percentiles'] = method
+        if method == 'sketch':
+            param_stats['clipped_percentiles'] = clipped
+        stats[parameter] = param_stats
+    return stats
@@ -1,3 +1,1108 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from sklearn.ensemble import RandomForestClassifier
+
+from . import views
+from .services.analytics_jobs import classify_job
+from .services.anomaly_service import AnomalyDetectionService
+from .services.cache_service import CacheService
+from .services.classification_store import ClassificationStore
+from .services.classifier_service import MLAnomalyClassifier, default_model_path, model_file_version
+from .services.column_service import PARAMETERS, epoch_seconds, readings_to_columns
+from .services.document_store import DocumentStore
+from .services.downsampling_service import bucket_aggregates, downsample, lttb_indices
+from .services.event_service import AnomalyEventService
+from .services.explanation_precompute import ExplanationPrecomputer
+from .services.forest_engine import CompiledForest, compiled_forest_path
+from .services.importance_service import FeatureImportanceService
+from .services.inference_pool import InferencePool, stack_shap_values
+from .services.interruption_service import day_runs, find_runs, merge_day_runs, summarize_runs
+from .services.job_service import JobQueue
+from .services.micro_batcher import MicroBatcher
+from .services.model_registry import ModelNotReady, ModelRegistry
+from .services.reading_resolver import ReadingResolver
+from .services.rollup_service import TIERS, RollupService, coarsen, rollup_columns
+from .services.sampling_service import sampling_stratum, stratified_sample_indices
+from .services.shap_service import ShapExplainerService
+from .services.statistics_service import (
+    PERCENTILES, SKETCH_GRID, finalize_statistics, merge_statistics, partial_statistics, value_block
+)
+
+
+def api_post(view, path, data):
+    """POST data as JSON straight to an APIView."""
+    return view.as_view()(APIRequestFactory().post(path, data, format='json'))
+
+
+def api_get(view, path, params):
+    """GET with query parameters straight to an APIView."""
+    return view.as_view()(APIRequestFactory().get(path, params))
+
+
+def small_forest(seed=0, n_estimators=8):
+    """A small fitted forest with string labels, like the deployed model."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(400, 5))
+    y = np.where(X[:, 0] + X[:, 1] > 0, 'HighLoad_Optimal', np.where(X[:, 2] > 0.5, 'Idle_Stable', 'LowPF_ReactiveLoad'))
+    return RandomForestClassifier(n_estimators=n_estimators, max_depth=6, random_state=seed).fit(X, y)
+
+
+class CompiledForestTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.model = small_forest()
+
+    def classifier(self, model, version):
+        """Just the attributes load_compiled_forest needs."""
+        return SimpleNamespace(model=model, model_path=os.path.join(self.directory, 'model.joblib'), model_version=version)
+
+    def test_matches_sklearn_bit_for_bit(self):
+        forest = CompiledForest.from_model(self.model)
+        self.assertTrue(forest.verify(self.model))
+        X = forest.verification_corpus(500, seed=1)
+        np.testing.assert_array_equal(forest.predict_proba(X), self.model.predict_proba(X))
+        np.testing.assert_array_equal(forest.predict(X), self.model.predict(X))
+
+    def test_save_and_load_round_trip(self):
+        path = os.path.join(self.directory, 'forest.npz')
+        CompiledForest.from_model(self.model).save(path)
+        self.assertTrue(CompiledForest.load(path).verify(self.model))
+
+    def test_export_is_keyed_by_model_version(self):
+        path_a = compiled_forest_path('/models/model.joblib', 'model@aaaaaaaaaaaa')
+        path_b = compiled_forest_path('/models/model.joblib', 'model@bbbbbbbbbbbb')
+        self.assertNotEqual(path_a, path_b)
+        self.assertEqual(os.path.dirname(path_a), '/models')
+
+    def test_stale_export_is_rebuilt(self):
+        classifier = self.classifier(self.model, 'model@aaaaaaaaaaaa')
+        npz_path = compiled_forest_path(classifier.model_path, classifier.model_version)
+        # An export of another model under this model's name fails verification
+        CompiledForest.from_model(small_forest(seed=1)).save(npz_path)
+
+        forest = MLAnomalyClassifier.load_compiled_forest(classifier)
+        self.assertIsNotNone(forest)
+        self.assertTrue(forest.verify(self.model))
+        self.assertTrue(CompiledForest.load(npz_path).verify(self.model))
+
+    def test_unreadable_export_is_rebuilt(self):
+        classifier = self.classifier(self.model, 'model@aaaaaaaaaaaa')
+        npz_path = compiled_forest_path(classifier.model_path, classifier.model_version)
+        with open(npz_path, 'wb') as f:
+            f.write(b'not an npz file')
+
+        self.assertIsNotNone(MLAnomalyClassifier.load_compiled_forest(classifier))
+        self.assertTrue(CompiledForest.load(npz_path).verify(self.model))
+
+
+class InferencePoolTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.features = [f"f{i}" for i in range(5)]
+        # Workers predict on DataFrames, so the forest is fitted with feature names
+        X = pd.DataFrame(np.random.default_rng(0).normal(size=(400, 5)), columns=cls.features)
+        y = np.where(X['f0'] + X['f1'] > 0, 'HighLoad_Optimal', np.where(X['f2'] > 0.5, 'Idle_Stable', 'LowPF_ReactiveLoad'))
+        cls.model = RandomForestClassifier(n_estimators=8, max_depth=6, random_state=0).fit(X, y)
+        cls.model_path = os.path.join(cls.directory, 'pool_model.joblib')
+        joblib.dump(cls.model, cls.model_path)
+        cls.model_version = model_file_version(cls.model_path)
+        # A tiny max_nbytes hands the matrix to the workers as a memory map
+        cls.pool = InferencePool(2, chunks_per_worker=3, max_nbytes='1K')
+        cls.matrix = np.random.default_rng(1).normal(size=(500, 5))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def test_pool_predictions_equal_a_serial_run(self):
+        np.testing.assert_array_equal(
+            self.pool.predict(self.model_path, self.model_version, self.features, self.matrix),
+            self.model.predict(pd.DataFrame(self.matrix, columns=self.features))
+        )
+        np.testing.assert_array_equal(
+            self.pool.predict_proba(self.model_path, self.model_version, self.features, self.matrix),
+            self.model.predict_proba(pd.DataFrame(self.matrix, columns=self.features))
+        )
+
+    def test_pool_abs_shap_sum_equals_a_serial_run(self):
+        classifier = SimpleNamespace(
+            model=self.model, features=self.features, anomaly_labels={}, model_path=self.model_path,
+            model_version=self.model_version, process_pool=None
+        )
+        with override_settings(ML_SHAP_CHUNK_ROWS=64):
+            explainer = ShapExplainerService(classifier)
+        serial = explainer.abs_shap_sum(self.matrix)
+        classifier.process_pool = InferencePool(2, min_shap_rows=1, chunks_per_worker=3, max_nbytes='1K')
+        with mock.patch('power_monitor.services.shap_service.abs_shap_chunk_sums') as in_process:
+            pooled = explainer.abs_shap_sum(self.matrix)
+        in_process.assert_not_called()
+
+        np.testing.assert_array_equal(pooled, serial)
+        exact = np.abs(stack_shap_values(explainer.explainer.shap_values(self.matrix))).sum(axis=1)
+        np.testing.assert_allclose(serial, exact)
+
+    def test_replaced_model_file_is_refused(self):
+        with self.assertRaises(RuntimeError):
+            self.pool.predict(self.model_path, 'pool_model@000000000000', self.features, self.matrix)
+
+
+class DocumentStoreTests(SimpleTestCase):
+    def test_requests_never_wait_for_a_connection(self):
+        connected = threading.Event()
+
+        def slow_connection():
+            connected.wait(5)
+            return None
+
+        store = DocumentStore('test_collection')
+        with override_settings(MONGO_DB=None), mock.patch('power_monitor.services.document_store.get_mongo_db', side_effect=slow_connection):
+            started = time.perf_counter()
+            self.assertIsNone(store.find('doc'))
+            self.assertTrue(store.update('doc', {'field': 1}))
+            self.assertLess(time.perf_counter() - started, 0.5)
+            connected.set()
+            store.flush()
+
+    def test_writes_are_applied_in_the_background(self):
+        collection = mock.MagicMock()
+        store = DocumentStore('test_collection')
+        with override_settings(MONGO_DB={'test_collection': collection}):
+            store.update('doc', {'field': 1}, {'node': 'C-1'})
+            store.flush()
+        query, update = collection.update_one.call_args[0]
+        self.assertEqual(query, {'_id': 'doc'})
+        self.assertEqual(update['$set']['field'], 1)
+        self.assertEqual(update['$setOnInsert'], {'node': 'C-1'})
+
+
+class ClassificationStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = object.__new__(ClassificationStore)
+        self.store.initialize()
+        self.store._documents = mock.MagicMock()
+        self.store._documents.find.return_value = None
+        self.node = f"labels-{id(self)}"
+        self.addCleanup(CacheService().clear_namespace, 'classifications@model@test')
+
+    def cached(self):
+        return CacheService().get(self.node, '2025', '04', '01', namespace='classifications@model@test')
+
+    def test_unavailable_store_is_not_cached_as_a_miss(self):
+        self.store._documents.available.return_value = False
+        self.assertEqual(self.store.get_day(self.node, '2025', '04', '01', 'model@test'), {})
+        self.assertIsNone(self.cached())
+
+        self.store._documents.available.return_value = True
+        self.store._documents.find.return_value = {'classifications': {'C-1-2025-04-01-10:00:00': 'Idle_Stable'}}
+        self.assertEqual(self.store.get_day(self.node, '2025', '04', '01', 'model@test'), {'C-1-2025-04-01-10:00:00': 'Idle_Stable'})
+        self.assertIsNotNone(self.cached())
+
+    def test_real_miss_is_cached(self):
+        self.store._documents.available.return_value = True
+        self.assertEqual(self.store.get_day(self.node, '2025', '04', '01', 'model@test'), {})
+        self.assertEqual(self.cached(), {})
+
+    def test_labels_recorded_while_unavailable_are_kept_in_memory(self):
+        self.store._documents.available.return_value = False
+        self.store.record_day(self.node, '2025', '04', '01', 'model@test', {'C-1-2025-04-01-10:00:00': 'Idle_Stable'})
+        self.assertEqual(self.store.get_day(self.node, '2025', '04', '01', 'model@test'), {'C-1-2025-04-01-10:00:00': 'Idle_Stable'})
+        self.store._documents.update.assert_called_once()
+
+
+class ClassifyReadingsViewTests(SimpleTestCase):
+    def setUp(self):
+        self.classifier = mock.MagicMock(model_version='model@test')
+        self.classifier.classify_batch.side_effect = lambda readings, top_k=0: [
+            reading.update(anomaly_type='Idle_Stable') for reading in readings
+        ]
+        patches = [
+            mock.patch.object(views.model_registry, 'get_classifier', return_value=self.classifier),
+            mock.patch.object(views.classification_store, 'record'),
+            mock.patch.object(views.classification_store, 'apply'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post(self, data):
+        return api_post(views.ClassifyReadingsView, '/api/ml/classify/', data)
+
+    def test_uploaded_readings_do_not_touch_the_shared_store(self):
+        response = self.post({'readings': [{'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True, 'voltage': 250}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['classifications'], {'C-1-2025-04-01-10:00:00': 'Idle_Stable'})
+        views.classification_store.record.assert_not_called()
+        views.classification_store.apply.assert_not_called()
+
+    def test_resolved_readings_use_the_store(self):
+        reading = {'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True, 'voltage': 250}
+        with mock.patch.object(views, 'resolve_request_readings', return_value=([reading], [])):
+            self.post({'reading_ids': [reading['id']]})
+        views.classification_store.apply.assert_called_once()
+
+    def test_invalid_top_k_is_a_bad_request(self):
+        for top_k in ('three', [], -1):
+            response = self.post({'readings': [{'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True}], 'top_k': top_k})
+            self.assertEqual(response.status_code, 400, top_k)
+            self.assertIn('top_k', response.data['error'])
+
+
+def synthetic_readings(n=3000, seed=0, start='2025-04-01T00:00:00', step=7):
+    """Readings every step seconds with random gaps, missing values and voltage dips."""
+    rng = np.random.default_rng(seed)
+    epochs = np.datetime64(start).astype('datetime64[s]').astype(np.int64) + np.cumsum(rng.integers(1, 2 * step, n))
+    readings = []
+    for i, epoch in enumerate(epochs):
+        voltage = float(rng.normal(220, 15)) if rng.random() > 0.05 else float(rng.uniform(50, 179))
+        reading = {
+            'id': f"C-1-{i}", 'timestamp': str(np.datetime64(int(epoch), 's')), 'voltage': round(voltage, 1),
+            'current': round(float(rng.uniform(0, 20)), 2), 'power': round(float(rng.uniform(0, 4000)), 1),
+            'frequency': round(float(rng.normal(60, 0.3)), 2), 'power_factor': round(float(rng.uniform(0.6, 1)), 3),
+            'is_anomaly': bool(rng.random() < 0.1)
+        }
+        if rng.random() < 0.02:
+            del reading['current']
+        readings.append(reading)
+    return readings
+
+
+_deployed = {}
+
+
+def deployed_classifier():
+    """The deployed model, loaded once for every test that needs it."""
+    if 'classifier' not in _deployed:
+        _deployed['classifier'] = MLAnomalyClassifier()
+    return _deployed['classifier']
+
+
+def anomaly_readings(n=300, seed=0, on_grid=True):
+    """Anomalous readings spread over the model's input range, at sensor resolution unless on_grid is False."""
+    rng = np.random.default_rng(seed)
+    readings = []
+    for i in range(n):
+        voltage, current = rng.uniform(150, 270), rng.uniform(0, 25)
+        frequency, power_factor = rng.uniform(58, 62), rng.uniform(0.4, 1)
+        reading = {'id': f"C-1-2025-04-01-{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}", 'is_anomaly': True,
+                   'voltage': voltage, 'current': current, 'frequency': frequency,
+                   'power': voltage * current * power_factor, 'power_factor': power_factor}
+        if on_grid:
+            for key, decimals in (('voltage', 1), ('current', 3), ('power', 1), ('frequency', 1), ('power_factor', 2)):
+                reading[key] = round(reading[key], decimals)
+        readings.append(reading)
+    return readings
+
+
+requires_model = unittest.skipUnless(os.path.exists(default_model_path()), "trained model not available")
+
+
+@requires_model
+class BatchClassificationTests(SimpleTestCase):
+    def setUp(self):
+        self.classifier = deployed_classifier()
+
+    def reference_labels(self, readings):
+        """Labels of the original per-row path: one model.predict call per reading."""
+        return [self.classifier.prediction_to_label(self.classifier.model.predict(self.classifier.prepare_features(r))[0])
+                for r in readings]
+
+    def test_batch_labels_equal_per_row_labels(self):
+        for on_grid in (True, False):
+            readings = anomaly_readings(on_grid=on_grid) + [{'is_anomaly': False, 'voltage': 230.0}]
+            expected = self.reference_labels(readings[:-1]) + ['Normal']
+            self.classifier.classify_batch(readings)
+            self.assertEqual([r['anomaly_type'] for r in readings], expected)
+
+    def test_a_failing_row_only_fails_itself(self):
+        readings = anomaly_readings(n=50)
+        readings[7]['voltage'] = 999.0
+        expected = self.reference_labels(readings)
+        predict_labels = self.classifier.predict_labels
+
+        def label_matrix(matrix):
+            if (matrix[:, 0] == 999.0).any():
+                raise RuntimeError("engine failure")
+            return predict_labels(matrix)
+
+        with mock.patch.object(self.classifier, 'label_matrix', side_effect=label_matrix):
+            self.classifier.classify_batch(readings)
+        expected[7] = 'Unknown'
+        self.assertEqual([r['anomaly_type'] for r in readings], expected)
+
+    def test_memo_hits_and_off_grid_bypass(self):
+        self.classifier.clear_memo()
+        self.addCleanup(self.classifier.clear_memo)
+        on_grid, off_grid = anomaly_readings(n=100, seed=5), anomaly_readings(n=100, seed=5, on_grid=False)
+        expected = self.reference_labels(on_grid)
+        matrix, _ = self.classifier.feature_matrix(on_grid)
+        self.assertEqual(self.classifier.predict_labels(matrix), expected)
+        self.assertEqual(self.classifier.predict_labels(matrix), expected)
+        stats = self.classifier.get_memo_stats()
+        self.assertEqual((stats['misses'], stats['hits'], stats['size']), (100, 100, 100))
+
+        off_matrix, _ = self.classifier.feature_matrix(off_grid)
+        self.assertEqual(self.classifier.predict_labels(off_matrix), self.reference_labels(off_grid))
+        stats = self.classifier.get_memo_stats()
+        self.assertEqual((stats['bypassed'], stats['size']), (100, 100))
+
+    def test_engines_agree(self):
+        readings = anomaly_readings(n=200, on_grid=False)
+        matrix, _ = self.classifier.feature_matrix(readings)
+        engine = self.classifier.engine
+        self.addCleanup(self.classifier.set_engine, engine)
+        predictions = {}
+        for name in ('sklearn', 'compiled'):
+            self.classifier.set_engine(name)
+            predictions[name] = self.classifier.predict(matrix)
+        np.testing.assert_array_equal(predictions['sklearn'], predictions['compiled'])
+
+    def test_auto_engine_only_routes_small_batches_to_compiled_forest(self):
+        readings = anomaly_readings(n=self.classifier.compiled_max_batch + 1, on_grid=False)
+        matrix, _ = self.classifier.feature_matrix(readings)
+        engine = self.classifier.engine
+        self.addCleanup(self.classifier.set_engine, engine)
+        self.classifier.set_engine('auto')
+        with mock.patch.object(self.classifier.compiled_forest, 'predict',
+                               wraps=self.classifier.compiled_forest.predict) as compiled:
+            self.classifier.predict(matrix[:self.classifier.compiled_max_batch])
+            self.assertEqual(compiled.call_count, 1)
+            self.classifier.predict(matrix)
+            self.assertEqual(compiled.call_count, 1)
+
+
+class FakeFirebase:
+    """Serves one day of readings every 10 seconds from 10:00, newest first like FirebaseService."""
+
+    def __init__(self, voltages=None, start_hour=10):
+        self.voltages = voltages or [220.0] * 60
+        self.start_hour = start_hour
+        self.error = None
+        self.calls = []
+
+    def get_day_data(self, node, year, month, day, use_cache=True, raise_errors=False):
+        self.calls.append((node, year, month, day, use_cache))
+        if self.error is not None and raise_errors:
+            raise self.error
+        if self.error is not None:
+            return []
+        readings = []
+        for i, voltage in enumerate(self.voltages):
+            seconds = self.start_hour * 3600 + i * 10
+            time_key = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+            readings.append({
+                'id': f"{node}-{year}-{month}-{day}-{time_key}", 'node': node,
+                'timestamp': f"{year}-{month}-{day}T{time_key}", 'voltage': voltage, 'current': 5.0,
+                'power': 1000.0, 'frequency': 60.0, 'power_factor': 0.95
+            })
+        return readings[::-1]
+
+
+class ReadingResolverTests(SimpleTestCase):
+    def test_malformed_ids_are_reported_missing(self):
+        firebase = FakeFirebase()
+        resolver = ReadingResolver(firebase_service=firebase)
+        readings, missing = resolver.resolve({'reading_ids': ['C-1-2025-04-01-10:00:10', 'garbage', 'a-b-c-d-e', 'C-1-2025-04-01-23:00:00']})
+        self.assertEqual([r['id'] for r in readings], ['C-1-2025-04-01-10:00:10'])
+        self.assertEqual(missing, ['garbage', 'a-b-c-d-e', 'C-1-2025-04-01-23:00:00'])
+        self.assertEqual(len(firebase.calls), 1)
+
+    def test_unclassified_readings_are_stratified_by_anomaly_parameters(self):
+        self.assertEqual(sampling_stratum({'is_anomaly': False}), 'Normal')
+        self.assertEqual(sampling_stratum({'is_anomaly': True, 'anomaly_parameters': ['voltage', 'current']}), 'Anomalous:current+voltage')
+        self.assertEqual(sampling_stratum({'is_anomaly': True, 'anomaly_type': 'Idle_Stable'}), 'Idle_Stable')
+
+
+class StratifiedSamplingTests(SimpleTestCase):
+    def setUp(self):
+        self.labels = np.random.default_rng(0).choice(['Idle_Stable', 'HighLoad_Optimal', 'LowPF_ReactiveLoad'], 5000, p=[0.8, 0.198, 0.002])
+
+    def test_same_seed_gives_the_same_sample(self):
+        sample = stratified_sample_indices(self.labels, 300, seed=7)
+        np.testing.assert_array_equal(sample, stratified_sample_indices(list(self.labels), 300, seed=7))
+        self.assertFalse(np.array_equal(sample, stratified_sample_indices(self.labels, 300, seed=8)))
+
+    def test_sample_is_stratified(self):
+        sample = stratified_sample_indices(self.labels, 300, seed=7)
+        self.assertEqual(len(sample), 300)
+        self.assertEqual(len(np.unique(sample)), 300)
+        picked = dict(zip(*np.unique(self.labels[sample], return_counts=True)))
+        # The rare group gets at least min_per_group rows, the others about their share
+        self.assertGreaterEqual(picked['LowPF_ReactiveLoad'], min(5, int((self.labels == 'LowPF_ReactiveLoad').sum())))
+        self.assertAlmostEqual(picked['Idle_Stable'] / 300, 0.8, delta=0.03)
+
+    def test_invalid_sample_size_and_seed_are_bad_requests(self):
+        readings = [{'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True, 'voltage': 250}]
+        for params in ({'sample_size': 'all'}, {'sample_size': 0}, {'seed': -1}, {'seed': 2 ** 32}, {'seed': '1.5'}):
+            for mode in ({}, {'async': 'true'}):
+                response = api_post(views.GlobalFeatureImportanceView, '/api/ml/global-importance/',
+                                    {'readings': readings, **params, **mode})
+                self.assertEqual(response.status_code, 400, params)
+                self.assertIn(next(iter(params)), response.data['error'])
+
+class ExplainAnomalyViewTests(SimpleTestCase):
+    def test_multi_reading_references_are_rejected(self):
+        for data in ({'node': 'C-1', 'start_date': '2025-04-01', 'end_date': '2025-04-02'},
+                     {'reading_ids': ['C-1-2025-04-01-10:00:00', 'C-1-2025-04-01-10:00:10']}):
+            response = api_post(views.ExplainAnomalyView, '/api/explain-anomaly/', data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('explain-anomalies', response.data['error'])
+
+    def test_invalid_tree_budget_and_top_k_are_bad_requests(self):
+        readings = [{'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True, 'voltage': 250}]
+        cases = [(view, {'max_trees': value}) for view in (views.ExplainAnomaliesView, views.ExplanationModeComparisonView)
+                 for value in ('ten', 0, -3)]
+        cases += [(views.ExplanationModeComparisonView, {'top_k': value}) for value in ('three', 0)]
+        for view, params in cases:
+            response = api_post(view, '/api/explain/', {'readings': readings, **params})
+            self.assertEqual(response.status_code, 400, (view.__name__, params))
+            self.assertIn(next(iter(params)), response.data['error'])
+
+
+class FeatureImportanceServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.resolver = mock.MagicMock()
+        self.service = FeatureImportanceService(self.resolver)
+        self.service._documents = mock.MagicMock()
+        self.service._documents.find.return_value = None
+        classifier = mock.MagicMock(model_version=f"model@{id(self)}", features=['voltage', 'current'])
+        classifier.model.classes_ = np.array(['Idle_Stable', 'HighLoad_Optimal'])
+        classifier.feature_matrix.return_value = (np.zeros((0, 2)), [])
+        self.explainer = SimpleNamespace(classifier=classifier)
+
+    def test_closed_days_are_fetched_past_the_cache(self):
+        self.resolver.get_day.return_value = []
+        self.service.get_day('C-1', '2025', '04', '01', self.explainer)
+        self.resolver.get_day.assert_called_once_with('C-1', '2025', '04', '01', use_cache=False, raise_errors=True)
+
+    def test_empty_days_are_not_persisted(self):
+        self.resolver.get_day.return_value = []
+        aggregate = self.service.get_day('C-1', '2025', '04', '02', self.explainer)
+        self.assertEqual(aggregate['rows'], 0)
+        self.service._documents.update.assert_not_called()
+
+    def test_failed_fetches_are_neither_persisted_nor_cached(self):
+        self.resolver.get_day.side_effect = ConnectionError('firebase unavailable')
+        self.assertEqual(self.service.get_day('C-1', '2025', '04', '03', self.explainer)['rows'], 0)
+        self.service._documents.update.assert_not_called()
+        self.resolver.get_day.side_effect = None
+        self.resolver.get_day.return_value = []
+        self.service.get_day('C-1', '2025', '04', '03', self.explainer)
+        self.assertEqual(self.resolver.get_day.call_count, 2)
+
+    def test_subsampled_days_keep_their_weight(self):
+        self.service.max_rows_per_day = 10
+        self.resolver.MAX_DAYS = 31
+        classifier = self.explainer.classifier
+        classifier.feature_matrix.side_effect = lambda anomalies: (np.ones((len(anomalies), 2)), list(range(len(anomalies))))
+        self.explainer.abs_shap_sum = lambda features: np.full((2, 2), float(len(features)))
+        days = {'01': 25, '02': 5}
+        self.resolver.get_day.side_effect = lambda node, year, month, day, **kwargs: [
+            {'is_anomaly': True, 'anomaly_type': 'Idle_Stable' if i % 5 else 'HighLoad_Optimal'} for i in range(days[day])
+        ]
+        with mock.patch('power_monitor.services.importance_service.ClassificationStore'):
+            busy = self.service.get_day('C-1', '2025', '04', '01', self.explainer)
+            importance = self.service.get_importance(['C-1'], '2025-04-01', '2025-04-02', self.explainer)
+
+        self.assertEqual((busy['rows'], busy['explained']), (25, 10))
+        self.assertEqual(busy['abs_shap_sum'], [[25.0, 25.0], [25.0, 25.0]])
+        self.assertEqual(busy['class_counts'], {'HighLoad_Optimal': 5, 'Idle_Stable': 20})
+        self.assertEqual((importance['anomalies'], importance['sample_size']), (30, 15))
+        self.assertEqual(importance['class_counts'], {'HighLoad_Optimal': 6, 'Idle_Stable': 24})
+        self.assertEqual(importance['importance_values'], [1.0, 1.0])
+
+    def test_documents_without_explained_counts_are_recomputed(self):
+        self.service._documents.find.return_value = {'rows': 3, 'abs_shap_sum': [[1, 1], [1, 1]], 'class_counts': {}}
+        self.resolver.get_day.return_value = []
+        self.service.get_day('C-1', '2025', '04', '04', self.explainer)
+        self.resolver.get_day.assert_called_once()
+
+    def test_nodes_must_be_a_list(self):
+        for nodes in ('C-1', ['C-1', 7], [None], []):
+            with self.assertRaises(ValueError):
+                self.service.get_importance(nodes, '2025-04-01', '2025-04-02', self.explainer)
+
+
+class JobQueueTests(SimpleTestCase):
+    def setUp(self):
+        # A private queue instead of the process-wide singleton
+        self.queue = object.__new__(JobQueue)
+        self.queue.initialize()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.queue.register('sum', lambda job, params: sum(params['values']))
+        self.queue.register('wait', lambda job, params: self.release.wait(5))
+
+    def wait_for(self, job):
+        deadline = time.time() + 5
+        while not job.finished and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(job.finished)
+
+    def test_jobs_are_deduplicated_per_model_version(self):
+        job, deduplicated = self.queue.submit('sum', {'values': [1, 2]}, model_version='model@a')
+        self.wait_for(job)
+        self.assertEqual(job.result, 3)
+        self.assertFalse(deduplicated)
+        self.assertEqual(self.queue.submit('sum', {'values': [1, 2]}, model_version='model@a'), (job, True))
+        other, deduplicated = self.queue.submit('sum', {'values': [1, 2]}, model_version='model@b')
+        self.assertIsNot(other, job)
+        self.assertFalse(deduplicated)
+
+    def test_model_swap_drops_finished_jobs(self):
+        finished, _ = self.queue.submit('sum', {'values': [1]}, model_version='model@a')
+        self.wait_for(finished)
+        running, _ = self.queue.submit('wait', {}, model_version='model@a')
+
+        self.queue.drop_finished('model@a', 'model@b')
+        self.assertIsNone(self.queue.get(finished.id))
+        self.assertIs(self.queue.get(running.id), running)
+        resubmitted, deduplicated = self.queue.submit('sum', {'values': [1]}, model_version='model@a')
+        self.assertIsNot(resubmitted, finished)
+        self.assertFalse(deduplicated)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+    def handler(self, matrix):
+        self.calls.append(len(matrix))
+        time.sleep(0.02)
+        return [f"row-{int(value)}" for value in matrix[:, 0]]
+
+    def test_a_lone_request_is_not_delayed(self):
+        batcher = MicroBatcher(self.handler, max_wait_ms=1000)
+        started = time.perf_counter()
+        self.assertEqual(batcher.submit(np.array([[7.0]])), ['row-7'])
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_concurrent_callers_get_their_own_rows(self):
+        batcher = MicroBatcher(self.handler, max_wait_ms=20)
+        results = {}
+
+        def caller(i):
+            rows = np.arange(i * 10, i * 10 + 1 + i % 3, dtype=float)[:, np.newaxis]
+            results[i] = batcher.submit(rows)
+
+        threads = [threading.Thread(target=caller, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        for i in range(16):
+            self.assertEqual(results[i], [f"row-{value}" for value in range(i * 10, i * 10 + 1 + i % 3)])
+        self.assertLess(len(self.calls), 16)
+        self.assertEqual(sum(self.calls), sum(1 + i % 3 for i in range(16)))
+
+class ClassifyJobTests(SimpleTestCase):
+    def setUp(self):
+        self.classifier = mock.MagicMock(model_version='model@job')
+        self.classifier.classify_batch.side_effect = lambda readings, top_k=0: [
+            reading.update(anomaly_type='Idle_Stable') for reading in readings
+        ]
+        self.node = f"job-{id(self)}"
+        self.reading_id = f"{self.node}-2025-04-01-10:00:00"
+        documents = mock.MagicMock()
+        documents.find.return_value = None
+        documents.available.return_value = False
+        patches = [
+            mock.patch.object(ModelRegistry(), 'get_classifier', return_value=self.classifier),
+            mock.patch.object(ClassificationStore(), '_documents', documents),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(CacheService().clear_namespace, 'classifications@model@job')
+
+    def stored_labels(self):
+        return ClassificationStore().get_day(self.node, '2025', '04', '01', 'model@job')
+
+    def test_uploaded_readings_do_not_touch_the_shared_store(self):
+        result = classify_job(mock.MagicMock(), {'readings': [{'id': self.reading_id, 'is_anomaly': True, 'voltage': 250}]})
+        self.assertEqual(result['classifications'], {self.reading_id: 'Idle_Stable'})
+        self.assertEqual(self.stored_labels(), {})
+
+    def test_resolved_readings_are_recorded(self):
+        reading = {'id': self.reading_id, 'is_anomaly': True, 'voltage': 250}
+        with mock.patch('power_monitor.services.analytics_jobs.resolve_readings', return_value=([reading], [])):
+            classify_job(mock.MagicMock(), {'reading_ids': [self.reading_id]})
+        self.assertEqual(self.stored_labels(), {self.reading_id: 'Idle_Stable'})
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        # A private registry that is never warmed up
+        self.registry = object.__new__(ModelRegistry)
+        self.registry.initialize()
+        patch = mock.patch.object(self.registry, 'warm_up')
+        self.warm_up = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_components_are_not_ready_before_warm_up(self):
+        for get in (self.registry.get_classifier, self.registry.get_explainer):
+            with self.assertRaises(ModelNotReady) as raised:
+                get()
+            self.assertEqual(raised.exception.state, 'idle')
+        self.assertEqual(self.warm_up.call_count, 2)
+
+    def test_views_answer_503_with_retry_after(self):
+        with mock.patch.object(views, 'model_registry', self.registry):
+            response = api_post(views.ClassifyReadingsView, '/api/ml/classify/',
+                                {'readings': [{'id': 'C-1-2025-04-01-10:00:00', 'is_anomaly': True, 'voltage': 250}]})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(self.registry.retry_after))
+        self.assertEqual(response.data['model_status']['classifier'], 'idle')
+
+    def test_reload_swaps_the_model_and_clears_versioned_caches(self):
+        self.registry._classifier = mock.MagicMock(model_version='model@a')
+        self.registry._explainer = mock.MagicMock()
+        self.registry._version = 'model@a'
+
+        events = AnomalyEventService()
+        node = f"reload-{id(self)}"
+        events.get_day_events(node, '2025', '04', '01', AnomalyDetectionService().detect_anomalies(
+            FakeFirebase([250.0] * 3).get_day_data(node, '2025', '04', '01')))
+        queue = object.__new__(JobQueue)
+        queue.initialize()
+        queue.register('sum', lambda job, params: sum(params['values']))
+        job, _ = queue.submit('sum', {'values': [1]}, model_version='model@a')
+        deadline = time.time() + 5
+        while not job.finished and time.time() < deadline:
+            time.sleep(0.01)
+        self.registry.add_swap_listener(events.invalidate_cache)
+        self.registry.add_swap_listener(queue.drop_finished)
+
+        classifier = mock.MagicMock(model_version='model@b')
+        explainer = mock.MagicMock()
+        with mock.patch('power_monitor.services.classifier_service.MLAnomalyClassifier', return_value=classifier), \
+                mock.patch('power_monitor.services.shap_service.ShapExplainerService', return_value=explainer):
+            self.assertTrue(self.registry.reload(background=False, force=True))
+
+        self.assertIs(self.registry.get_classifier(), classifier)
+        self.assertIs(self.registry.get_explainer(), explainer)
+        self.assertEqual(self.registry.get_version(), 'model@b')
+        self.assertEqual([entry['version'] for entry in self.registry.status()['history']], ['model@b'])
+        self.assertIsNone(events.get_cached_day_events(node, '2025', '04', '01'))
+        self.assertIsNone(queue.get(job.id))
+
+    def test_failed_reload_keeps_serving_the_current_model(self):
+        current = mock.MagicMock(model_version='model@a')
+        self.registry._classifier = current
+        self.registry._explainer = mock.MagicMock()
+        self.registry._version = 'model@a'
+        listener = mock.MagicMock()
+        self.registry.add_swap_listener(listener)
+
+        with mock.patch('power_monitor.services.classifier_service.MLAnomalyClassifier', side_effect=ValueError('corrupt')):
+            self.registry.reload(background=False, force=True)
+
+        self.assertIs(self.registry.get_classifier(), current)
+        self.assertEqual(self.registry.status()['reload'], 'failed')
+        listener.assert_not_called()
+
+
+@requires_model
+class ExplanationModeTests(SimpleTestCase):
+    """The approximate mode measured against exact TreeSHAP on the deployed model."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.explainer = ShapExplainerService(deployed_classifier())
+        rng = np.random.default_rng(0)
+        cls.readings = [
+            {'voltage': float(v), 'current': float(i), 'frequency': float(f), 'power': float(v * i * pf),
+             'power_factor': float(pf), 'is_anomaly': True}
+            for v, i, f, pf in zip(rng.uniform(180, 260, 200), rng.uniform(0, 20, 200),
+                                   rng.uniform(58, 62, 200), rng.uniform(0.5, 1, 200))
+        ]
+
+    def test_interactive_default_is_exact(self):
+        self.assertEqual(settings.ML_INTERACTIVE_EXPLAIN_MODE, 'exact')
+
+    def test_approximate_agreement_and_speed(self):
+        comparison = self.explainer.compare_modes(self.readings, mode='approximate', top_k=3)
+        self.assertEqual(comparison['rows'], 200)
+        # Saabas attributions pick the same top 3 features for under a third of the rows,
+        # which is why exact TreeSHAP stays the default
+        self.assertAlmostEqual(comparison['top_k_agreement'], 0.295, places=3)
+        self.assertAlmostEqual(comparison['sign_agreement'], 0.878, places=3)
+        self.assertLess(comparison['top_k_agreement'], 0.5)
+        self.assertGreater(comparison['speedup'], 10)
+
+    def test_fused_classes_equal_predict(self):
+        classifier = self.explainer.classifier
+        matrix, _ = classifier.feature_matrix(self.readings)
+        expected = classifier.model.predict(classifier.pipeline.to_frame(matrix))
+        for mode, max_trees in (('exact', None), ('approximate', None), ('exact', 10)):
+            fused = self.explainer.predict_and_explain(matrix, mode=mode, max_trees=max_trees)
+            np.testing.assert_array_equal(classifier.model.classes_[fused['class_indices']], expected, (mode, max_trees))
+
+    def test_exact_mode_matches_itself(self):
+        comparison = self.explainer.compare_modes(self.readings[:20], mode='exact', top_k=3)
+        self.assertEqual(comparison['top_k_agreement'], 1.0)
+        self.assertLess(comparison['mean_abs_error'], 1e-12)
+
+
+@requires_model
+class ExplanationCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.explainer = ShapExplainerService(deployed_classifier())
+
+    def setUp(self):
+        self.explainer.explanation_cache.clear()
+        self.readings = anomaly_readings(n=6, seed=3, on_grid=False)
+
+    def test_model_version_is_part_of_the_key(self):
+        explanation = self.explainer.explain_reading(self.readings[0])
+        self.assertEqual(self.explainer.cached_explanation(self.readings[0]), explanation)
+
+        with mock.patch.object(self.explainer.classifier, 'model_version', 'random_forest_model@000000000000'):
+            self.assertIsNone(self.explainer.cached_explanation(self.readings[0]))
+            with mock.patch.object(self.explainer, 'predict_and_explain', wraps=self.explainer.predict_and_explain) as fused:
+                other = self.explainer.explain_reading(self.readings[0])
+            fused.assert_called_once()
+        self.assertEqual(other['model_version'], 'random_forest_model@000000000000')
+        self.assertEqual(self.explainer.cached_explanation(self.readings[0]), explanation)
+
+    def test_batch_cache_hits_return_the_computed_payload(self):
+        batch = self.readings + [dict(self.readings[1]), {'id': 'C-1-2025-04-01-23:59:59', 'is_anomaly': True}]
+        with mock.patch.object(self.explainer, 'predict_and_explain', wraps=self.explainer.predict_and_explain) as fused:
+            computed = self.explainer.explain_batch(batch)
+            # Identical feature vectors are explained once
+            self.assertEqual(len(fused.call_args[0][0]), len(self.readings))
+            cached = self.explainer.explain_batch(batch)
+            fused.assert_called_once()
+
+        self.assertEqual(cached, computed)
+        self.assertIsNone(computed[-1])
+        self.assertEqual(computed[-2], computed[1])
+        matrix, _ = self.explainer.classifier.feature_matrix(self.readings)
+        labels = [self.explainer.classifier.prediction_to_label(p) for p in self.explainer.classifier.predict(matrix)]
+        self.assertEqual([explanation['predicted_class'] for explanation in computed[:len(self.readings)]], labels)
+
+
+class StatisticsTests(SimpleTestCase):
+    def setUp(self):
+        self.columns = readings_to_columns(synthetic_readings())
+        self.block = value_block(self.columns)
+
+    def test_merged_days_equal_the_whole(self):
+        cut = self.block.shape[1] // 3
+        merged = merge_statistics([partial_statistics(self.block[:, :cut]), partial_statistics(self.block[:, cut:])])
+        whole = partial_statistics(self.block)
+        for key in ('n', 'min', 'max'):
+            np.testing.assert_array_equal(merged[key], whole[key])
+        for key in ('sum', 'sumsq'):
+            np.testing.assert_allclose(merged[key], whole[key], rtol=1e-12)
+        for parameter in PARAMETERS:
+            np.testing.assert_array_equal(merged['histogram'][parameter], whole['histogram'][parameter])
+        self.assertEqual(finalize_statistics(merged), finalize_statistics(whole))
+
+    def test_exact_statistics_match_numpy(self):
+        stats = finalize_statistics(partial_statistics(self.block))
+        for parameter in PARAMETERS:
+            values = self.columns[parameter][~np.isnan(self.columns[parameter])]
+            self.assertEqual(stats[parameter]['percentiles'], 'exact')
+            self.assertEqual(stats[parameter]['count'], len(values))
+            self.assertAlmostEqual(stats[parameter]['avg'], round(float(values.mean()), 2))
+            self.assertAlmostEqual(stats[parameter]['std'], round(float(values.std()), 2))
+            for q in PERCENTILES:
+                self.assertAlmostEqual(stats[parameter][f"p{q}"], round(float(np.percentile(values, q)), 2))
+
+    def test_sketch_percentiles_are_within_one_grid_step(self):
+        stats = finalize_statistics(partial_statistics(self.block, exact_max=0))
+        for parameter in PARAMETERS:
+            values = self.columns[parameter][~np.isnan(self.columns[parameter])]
+            step = SKETCH_GRID[parameter][2]
+            self.assertEqual(stats[parameter]['percentiles'], 'sketch')
+            for q in PERCENTILES:
+                # Nearest rank on the grid against interpolated numpy percentiles, plus rounding
+                self.assertLessEqual(abs(stats[parameter][f"p{q}"] - np.percentile(values, q)), step + 0.01, (parameter, q))
+
+
+class SketchClippingTests(SimpleTestCase):
+    def setUp(self):
+        # 10% of the power readings lie far beyond the 25 kW sketch grid
+        rng = np.random.default_rng(4)
+        power = np.concatenate((rng.uniform(0, 4000, 900), rng.uniform(40000, 60000, 100)))
+        self.block = np.vstack([np.full(1000, 220.0), np.full(1000, 5.0), power, np.full(1000, 60.0), np.full(1000, 0.9)])
+
+    def test_clipped_percentiles_are_reported(self):
+        stats = finalize_statistics(partial_statistics(self.block, exact_max=0))
+        self.assertEqual(stats['power']['percentiles'], 'sketch')
+        self.assertEqual(stats['power']['clipped_percentiles'], ['p95', 'p99'])
+        self.assertEqual(stats['voltage']['clipped_percentiles'], [])
+        self.assertLessEqual(abs(stats['power']['p50'] - np.percentile(self.block[2], 50)), SKETCH_GRID['power'][2])
+
+    def test_clipped_percentiles_fall_back_to_the_values(self):
+        stats = finalize_statistics(partial_statistics(self.block, exact_max=0), self.block)
+        self.assertEqual(stats['power']['percentiles'], 'exact')
+        for q in PERCENTILES:
+            self.assertAlmostEqual(stats['power'][f"p{q}"], round(float(np.percentile(self.block[2], q)), 2))
+        # Parameters inside the grid keep the sketch
+        self.assertEqual(stats['voltage']['percentiles'], 'sketch')
+
+
+class InterruptionTests(SimpleTestCase):
+    def loop_runs(self, epoch, voltage, threshold=180):
+        """Reference: the runs of find_runs, one reading at a time."""
+        runs, current = [], None
+        for t, v in zip(epoch, voltage):
+            if v < threshold:
+                if current is None:
+                    current = [t, t, v, 0.0]
+                current[1], current[2] = t, min(current[2], v)
+            elif current is not None:
+                current[1] = t
+                runs.append(current)
+                current = None
+        if current is not None:
+            current[3] = 1.0
+            runs.append(current)
+        return np.array(runs, dtype=np.float64).reshape(-1, 4)
+
+    def test_find_runs_matches_a_loop(self):
+        rng = np.random.default_rng(3)
+        epoch = np.cumsum(rng.integers(1, 20, 5000))
+        for voltage in (rng.choice([100.0, 170.0, 220.0, 230.0], 5000), np.full(50, 120.0), np.full(50, 220.0)):
+            np.testing.assert_array_equal(find_runs(epoch[:len(voltage)], voltage), self.loop_runs(epoch[:len(voltage)], voltage))
+
+    def test_runs_across_midnight_are_joined(self):
+        epoch = np.arange(86400 - 600, 86400 + 600, 10)
+        voltage = np.where((epoch >= 86400 - 300) & (epoch < 86400 + 120), 90.0, 225.0)
+        midnight = np.searchsorted(epoch, 86400)
+        days = [day_runs(epoch[:midnight], voltage[:midnight]), day_runs(epoch[midnight:], voltage[midnight:])]
+        merged = merge_day_runs([(d['runs'], d['first_epoch'], d['first_low']) for d in days])
+        np.testing.assert_array_equal(merged, find_runs(epoch, voltage))
+        summary = summarize_runs(merged)
+        self.assertEqual(summary['count'], 1)
+        self.assertEqual(summary['details'][0]['duration_sec'], 420.0)
+        self.assertEqual(summary['details'][0]['severity'], 'critical')
+
+
+class RollupTests(SimpleTestCase):
+    def setUp(self):
+        self.readings = synthetic_readings(n=6000, seed=1)
+        self.columns = readings_to_columns(self.readings)
+
+    def test_day_rollup_equals_raw_statistics(self):
+        rollup_day = RollupService().build_day('C-1', '2025', '04', '01', self.readings)
+        day = rollup_day['tiers']['day']
+        self.assertEqual(int(day['count'].sum()), len(self.readings))
+        for j, parameter in enumerate(PARAMETERS):
+            values = self.columns[parameter]
+            values = values[~np.isnan(values)]
+            self.assertEqual(int(day['n'][:, j].sum()), len(values))
+            self.assertEqual(day['min'][:, j].min(), values.min())
+            self.assertEqual(day['max'][:, j].max(), values.max())
+            self.assertAlmostEqual(day['sum'][:, j].sum(), values.sum(), delta=1e-6 * abs(values.sum()))
+        self.assertEqual(RollupService().statistics([rollup_day])['voltage']['count'], len(self.readings))
+
+    def test_coarsened_tiers_equal_direct_rollups(self):
+        values = np.column_stack([self.columns[p] for p in PARAMETERS])
+        flags = np.zeros(values.shape, dtype=bool)
+        anomalous = self.columns['is_anomaly']
+        minute = rollup_columns(self.columns['epoch'], values, flags, anomalous, TIERS['minute'])
+        for tier in ('hour', 'day'):
+            direct = rollup_columns(self.columns['epoch'], values, flags, anomalous, TIERS[tier])
+            coarse = coarsen(minute, TIERS[tier])
+            for key in direct:
+                np.testing.assert_allclose(coarse[key], direct[key], rtol=1e-12, err_msg=f"{tier} {key}")
+
+
+class RollupStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(ROLLUP_DIR=directory):
+            # A private service instead of the process-wide singleton
+            self.service = object.__new__(RollupService)
+            self.service.initialize()
+        self.firebase = FakeFirebase(voltages=[220.0] * 50 + [250.0] * 5 + [220.0] * 5)
+        patch = mock.patch('power_monitor.services.firebase_service.FirebaseService', return_value=self.firebase)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_closed_days_are_built_from_a_fresh_fetch(self):
+        rollup_day = self.service.get_day('C-1', '2025', '04', '01')
+        self.assertEqual(self.firebase.calls, [('C-1', '2025', '04', '01', False)])
+        self.assertEqual(rollup_day['count'], 60)
+        self.assertEqual(len(rollup_day['anomalies']), 5)
+        stored = self.service._load(self.service._path('C-1', '2025', '04', '01'))
+        self.assertEqual((stored['count'], stored['last_epoch']), (60, rollup_day['last_epoch']))
+
+    def test_materialize_ignores_partial_copies_and_rebuilds_after_late_uploads(self):
+        partial = self.firebase.get_day_data('C-1', '2025', '04', '01')[10:]
+        self.assertTrue(self.service.materialize('C-1', '2025', '04', '01', partial))
+        self.assertEqual(self.service.get_day('C-1', '2025', '04', '01')['count'], 60)
+        self.assertFalse(self.service.materialize('C-1', '2025', '04', '01', partial))
+
+        self.firebase.voltages = self.firebase.voltages + [220.0] * 10
+        late = self.firebase.get_day_data('C-1', '2025', '04', '01')
+        self.assertTrue(self.service.materialize('C-1', '2025', '04', '01', late))
+        self.assertEqual(self.service.get_day('C-1', '2025', '04', '01')['count'], 70)
+        self.assertEqual(self.service._load(self.service._path('C-1', '2025', '04', '01'))['count'], 70)
+
+    def test_failed_fetches_are_not_persisted(self):
+        self.firebase.error = ConnectionError('firebase unavailable')
+        rollup_day = self.service.get_day('C-1', '2025', '04', '01')
+        self.assertIsNone(rollup_day['first_epoch'])
+        self.assertFalse(os.path.exists(self.service._path('C-1', '2025', '04', '01')))
+
+    def test_rollup_dashboard_keeps_every_anomaly(self):
+        not_ready = views.ModelNotReady('classifier', 'loading', 5)
+        dates = [datetime(2025, 4, day) for day in range(1, 10)]
+        with mock.patch.object(views, 'rollup_service', self.service), \
+                mock.patch.object(views.model_registry, 'get_classifier', side_effect=not_ready):
+            data = views.DashboardDataView().rollup_response('C-1', dates, 400)
+        anomalies = [r for r in data['readings'] if r['is_anomaly']]
+        self.assertEqual(len(anomalies), 5 * len(dates))
+        self.assertTrue(all(r['anomaly_type'] == 'Unclassified' and 'voltage' in r['anomaly_parameters'] for r in anomalies))
+        self.assertEqual(sum(r['count'] for r in data['readings'] if r.get('aggregated')), 60 * len(dates))
+        timestamps = epoch_seconds([r['timestamp'] for r in data['readings']])
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+
+
+class DownsamplingTests(SimpleTestCase):
+    def setUp(self):
+        self.readings = synthetic_readings(n=4000, seed=2)
+
+    def test_buckets_keep_every_anomaly_in_time_order(self):
+        rows, info = downsample(self.readings, 200)
+        self.assertEqual(info['method'], 'buckets')
+        anomalies = [r for r in self.readings if r['is_anomaly']]
+        self.assertEqual([r for r in rows if not r.get('aggregated')], sorted(anomalies, key=lambda r: r['timestamp']))
+        self.assertEqual(sum(r['count'] for r in rows if r.get('aggregated')), len(self.readings) - len(anomalies))
+        self.assertEqual([r['timestamp'] for r in rows], sorted(r['timestamp'] for r in rows))
+
+    def test_bucket_means_match_numpy(self):
+        columns = readings_to_columns(self.readings)
+        rows = bucket_aggregates(columns, 86400)
+        self.assertEqual(len(rows), 1)
+        self.assertAlmostEqual(rows[0]['power'], round(float(np.nanmean(columns['power'])), 4))
+        self.assertEqual(rows[0]['voltage_min'], float(np.nanmin(columns['voltage'])))
+
+    def test_lttb_keeps_endpoints_and_anomalies(self):
+        x = np.arange(1000, dtype=np.float64)
+        picks = lttb_indices(x, np.sin(x / 50), 100)
+        self.assertEqual(len(picks), 100)
+        self.assertEqual((picks[0], picks[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(picks) > 0))
+
+        rows, info = downsample(self.readings, 300, method='lttb', parameter='voltage')
+        anomalies = sum(r['is_anomaly'] for r in self.readings)
+        self.assertEqual(len(rows), 300 + anomalies)
+        self.assertEqual(sum(r['is_anomaly'] for r in rows), anomalies)
+
+
+class ExplanationPrecomputerTests(SimpleTestCase):
+    def setUp(self):
+        with override_settings(ML_PRECOMPUTE_EXPLANATIONS=True, ML_PRECOMPUTE_MAX_QUEUE=3):
+            # A private precomputer instead of the process-wide singleton, without its worker thread
+            self.precomputer = object.__new__(ExplanationPrecomputer)
+            self.precomputer.initialize()
+        self.precomputer._start = lambda: None
+        patch = mock.patch('power_monitor.services.explanation_precompute.ModelRegistry.get_version', return_value='model@a')
+        self.get_version = patch.start()
+        self.addCleanup(patch.stop)
+
+    def anomalies(self, *ids):
+        return [{'id': reading_id, 'is_anomaly': True, 'timestamp': '2025-04-01T10:00:00'} for reading_id in ids]
+
+    def test_uses_the_interactive_mode(self):
+        self.assertEqual(self.precomputer.mode, settings.ML_INTERACTIVE_EXPLAIN_MODE)
+
+    def test_disabled_unless_enabled_through_the_environment(self):
+        self.assertEqual(settings.ML_PRECOMPUTE_EXPLANATIONS, os.environ.get('ML_PRECOMPUTE_EXPLANATIONS', '').lower() == 'true')
+        with override_settings(ML_PRECOMPUTE_EXPLANATIONS=False):
+            precomputer = object.__new__(ExplanationPrecomputer)
+            precomputer.initialize()
+        self.assertEqual(precomputer.enqueue(self.anomalies('a')), 0)
+
+    def test_readings_are_queued_again_for_a_new_model_version(self):
+        self.assertEqual(self.precomputer.enqueue(self.anomalies('a', 'b')), 2)
+        self.assertEqual(self.precomputer.enqueue(self.anomalies('a', 'b')), 0)
+        self.precomputer._queue.clear()
+        self.get_version.return_value = 'model@b'
+        self.assertEqual(self.precomputer.enqueue(self.anomalies('a', 'b')), 2)
+
+    def test_full_queue_drops_new_readings_until_there_is_room(self):
+        self.assertEqual(self.precomputer.enqueue(self.anomalies('a', 'b', 'c', 'd', 'e')), 3)
+        self.assertEqual(len(self.precomputer._queue), 3)
+        self.assertEqual(self.precomputer.get_stats()['dropped'], 2)
+        self.precomputer._next_batch()
+        self.assertEqual(self.precomputer.enqueue(self.anomalies('d', 'e')), 2)
+
+
+class ChartParameterTests(SimpleTestCase):
+    def test_unknown_lttb_parameter_is_rejected(self):
+        with self.assertRaises(ValueError):
+            downsample(synthetic_readings(n=100), 10, method='lttb', parameter='nonsense')
+
+    def test_node_data_rejects_bad_chart_parameters(self):
+        base = {'node': 'C-1', 'year': '2025', 'month': '04', 'day': '01'}
+        for params, name in (({'parameter': 'nonsense'}, 'parameter'), ({'max_points': 'many'}, 'max_points'),
+                             ({'width': '12.5'}, 'width'), ({'limit': 'all'}, 'limit')):
+            response = api_get(views.NodeDataView, '/api/firebase/data/', {**base, **params})
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(name, response.data['error'])
+
+    def test_dashboard_rejects_bad_chart_parameters(self):
+        base = {'node': 'C-1', 'start_date': '2025-04-01', 'end_date': '2025-04-02'}
+        for params, name in (({'graph_type': 'nonsense'}, 'graph_type'), ({'max_points': 'many'}, 'max_points'),
+                             ({'width': '-5'}, 'width')):
+            response = api_get(views.DashboardDataView, '/api/dashboard/', {**base, **params})
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(name, response.data['error'])
+
+
+class AnomalyEventTests(SimpleTestCase):
+    def setUp(self):
+        self.service = AnomalyEventService()
+        self.node = f"events-{id(self)}"
+        self.addCleanup(self.service.invalidate_cache)
+
+    def day(self, voltages):
+        return AnomalyDetectionService().detect_anomalies(FakeFirebase(voltages).get_day_data(self.node, '2025', '04', '01'))
+
+    def test_cached_events_are_rebuilt_when_the_day_grows(self):
+        morning = self.day([220.0] * 10 + [250.0] * 3)
+        self.assertEqual(len(self.service.get_day_events(self.node, '2025', '04', '01', morning)), 1)
+        self.assertEqual(self.service.get_cached_day_events(self.node, '2025', '04', '01', morning), self.service.get_cached_day_events(self.node, '2025', '04', '01'))
+
+        later = self.day([220.0] * 10 + [250.0] * 3 + [220.0] * 5 + [100.0] * 3)
+        self.assertIsNone(self.service.get_cached_day_events(self.node, '2025', '04', '01', later))
+        events = self.service.get_day_events(self.node, '2025', '04', '01', later)
+        self.assertEqual([(e['parameter'], e['direction']) for e in events], [('voltage', 'high'), ('voltage', 'low')])
+
+    def test_swap_listener_clears_the_events(self):
+        self.service.get_day_events(self.node, '2025', '04', '01', self.day([250.0] * 3))
+        self.service.invalidate_cache('model@a', 'model@b')
+        self.assertIsNone(self.service.get_cached_day_events(self.node, '2025', '04', '01'))
+
+    def test_unknown_parameter_is_a_bad_request(self):
+        response = api_get(views.AnomalyEventsView, '/api/anomaly-events/',
+                           {'node': 'C-1', 'start_date': '2025-04-01', 'end_date': '2025-04-01', 'parameter': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parameter', response.data['error'])
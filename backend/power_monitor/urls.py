@@ -15,14 +15,23 @@ from .views import (
     DaysForNodeYearMonthView,
     NodeDataView,
     DashboardDataView,
+    AnomalyEventsView,
     UserRegistrationView,
     UserLoginView,
     export_csv,
     user_profile,
     ClassifyReadingsView,
     ExplainAnomalyView,
+    ExplainAnomaliesView,
     GlobalFeatureImportanceView,
     TestMLClassifierView,
+    ModelStatsView,
+    ModelReloadView,
+    ExplanationModeComparisonView,
+    AnalyticsJobsView,
+    AnalyticsJobView,
+    AnalyticsJobResultView,
+    AnalyticsJobCancelView,
 )
 
 # Create a router and register our ViewSets
@@ -49,6 +58,7 @@ urlpatterns = [
     path('firebase/days/', DaysForNodeYearMonthView.as_view(), name='days-for-node-year-month'),
     path('firebase/node-data/', NodeDataView.as_view(), name='node-data'),
     path('firebase/dashboard-data/', DashboardDataView.as_view(), name='dashboard-data'),
+    path('firebase/anomaly-events/', AnomalyEventsView.as_view(), name='anomaly-events'),
     path('auth/register/', UserRegistrationView.as_view(), name='register'),
     path('auth/login/', UserLoginView.as_view(), name='login'),
     path('power-readings/export-csv/', export_csv, name='export_csv'),
@@ -56,6 +66,14 @@ urlpatterns = [
     path('firebase/node-date-range/', NodeDateRangeView.as_view(), name='node-date-range'),
     path('classify-readings/', ClassifyReadingsView.as_view(), name='classify-readings'),
     path('explain-anomaly/', ExplainAnomalyView.as_view(), name='explain-anomaly'),
+    path('explain-anomalies/', ExplainAnomaliesView.as_view(), name='explain-anomalies'),
     path('global-feature-importance/', GlobalFeatureImportanceView.as_view(), name='global-feature-importance'),
     path('test-ml-classifier/', TestMLClassifierView.as_view(), name='test-ml-classifier'),
+    path('ml/stats/', ModelStatsView.as_view(), name='ml-stats'),
+    path('ml/explain-modes/compare/', ExplanationModeComparisonView.as_view(), name='ml-explain-modes-compare'),
+    path('ml/reload/', ModelReloadView.as_view(), name='ml-reload'),
+    path('ml/jobs/', AnalyticsJobsView.as_view(), name='ml-jobs'),
+    path('ml/jobs/<str:job_id>/', AnalyticsJobView.as_view(), name='ml-job'),
+    path('ml/jobs/<str:job_id>/result/', AnalyticsJobResultView.as_view(), name='ml-job-result'),
+    path('ml/jobs/<str:job_id>/cancel/', AnalyticsJobCancelView.as_view(), name='ml-job-cancel'),
 ]
\ No newline at end of file
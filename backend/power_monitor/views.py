@@ -5,8 +5,10 @@ from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.viewsets import ViewSet
 from rest_framework.decorators import action
+from django.conf import settings
 from .services.firebase_service import FirebaseService
 from .services.anomaly_service import AnomalyDetectionService
+from .services.event_service import AnomalyEventService
 from .services.cache_service import CacheService
 from datetime import datetime, timedelta
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -15,9 +17,10 @@ from .serializers import UserRegistrationSerializer, UserLoginSerializer
 from django.contrib.auth.hashers import make_password
 from .mongo_utils import save_user, find_user_by_email, authenticate_user
 import csv
+import time
 from django.http import HttpResponse
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from .services.cache_service import CacheService
@@ -30,19 +33,111 @@ from rest_framework.response import Response
 from rest_framework import status
 from .services.cache_service import CacheService
 
-# Import the ML service
-from .services.classifier_service import MLAnomalyClassifier
-
-# Import XAI service
-from .services.shap_service import ShapExplainerService
+# Import the ML model registry - the classifier and SHAP explainer load lazily
+from .services.model_registry import ModelRegistry, ModelNotReady
+from .services.classification_store import ClassificationStore
+from .services.reading_resolver import ReadingResolver
+from .services.importance_service import FeatureImportanceService
+from .services.job_service import JobQueue
+from .services.explanation_precompute import ExplanationPrecomputer
+from .services.downsampling_service import downsample
+from .services.rollup_service import RollupService, TIERS
+from .services.interruption_service import InterruptionService, merge_day_runs, summarize_runs
+from .services.column_service import PARAMETERS, epoch_seconds, readings_to_columns
+from .services.statistics_service import finalize_statistics, partial_statistics, value_block
+from .services.analytics_jobs import register_jobs, explanation_entries
 
 anomaly_detector = AnomalyDetectionService()
-# Initialize the ML classifier (singleton pattern)
+anomaly_event_service = AnomalyEventService()
+
+# The registry loads the ML classifier and SHAP service on first use (singleton pattern)
+model_registry = ModelRegistry()
+# Cached events carry model labels, drop them when a new model version is swapped in
+model_registry.add_swap_listener(anomaly_event_service.invalidate_cache)
+# Labels already assigned by a model version are reused instead of classifying again
+classification_store = ClassificationStore()
+# Long-running XAI computations run as background jobs polled by job id
+job_queue = register_jobs(JobQueue())
+# Job results describe the model that computed them
+model_registry.add_swap_listener(job_queue.drop_finished)
+# Newly detected anomalies are explained in the background within a CPU budget
+explanation_precomputer = ExplanationPrecomputer()
+
+# Minute/hour/day rollups per node-day for long dashboard ranges
+rollup_service = RollupService()
+
+# Power interruption runs per node-day
+interruption_service = InterruptionService()
+
+def model_not_ready_response(error):
+    """Build a 503 response telling the client when to retry a model-backed request."""
+    response = Response(
+        {
+            "error": f"The {error.component} is not ready yet ({error.state}), retry shortly",
+            "model_status": model_registry.status()
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+def submit_job_response(kind, params):
+    """Queue a background job and answer 202 with its id and status URL."""
+    job, deduplicated = job_queue.submit(kind, params, model_version=model_registry.get_version())
+    return Response(
+        {
+            **job.to_dict(),
+            "deduplicated": deduplicated,
+            "status_url": f"/api/ml/jobs/{job.id}/"
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
+def int_param(value, name, default=None, minimum=None, maximum=None):
+    """Parse an integer request parameter (ValueError naming the parameter if invalid)."""
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    if maximum is not None and number > maximum:
+        raise ValueError(f"{name} must be at most {maximum}")
+    return number
 
-ml_classifier = MLAnomalyClassifier()
+def explanation_options(request, default_mode='exact', default_max_trees=None):
+    """Read the explanation mode and tree budget of a request (ValueError if invalid)."""
+    mode = request.data.get('mode', default_mode)
+    if mode not in ('exact', 'approximate'):
+        raise ValueError("mode must be 'exact' or 'approximate'")
+    max_trees = int_param(request.data.get('max_trees'), 'max_trees', default=default_max_trees, minimum=1)
+    return mode, max_trees
+
+def chart_point_budget(request, default):
+    """Number of points a chart can show: max_points, or the chart width in pixels (ValueError if invalid)."""
+    name = 'max_points' if request.query_params.get('max_points') else 'width'
+    budget = int_param(request.query_params.get(name), name, minimum=1)
+    return max(3, budget) if budget else default
+
+def chart_parameter(value, name='parameter'):
+    """Reading parameter a chart plots, accepting the frontend's 'powerFactor' (ValueError if unknown)."""
+    parameter = 'power_factor' if value == 'powerFactor' else value
+    if parameter not in PARAMETERS:
+        raise ValueError(f"{name} must be one of {', '.join(PARAMETERS)}")
+    return parameter
+
+def resolve_request_readings(request, key='readings'):
+    """Get the readings of a request, uploaded in full or referenced by id / node and date range.
+    
+    Returns a tuple of (readings, missing reading ids). Raises ValueError for malformed references.
+    """
+    readings = request.data.get(key)
+    if readings or not ReadingResolver.has_reference(request.data):
+        return readings or [], []
+    return ReadingResolver(anomaly_detector=anomaly_detector).resolve(request.data)
 
-# Initialize the SHAP service as a singleton
-shap_explainer = ShapExplainerService()
 # Add these new view classes at the end of the file:
 
 class CacheStatsView(APIView):
@@ -543,7 +638,14 @@ class NodeDataView(APIView):
             day = request.query_params.get('day')
             use_cache = request.query_params.get('use_cache', 'true').lower() == 'true'
             since_timestamp = request.query_params.get('since_timestamp')
-            limit = int(request.query_params.get('limit', '5000000'))
+            try:
+                limit = chart_point_budget(
+                    request, int_param(request.query_params.get('limit'), 'limit', default=5000000, minimum=1)
+                )
+                parameter = chart_parameter(request.query_params.get('parameter', 'power'))
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            downsample_method = request.query_params.get('downsample', 'lttb')
             classify = request.query_params.get('classify', 'false').lower() == 'true'
             
             if not node or not year or not month:
@@ -568,36 +670,37 @@ class NodeDataView(APIView):
                     since_timestamp=since_timestamp
                 )
             
-            # Apply sampling to reduce data volume if needed
-            if len(data) > limit:
-                # Keep first and last readings
-                first_readings = data[:10]
-                last_readings = data[-10:]
-                
-                # Sample the middle readings
-                step = max(1, (len(data) - 20) // (limit - 20))
-                middle_readings = data[10:-10:step]
-                
-                # Combine and sort
-                data = first_readings + middle_readings + last_readings
-                data.sort(key=lambda x: x['timestamp'])
-                
-                print(f"NodeDataView: Sampled data from {len(data)} to {limit} readings")
-                
             print(f"NodeDataView: Fetched {len(data)} readings")
 
             # Apply threshold-based anomaly detection
             detected_readings = anomaly_detector.detect_anomalies(data)
             
+            # Downsample to the point budget, keeping every anomaly
+            if len(detected_readings) > limit:
+                try:
+                    detected_readings, info = downsample(
+                        detected_readings, limit, method=downsample_method, parameter=parameter
+                    )
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                print(f"NodeDataView: Downsampled {len(data)} readings to {len(detected_readings)} ({info['resolution']})")
+            
             anomaly_count = sum(1 for r in detected_readings if r.get('is_anomaly', False))
             print(f"NodeDataView: Detected {anomaly_count} anomalies out of {len(detected_readings)} readings")
             
-            # Mark anomalies for lazy classification instead of classifying immediately
-            for reading in detected_readings:
-                if reading.get('is_anomaly', False):
-                    reading['anomaly_type'] = 'Unclassified'
-                else:
-                    reading['anomaly_type'] = 'Normal'
+            # Return labels already stored for the current model. Unseen anomalies stay
+            # 'Unclassified' for lazy classification unless classify=true was requested.
+            ml_classifier = None
+            if classify:
+                try:
+                    ml_classifier = model_registry.get_classifier()
+                except ModelNotReady:
+                    pass
+            classified_count = classification_store.apply(
+                detected_readings, model_registry.get_version(), ml_classifier
+            )
+            print(f"NodeDataView: Classified {classified_count} previously unseen anomalies")
+            explanation_precomputer.enqueue(detected_readings, anomaly_detector.thresholds)
             
             return Response(detected_readings)
             
@@ -620,6 +723,8 @@ class DashboardDataView(APIView):
             start_date = request.query_params.get('start_date')
             end_date = request.query_params.get('end_date')
             graph_type = request.query_params.get('graph_type', 'power')
+            # 'rows' returns every anomalous reading, 'events' returns aggregated anomaly events
+            anomaly_format = request.query_params.get('anomaly_format', 'rows')
             
             if not node or not start_date or not end_date:
                 return Response(
@@ -649,37 +754,33 @@ class DashboardDataView(APIView):
             # Initialize Firebase service
             firebase_service = FirebaseService()
             
-            # Determine appropriate sampling mode based on date range size
+            # The chart resolution follows from the point budget, whatever the date range
             days_diff = (end_date_obj - start_date_obj).days + 1
+            try:
+                max_points = chart_point_budget(request, getattr(settings, 'CHART_MAX_POINTS', 4000))
+                chart_parameter(graph_type, 'graph_type')
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            downsample_method = request.query_params.get('downsample', 'buckets')
+            if downsample_method not in ('buckets', 'lttb'):
+                return Response(
+                    {"error": "downsample must be 'buckets' or 'lttb'"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Estimate total number of data points (assuming ~1 reading per 30 seconds)
-            estimated_total = days_diff * 86400 // 30  # ~2880 points per day
-            
-            # Calculate target number of points based on range size
-            target_count = 0
-            resolution = ''
-            
-            if days_diff > 30:  # More than a month
-                target_count = 10000
-                resolution = 'day'
-            elif days_diff > 7:  # More than a week
-                target_count = 20000
-                resolution = 'hour'
-            elif days_diff > 2:  # More than 2 days
-                target_count = 30000
-                resolution = 'minute'
-            else:
-                target_count = 50000  # For 1-2 days, keep more detail
-                resolution = 'raw'
-            
-            # Calculate appropriate sampling rate to reach target count
-            sampling_rate = max(1, (estimated_total // target_count) + 1)
+            # Long ranges are answered from the materialized rollups instead of the raw readings.
+            # Rollups carry counts, not individual events, so event listings stay on the raw path.
+            source = request.query_params.get('source', 'auto')
+            if (source != 'raw' and anomaly_format != 'events'
+                    and days_diff > getattr(settings, 'DASHBOARD_ROLLUP_MIN_DAYS', 7)):
+                print(f"Processing {days_diff} days of data from rollups with a budget of {max_points} points")
+                return Response(self.rollup_response(node, date_range, max_points))
             
-            print(f"Processing {days_diff} days of data. Estimated points: {estimated_total}, " +
-                  f"Target: {target_count}, Sampling rate: {sampling_rate}, Resolution: {resolution}")
+            print(f"Processing {days_diff} days of data with a budget of {max_points} points ({downsample_method})")
             
             # Fetch data with progress tracking
             all_readings = []
+            day_slices = []
             
             # Fetch all days in the range
             for date in date_range:
@@ -689,52 +790,79 @@ class DashboardDataView(APIView):
                 
                 # Use the get_day_data method from FirebaseService
                 day_readings = firebase_service.get_day_data(node, year, month, day, use_cache=True)
+                day_slices.append((year, month, day, len(all_readings), len(all_readings) + len(day_readings)))
                 all_readings.extend(day_readings)
             
             print(f"Total readings fetched: {len(all_readings)}")
             
             # Apply anomaly detection
-            processed_readings = self.process_anomalies(all_readings)
+            processed_readings, model_version = self.process_anomalies(all_readings)
             print(f"Anomaly detection completed")
             
-            # Apply sampling if needed
-            if sampling_rate > 1:
-                processed_readings = self.sample_data(processed_readings, sampling_rate)
-                print(f"Sampling applied at rate 1:{sampling_rate}, readings count: {len(processed_readings)}")
+            # Aggregate anomalies into events on the unsampled readings, cached per node-day.
+            # Events built before the classifier is ready are not cached.
+            anomaly_events = []
+            for year, month, day, start, end in day_slices:
+                anomaly_events.extend(anomaly_event_service.get_day_events(
+                    node, year, month, day, processed_readings[start:end], use_cache=model_version is not None
+                ))
+            anomaly_events = anomaly_event_service.merge_adjacent(anomaly_events)
+            
+            # Materialize the rollups of closed days while their readings are at hand
+            for year, month, day, start, end in day_slices:
+                rollup_service.materialize(node, year, month, day, processed_readings[start:end])
+            
+            # Column arrays of the unsampled readings, shared by statistics, interruptions and downsampling
+            columns = readings_to_columns(processed_readings) if processed_readings else None
             
             # Calculate statistics for all parameters
-            statistics = self.calculate_statistics(processed_readings)
+            statistics = self.calculate_statistics(processed_readings, columns)
             
-            # Detect interruptions
-            interruptions = self.detect_interruptions(processed_readings)
+            # Detect interruptions on every reading, per node-day
+            interruptions = self.detect_interruptions(
+                node, [(year, month, day) for year, month, day, _, _ in day_slices], columns
+            )
             
             # Generate anomaly summary
-            anomaly_summary = self.generate_anomaly_summary(processed_readings)
-            
-            # Prepare graph data for all parameters
-            graph_data = self.prepare_graph_data(processed_readings)
+            anomaly_summary = self.generate_anomaly_summary(processed_readings, anomaly_events)
             
             # Get the latest reading for PowerQualityStatus component
             latest_reading = None
             if processed_readings:
-                latest_readings = sorted(processed_readings, 
-                                       key=lambda x: x['timestamp'] if 'timestamp' in x else '',
-                                       reverse=True)
-                latest_reading = latest_readings[0] if latest_readings else None
+                latest_reading = max(processed_readings, key=lambda x: x['timestamp'] if 'timestamp' in x else '')
+            
+            # Statistics above use every reading; the charts get the downsampled series
+            chart_readings, downsampling = downsample(
+                processed_readings, max_points, method=downsample_method,
+                parameter=chart_parameter(graph_type), columns=columns
+            )
+            print(f"Downsampled {len(processed_readings)} readings to {len(chart_readings)} ({downsampling['resolution']})")
+            
+            # Prepare graph data for all parameters
+            graph_data = self.prepare_graph_data(chart_readings)
             
             response_data = {
-                "readings": processed_readings,
-                "resolution": resolution,
+                "readings": chart_readings,
+                "resolution": downsampling['resolution'],
+                "bucket_seconds": downsampling['bucket_seconds'],
+                "downsampling": downsampling['method'],
                 "total_readings": len(all_readings),
-                "displayed_readings": len(processed_readings),
-                "sampling_rate": sampling_rate,
+                "displayed_readings": len(chart_readings),
+                "sampling_rate": max(1, round(len(processed_readings) / max(1, len(chart_readings)))),
                 "statistics": statistics,
                 "interruptions": interruptions,
                 "anomaly_summary": anomaly_summary,
                 "graph_data": graph_data,
-                "latest_reading": latest_reading
+                "latest_reading": latest_reading,
+                "model_version": model_version,
+                "source": "raw"
             }
             
+            # Clients asking for events get them instead of the raw anomalous rows
+            if anomaly_format == 'events':
+                response_data["readings"] = [r for r in chart_readings if not r.get('is_anomaly', False)]
+                response_data["anomaly_events"] = anomaly_events
+            
             return Response(response_data)
             
         except Exception as e:
@@ -745,161 +873,119 @@ class DashboardDataView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def rollup_response(self, node, date_range, max_points):
+        """Build the dashboard data of a date range from the per node-day rollups"""
+        rollup_days = [
+            rollup_service.get_day(node, str(date.year), str(date.month).zfill(2), str(date.day).zfill(2))
+            for date in date_range
+        ]
+        tier = rollup_service.choose_tier(len(date_range), max_points)
+        rollup = rollup_service.tier_rows(rollup_days, tier)
+        total_readings = int(rollup['count'].sum())
+        
+        # Like the raw path, every anomalous reading is charted as is (with its model label)
+        # on top of the bucket rows
+        anomalies, model_version = self.process_anomalies(
+            [dict(reading) for rollup_day in rollup_days for reading in rollup_day['anomalies']]
+        )
+        chart_readings = rollup_service.chart_rows(rollup, tier) + anomalies
+        chart_epochs = epoch_seconds([reading['timestamp'] for reading in chart_readings])
+        chart_readings = [chart_readings[i] for i in chart_epochs.argsort(kind='stable')]
+        
+        # Anomaly summary from the bucket counts and the per-day event counts
+        parameter_counts = dict(zip(PARAMETERS, rollup['anomalies_by_parameter'].sum(axis=0).tolist()))
+        event_counts = rollup_service.event_counts(rollup_days)
+        anomaly_summary = self.summarize_anomaly_counts(
+            int(rollup['anomalies'].sum()), total_readings, parameter_counts, event_counts
+        )
+        
+        # Interruptions from the per-day low voltage runs, joined across midnight
+        interruptions = self.add_readable_durations(summarize_runs(merge_day_runs([
+            (d['runs'], d['first_epoch'], d['first_low']) for d in rollup_days if d['first_epoch'] is not None
+        ])))
+        
+        # Classify the latest reading like the raw path does
+        latest_reading = next((d['latest_reading'] for d in reversed(rollup_days) if d['latest_reading']), None)
+        if latest_reading:
+            processed, model_version = self.process_anomalies([latest_reading])
+            latest_reading = processed[0]
+        
+        return {
+            "readings": chart_readings,
+            "resolution": tier,
+            "bucket_seconds": TIERS[tier],
+            "downsampling": "rollup",
+            "total_readings": total_readings,
+            "displayed_readings": len(chart_readings),
+            "sampling_rate": max(1, round(total_readings / max(1, len(chart_readings)))),
+            "statistics": rollup_service.statistics(rollup_days),
+            "interruptions": interruptions,
+            "anomaly_summary": anomaly_summary,
+            "graph_data": self.prepare_graph_data(chart_readings),
+            "latest_reading": latest_reading,
+            "model_version": model_version,
+            "source": "rollups"
+        }
+    
     def process_anomalies(self, readings):
-        """Apply anomaly detection to readings"""
+        """Apply anomaly detection to readings
+        
+        Returns the processed readings and the version of the model that labelled
+        them (None while the classifier is still loading).
+        """
         if not readings:
-            return []
+            return [], model_registry.get_version()
         
         # First detect anomalies using threshold-based method
         processed_readings = anomaly_detector.detect_anomalies(readings)
         
-        # Then apply ML classifier to categorize anomalies
-        classified_readings = ml_classifier.classify_batch(processed_readings)
-        
-        return classified_readings
-    
-    def sample_data(self, data, sampling_rate):
-        """Sample data while preserving anomalies"""
-        if not data or sampling_rate <= 1:
-            return data
-        
-        # Keep all anomalies
-        anomalies = [r for r in data if r.get('is_anomaly', False)]
-        # Get regular readings
-        regular_readings = [r for r in data if not r.get('is_anomaly', False)]
-        
-        print(f"Sampling {len(regular_readings)} regular readings at rate 1:{sampling_rate}")
-        print(f"Preserving {len(anomalies)} anomalies")
-        
-        # Sample regular readings
-        sampled_regular = [regular_readings[i] for i in range(0, len(regular_readings), sampling_rate)]
+        # Then categorize anomalies, sending only readings without a stored label to the ML classifier
+        try:
+            ml_classifier = model_registry.get_classifier()
+        except ModelNotReady:
+            # Keep serving data while the model loads; anomalies stay unclassified
+            for reading in processed_readings:
+                reading['anomaly_type'] = 'Unclassified' if reading.get('is_anomaly', False) else 'Normal'
+            return processed_readings, None
         
-        # Combine and sort by timestamp
-        combined = anomalies + sampled_regular
-        combined.sort(key=lambda x: x['timestamp'])
+        classification_store.apply(processed_readings, classifier=ml_classifier)
+        explanation_precomputer.enqueue(processed_readings, anomaly_detector.thresholds)
         
-        return combined
+        return processed_readings, ml_classifier.model_version
     
-    def calculate_statistics(self, readings):
-        """Calculate statistics for each parameter"""
+    def calculate_statistics(self, readings, columns=None):
+        """Calculate statistics for each parameter in one vectorized pass over the columns
+        
+        Adds std and p5/p50/p95/p99 to min, max, avg and count; percentiles are
+        exact up to STATS_EXACT_MAX_READINGS readings and from a histogram sketch
+        above, unless they fall beyond the sketch grid.
+        """
         if not readings:
             return {}
         
-        # Parameters to analyze
-        parameters = ['voltage', 'current', 'power', 'frequency', 'power_factor']
-        
-        # Initialize statistics
-        stats = {}
-        
-        for param in parameters:
-            # Get values for this parameter
-            values = [reading[param] for reading in readings if param in reading]
-            
-            if values:
-                param_stats = {
-                    'min': min(values),
-                    'max': max(values),
-                    'avg': sum(values) / len(values),
-                    'count': len(values)
-                }
-                
-                # Round values for readability
-                for key in ['min', 'max', 'avg']:
-                    param_stats[key] = round(param_stats[key], 2)
-                
-                # Add to overall stats
-                stats[param] = param_stats
-        
-        return stats
+        columns = columns if columns is not None else readings_to_columns(readings)
+        exact_max = getattr(settings, 'STATS_EXACT_MAX_READINGS', 100000)
+        block = value_block(columns)
+        return finalize_statistics(partial_statistics(block, exact_max=exact_max), block)
     
-    def detect_interruptions(self, readings, voltage_threshold=180, min_duration_sec=30):
-        """Detect power interruptions in readings"""
-        if not readings:
-            return {'count': 0, 'avg_duration_min': 0, 'details': []}
+    def detect_interruptions(self, node, days, columns):
+        """Detect power interruptions in the unsampled columns of consecutive node-days
         
-        # Sort readings by timestamp
-        sorted_readings = sorted(readings, key=lambda x: x['timestamp'])
-        
-        interruptions = []
-        in_interruption = False
-        interruption_start = None
-        min_voltage = None
-        
-        # Process each reading to find interruptions
-        for i, reading in enumerate(sorted_readings):
-            # Check if voltage below threshold
-            if reading['voltage'] < voltage_threshold:
-                # Start of interruption
-                if not in_interruption:
-                    in_interruption = True
-                    interruption_start = reading['timestamp']
-                    min_voltage = reading['voltage']
-                else:
-                    # Update minimum voltage during interruption
-                    min_voltage = min(min_voltage, reading['voltage'])
-            else:
-                # End of interruption
-                if in_interruption:
-                    in_interruption = False
-                    interruption_end = reading['timestamp']
-                    
-                    # Calculate duration
-                    start_time = datetime.fromisoformat(interruption_start.replace('Z', '+00:00'))
-                    end_time = datetime.fromisoformat(interruption_end.replace('Z', '+00:00'))
-                    duration_sec = (end_time - start_time).total_seconds()
-                    
-                    # Only record if duration exceeds minimum threshold
-                    if duration_sec >= min_duration_sec:
-                        # Determine severity
-                        severity = 'critical' if min_voltage < 100 else 'major' if min_voltage < 150 else 'minor'
-                        
-                        interruptions.append({
-                            'start': interruption_start,
-                            'end': interruption_end,
-                            'duration_sec': duration_sec,
-                            'duration_readable': self.format_duration(duration_sec),
-                            'min_voltage': round(min_voltage, 1),
-                            'severity': severity,
-                            'ongoing': False
-                        })
-        
-        # Handle case where we're still in an interruption at the end of the data
-        if in_interruption and interruption_start:
-            # Use last reading as end point
-            interruption_end = sorted_readings[-1]['timestamp']
-            
-            # Calculate duration
-            start_time = datetime.fromisoformat(interruption_start.replace('Z', '+00:00'))
-            end_time = datetime.fromisoformat(interruption_end.replace('Z', '+00:00'))
-            duration_sec = (end_time - start_time).total_seconds()
-            
-            if duration_sec >= min_duration_sec:
-                # Determine severity
-                severity = 'critical' if min_voltage < 100 else 'major' if min_voltage < 150 else 'minor'
-                
-                interruptions.append({
-                    'start': interruption_start,
-                    'end': interruption_end,
-                    'duration_sec': duration_sec,
-                    'duration_readable': self.format_duration(duration_sec),
-                    'min_voltage': round(min_voltage, 1),
-                    'severity': severity,
-                    'ongoing': True
-                })
+        Runs below the voltage threshold are found per day (cached per node-day)
+        and joined across midnight.
+        """
+        if columns is None:
+            return {'count': 0, 'total_duration_sec': 0, 'avg_duration_min': 0, 'details': []}
         
-        # Calculate summary metrics
-        count = len(interruptions)
-        total_duration_sec = sum(i['duration_sec'] for i in interruptions)
-        avg_duration_min = round(total_duration_sec / count / 60, 1) if count > 0 else 0
-        
-        return {
-            'count': count,
-            'total_duration_sec': total_duration_sec,
-            'avg_duration_min': avg_duration_min,
-            'details': interruptions
-        }
+        return self.add_readable_durations(interruption_service.detect(node, days, columns))
+    
+    def add_readable_durations(self, interruptions):
+        """Add duration_readable to every interruption"""
+        for detail in interruptions['details']:
+            detail['duration_readable'] = self.format_duration(detail['duration_sec'])
+        return interruptions
     
-    def generate_anomaly_summary(self, readings):
+    def generate_anomaly_summary(self, readings, events=None):
         """Generate summary of anomalies"""
         if not readings:
             return {
@@ -913,7 +999,8 @@ class DashboardDataView(APIView):
                     'frequency': 0,
                     'power_factor': 0
                 },
-                'total_readings': 0
+                'total_readings': 0,
+                'event_count': len(events or [])
             }
         
         # Count anomalies
@@ -936,8 +1023,17 @@ class DashboardDataView(APIView):
                 if param in parameter_counts:
                     parameter_counts[param] += 1
         
+        # Count events per parameter
+        event_counts = {param: 0 for param in parameter_counts}
+        for event in events or []:
+            if event['parameter'] in event_counts:
+                event_counts[event['parameter']] += 1
+        
+        return self.summarize_anomaly_counts(anomaly_count, len(readings), parameter_counts, event_counts)
+    
+    def summarize_anomaly_counts(self, anomaly_count, total_readings, parameter_counts, event_counts):
+        """Build the anomaly summary from anomaly, reading and event counts"""
         # Calculate percentage of anomalies
-        total_readings = len(readings)
         percentage = (anomaly_count / total_readings * 100) if total_readings > 0 else 0
         
         # Determine severity level
@@ -955,7 +1051,9 @@ class DashboardDataView(APIView):
             'percentage': round(percentage, 2),
             'parameter_counts': parameter_counts,
             'severity_level': severity,
-            'total_readings': total_readings
+            'total_readings': total_readings,
+            'event_count': sum(event_counts.values()),
+            'event_counts': event_counts
         }
     
     def prepare_graph_data(self, readings):
@@ -1030,6 +1128,87 @@ class DashboardDataView(APIView):
         
         return f"{int(days)} days {int(remaining_hours)} hr"
 
+class AnomalyEventsView(APIView):
+    """View for fetching aggregated anomaly events instead of raw anomalous readings"""
+    
+    def get(self, request):
+        """Get anomaly events for a node and date range"""
+        try:
+            node = request.query_params.get('node')
+            start_date = request.query_params.get('start_date')
+            end_date = request.query_params.get('end_date')
+            parameter = request.query_params.get('parameter')
+            
+            if not node or not start_date or not end_date:
+                return Response(
+                    {"error": "Node, start_date, and end_date parameters are required"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+            except ValueError:
+                return Response(
+                    {"error": "Invalid date format. Use YYYY-MM-DD."}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if parameter:
+                try:
+                    parameter = chart_parameter(parameter)
+                except ValueError as e:
+                    return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            firebase_service = FirebaseService()
+            today = datetime.now().date()
+            ml_classifier = None
+            
+            events = []
+            current_date = start_date_obj
+            while current_date <= end_date_obj:
+                year = str(current_date.year)
+                month = str(current_date.month).zfill(2)
+                day = str(current_date.day).zfill(2)
+                closed = current_date.date() < today
+                current_date += timedelta(days=1)
+                
+                # Cached events of closed days skip fetching, detection and classification entirely;
+                # the current day is still growing, so its events are checked against its readings
+                day_readings = None if closed else firebase_service.get_day_data(node, year, month, day, use_cache=True)
+                day_events = anomaly_event_service.get_cached_day_events(node, year, month, day, day_readings)
+                if day_events is None:
+                    ml_classifier = ml_classifier or model_registry.get_classifier()
+                    if day_readings is None:
+                        day_readings = firebase_service.get_day_data(node, year, month, day, use_cache=True)
+                    detected_readings = anomaly_detector.detect_anomalies(day_readings)
+                    classification_store.apply(detected_readings, classifier=ml_classifier)
+                    explanation_precomputer.enqueue(detected_readings, anomaly_detector.thresholds)
+                    day_events = anomaly_event_service.get_day_events(node, year, month, day, detected_readings)
+                events.extend(day_events)
+            
+            events = anomaly_event_service.merge_adjacent(events)
+            if parameter:
+                events = [e for e in events if e['parameter'] == parameter]
+            
+            return Response({
+                "node": node,
+                "start_date": start_date,
+                "end_date": end_date,
+                "count": len(events),
+                "events": events
+            })
+            
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return Response(
+                {"error": f"Failed to fetch anomaly events: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 # Example for user registration view
 # Add these classes to your existing views.py file
 # Make sure you keep all your existing code and add these classes at the end
@@ -1291,11 +1470,15 @@ class ClassifyReadingsView(APIView):
     
     def post(self, request):
         try:
-            readings = request.data.get('readings', [])
+            # Readings are either uploaded or referenced by reading_ids / node + date range
+            try:
+                readings, missing_ids = resolve_request_readings(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             if not readings:
                 return Response(
-                    {"error": "No readings provided"}, 
+                    {"error": "No readings provided", "missing_ids": missing_ids}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
@@ -1305,20 +1488,55 @@ class ClassifyReadingsView(APIView):
             anomaly_readings = [r for r in readings if r.get('is_anomaly', False)]
             
             if not anomaly_readings:
-                return Response({"classifications": {}})
+                return Response({
+                    "classifications": {},
+                    "model_version": model_registry.get_version(),
+                    "missing_ids": missing_ids
+                })
             
-            # Classify the readings
-            classified_readings = ml_classifier.classify_batch(anomaly_readings)
+            # Optional confidence and top-k anomaly types from the same predict_proba pass
+            try:
+                top_k = int_param(request.data.get('top_k'), 'top_k', default=0, minimum=0)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            ml_classifier = model_registry.get_classifier()
+            # Uploaded readings may be stale or edited, so only server-side readings use the shared store
+            uploaded = bool(request.data.get('readings'))
+            if uploaded:
+                ml_classifier.classify_batch(anomaly_readings, top_k=top_k)
+            elif top_k > 0:
+                # Stored labels carry no probabilities, so every anomaly goes to the model
+                ml_classifier.classify_batch(anomaly_readings, top_k=top_k)
+                classification_store.record(anomaly_readings, ml_classifier.model_version)
+            else:
+                # Reuse stored labels and classify only readings the model has not seen yet
+                classification_store.apply(anomaly_readings, classifier=ml_classifier)
             
             # Return only the classifications to reduce response size
             classifications = {}
-            for reading in classified_readings:
+            confidences = {}
+            for reading in anomaly_readings:
                 if 'id' in reading and 'anomaly_type' in reading:
                     classifications[reading['id']] = reading['anomaly_type']
+                    if 'confidence' in reading:
+                        confidences[reading['id']] = {
+                            "confidence": reading['confidence'],
+                            "top_types": reading['top_types']
+                        }
             
             # print(f"ClassifyReadingsView: Successfully classified {len(classifications)} readings")
-            return Response({"classifications": classifications})
+            response_data = {
+                "classifications": classifications,
+                "model_version": ml_classifier.model_version,
+                "missing_ids": missing_ids
+            }
+            if top_k > 0:
+                response_data["confidences"] = confidences
+            return Response(response_data)
             
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -1333,8 +1551,27 @@ class ExplainAnomalyView(APIView):
     def post(self, request):
         """Generate SHAP explanation for a specific reading."""
         try:
-            # Get the reading from the request
-            reading_data = request.data.get('reading', {})
+            # One reading per request; several go to explain-anomalies
+            reading_ids = request.data.get('reading_ids')
+            if not request.data.get('reading') and not request.data.get('reading_id') and (
+                    request.data.get('node') or (isinstance(reading_ids, list) and len(reading_ids) > 1)):
+                return Response(
+                    {"error": "Reference a single reading with reading_id; use explain-anomalies for several readings"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Get the reading from the request, uploaded or referenced by reading_id
+            try:
+                readings, missing_ids = resolve_request_readings(request, key='reading')
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            if missing_ids:
+                return Response(
+                    {"error": f"Reading not found: {missing_ids[0]}"}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            reading_data = readings[0] if isinstance(readings, list) and readings else readings
             
             if not reading_data:
                 return Response(
@@ -1349,17 +1586,33 @@ class ExplainAnomalyView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
+            # Click-to-explain uses exact TreeSHAP unless the deployment opts into the approximation
+            try:
+                mode, max_trees = explanation_options(
+                    request,
+                    default_mode=getattr(settings, 'ML_INTERACTIVE_EXPLAIN_MODE', 'exact'),
+                    default_max_trees=getattr(settings, 'ML_INTERACTIVE_EXPLAIN_MAX_TREES', None)
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
             # Try using SHAP service if available
             try:
-                # Initialize the SHAP explainer if not already done
-                if 'shap_explainer' not in globals():
-                    global shap_explainer
-                    shap_explainer = ShapExplainerService()
+                # Get the SHAP explainer (raises ModelNotReady while it loads)
+                shap_explainer = model_registry.get_explainer()
                 
-                # Generate SHAP explanation
-                explanation = shap_explainer.explain_reading(reading_data)
+                # Serve the exact explanation if it was precomputed, unless a mode was requested
+                started = time.perf_counter()
+                explanation = None
+                if 'mode' not in request.data and 'max_trees' not in request.data:
+                    explanation = shap_explainer.cached_explanation(reading_data)
+                if explanation is not None:
+                    explanation["precomputed"] = True
+                else:
+                    explanation = shap_explainer.explain_reading(reading_data, mode=mode, max_trees=max_trees)
                 
                 if explanation is not None:
+                    explanation["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
                     return Response(explanation)
                 else:
                     # Return error if explanation is None
@@ -1367,6 +1620,8 @@ class ExplainAnomalyView(APIView):
                         {"error": "Failed to generate explanation: result was None"}, 
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR
                     )
+            except ModelNotReady as e:
+                return model_not_ready_response(e)
             except Exception as e:
                 # Return an error response here instead of just logging
                 import traceback
@@ -1387,25 +1642,96 @@ class ExplainAnomalyView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
             
+class ExplainAnomaliesView(APIView):
+    """API endpoint for generating SHAP explanations for many anomalies in one call."""
+    
+    def post(self, request):
+        """Generate SHAP explanations for uploaded or referenced readings."""
+        try:
+            try:
+                readings, missing_ids = resolve_request_readings(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            if not readings:
+                return Response(
+                    {"error": "No readings provided for explanation", "missing_ids": missing_ids}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            max_readings = getattr(settings, 'ML_EXPLAIN_BATCH_MAX', 200)
+            if len(readings) > max_readings:
+                return Response(
+                    {"error": f"At most {max_readings} readings can be explained per request, submit an 'explain' job for more"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                mode, max_trees = explanation_options(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Batched feature matrices, shap_values and predict calls for all anomalies
+            shap_explainer = model_registry.get_explainer()
+            started = time.perf_counter()
+            explanations = explanation_entries(shap_explainer, readings, mode=mode, max_trees=max_trees)
+            return Response({
+                "explanations": explanations,
+                "explanation_mode": mode,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+                "model_version": shap_explainer.classifier.model_version,
+                "missing_ids": missing_ids
+            })
+            
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return Response(
+                {"error": f"Failed to generate explanations: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 # Add this new class
 class GlobalFeatureImportanceView(APIView):
     """API endpoint for generating global feature importance analysis."""
     def post(self, request):
         try:
-            # Get readings from request
-            readings = request.data.get('readings', [])
+            # Long ranges and big uploads can run as a background job polled via ml/jobs/<job_id>/
+            data = request.data
+            
+            # Sample size and sampling seed (optional), checked before a job is queued
+            try:
+                sample_size = int_param(data.get('sample_size'), 'sample_size', default=500, minimum=1)
+                seed = int_param(data.get('seed'), 'seed', default=0, minimum=0, maximum=2 ** 32 - 1)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            if str(data.get('async', 'false')).lower() == 'true':
+                params = {key: value for key, value in data.items() if key != 'async'}
+                return submit_job_response('global_importance', params)
+            
+            # Nodes and a date range are answered by merging per node-day importance aggregates
+            if not data.get('readings') and not data.get('reading_ids') and (data.get('node') or data.get('nodes')):
+                return self.aggregate_importance(data)
+            
+            # Get readings from request, uploaded or referenced by reading_ids
+            try:
+                readings, missing_ids = resolve_request_readings(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
             if not readings:
                 return Response(
                     {"error": "No readings provided"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get sample size parameter (optional)
-            sample_size = int(request.data.get('sample_size', 500))
-            
             # Generate global feature importance
+            shap_explainer = model_registry.get_explainer()
             global_importance = shap_explainer.generate_global_feature_importance(
-                readings, sample_size=sample_size
+                readings, sample_size=sample_size, seed=seed
             )
             
             if not global_importance:
@@ -1416,12 +1742,182 @@ class GlobalFeatureImportanceView(APIView):
                 
             return Response(global_importance, status=status.HTTP_200_OK)
             
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
         except Exception as e:
             print(f"Error in GlobalFeatureImportanceView: {str(e)}")
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    def aggregate_importance(self, data):
+        """Merge the feature importance aggregates of one or more nodes over a date range"""
+        nodes = data.get('nodes') or [data.get('node')]
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        if not start_date or not end_date:
+            return Response(
+                {"error": "start_date and end_date are required with node"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        shap_explainer = model_registry.get_explainer()
+        importance_service = FeatureImportanceService(ReadingResolver(anomaly_detector=anomaly_detector))
+        try:
+            global_importance = importance_service.get_importance(nodes, start_date, end_date, shap_explainer)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not global_importance:
+            return Response(
+                {"error": "No anomalies found for the selected nodes and dates"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(global_importance, status=status.HTTP_200_OK)
+
+class ExplanationModeComparisonView(APIView):
+    """API endpoint measuring an approximate explanation mode against exact TreeSHAP"""
+    
+    def post(self, request):
+        """Compare speed and attributions of a mode/tree budget with exact SHAP on the given anomalies"""
+        try:
+            try:
+                readings, missing_ids = resolve_request_readings(request)
+                mode, max_trees = explanation_options(request, default_mode='approximate')
+                top_k = int_param(request.data.get('top_k'), 'top_k', default=3, minimum=1)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            anomalies = [r for r in readings if r.get('is_anomaly', False)]
+            max_readings = getattr(settings, 'ML_EXPLAIN_BATCH_MAX', 200)
+            if not anomalies or len(anomalies) > max_readings:
+                return Response(
+                    {"error": f"Provide between 1 and {max_readings} anomalous readings", "missing_ids": missing_ids},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            shap_explainer = model_registry.get_explainer()
+            comparison = shap_explainer.compare_modes(
+                anomalies, mode=mode, max_trees=max_trees, top_k=top_k
+            )
+            if comparison is None:
+                return Response(
+                    {"error": "Readings are missing required features"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(comparison)
+            
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
+        except Exception as e:
+            return Response(
+                {"error": f"Failed to compare explanation modes: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class ModelStatsView(APIView):
+    """View for retrieving ML service statistics"""
+    
+    def get(self, request):
+        """Get model loading state, inference engine and classification/explanation cache statistics"""
+        try:
+            stats = {"model_status": model_registry.status()}
+            
+            # Report classifier statistics without forcing the model to load
+            if model_registry.is_ready('classifier'):
+                ml_classifier = model_registry.get_classifier()
+                stats["inference_engine"] = ml_classifier.engine
+                stats["classification_memo"] = ml_classifier.get_memo_stats()
+                if ml_classifier.batcher is not None:
+                    stats["micro_batching"] = ml_classifier.batcher.get_stats()
+            stats["classification_store"] = classification_store.get_stats()
+            stats["jobs"] = job_queue.get_stats()
+            stats["explanation_precompute"] = explanation_precomputer.get_stats()
+            if model_registry.is_ready('explainer'):
+                stats["explanation_cache"] = model_registry.get_explainer().explanation_cache.get_stats()
+            
+            return Response(stats)
+        except Exception as e:
+            return Response(
+                {"error": f"Failed to get model stats: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class ModelReloadView(APIView):
+    """Admin view for rolling out a new model file without restarting the server"""
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request):
+        """Load the model file in the background and swap it in once it is validated"""
+        try:
+            force = str(request.data.get('force', 'false')).lower() == 'true'
+            started = model_registry.reload(background=True, force=force)
+            
+            return Response(
+                {
+                    "reload_started": started,
+                    "model_status": model_registry.status()
+                },
+                status=status.HTTP_202_ACCEPTED if started else status.HTTP_200_OK
+            )
+        except Exception as e:
+            return Response(
+                {"error": f"Failed to reload model: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class AnalyticsJobsView(APIView):
+    """API endpoint for submitting long-running analytics as background jobs"""
+    
+    def post(self, request):
+        """Queue a job: {"kind": "global_importance" | "explain" | "classify", ...parameters}"""
+        try:
+            params = {key: value for key, value in request.data.items() if key != 'kind'}
+            kind = request.data.get('kind')
+            if not kind:
+                return Response({"error": "kind is required"}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                return submit_job_response(kind, params)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {"error": f"Failed to submit job: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class AnalyticsJobView(APIView):
+    """API endpoint for polling the state and progress of a background job"""
+    
+    def get(self, request, job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return Response({"error": "Job not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.to_dict())
+
+class AnalyticsJobResultView(APIView):
+    """API endpoint for fetching the result of a finished background job"""
+    
+    def get(self, request, job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return Response({"error": "Job not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        if job.state != 'succeeded':
+            return Response(
+                {"error": f"Job has no result ({job.state})", **job.to_dict()},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(job.result)
+
+class AnalyticsJobCancelView(APIView):
+    """API endpoint for cancelling a queued or running background job"""
+    
+    def post(self, request, job_id):
+        job = job_queue.cancel(job_id)
+        if job is None:
+            return Response({"error": "Job not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.to_dict())
 
 class TestMLClassifierView(APIView):
     """Test ML classifier functionality"""
@@ -1502,6 +1998,7 @@ class TestMLClassifierView(APIView):
             })
             
             # Apply classifier
+            ml_classifier = model_registry.get_classifier()
             classified_readings = ml_classifier.classify_batch(test_readings)
             
             return Response({
@@ -1512,6 +2009,8 @@ class TestMLClassifierView(APIView):
                 'classified_readings': classified_readings
             })
             
+        except ModelNotReady as e:
+            return model_not_ready_response(e)
         except Exception as e:
             import traceback
             return Response(